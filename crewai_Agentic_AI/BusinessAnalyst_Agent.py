@@ -178,8 +178,9 @@ from crewai import LLM, Agent, Crew, Process, Task
 from dotenv import load_dotenv
 from datetime import datetime
 from typing import Union, List
-from crewai_tools import MCPServerAdapter
 from mcp import StdioServerParameters
+from mcp_pool import MCP_POOL
+from crew_runtime import MULTIMODAL_CONTENT_TYPES, CrewCancelledError
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -206,15 +207,7 @@ server_params_list = [
 class BusinessAnalystAgent:
     """Multimodal Agent that performs requirement gathering and BRD/User Story generation."""
 
-    SUPPORTED_CONTENT_TYPES = [
-        "text/plain",
-        "application/pdf",
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "image/jpeg",
-        "image/png",
-        "audio/wav",
-        "audio/mp3",
-    ]
+    SUPPORTED_CONTENT_TYPES = MULTIMODAL_CONTENT_TYPES
 
     def __init__(self):
        
@@ -226,8 +219,8 @@ class BusinessAnalystAgent:
             raise ValueError("Neither GEMINI_API_KEY nor OPENAI_API_KEY environment variable is set.")
 
        
-        self.tools_adapter = MCPServerAdapter(server_params_list)
-        self.tools = self.tools_adapter.__enter__()
+        # Tool servers are shared with every other agent in this process.
+        self.tools = MCP_POOL.acquire(server_params_list)
         logger.info(f"[BusinessAnalystAgent] Available MCP tools: {[tool.name for tool in self.tools]}")
 
      
@@ -257,7 +250,13 @@ class BusinessAnalystAgent:
             tools=self.tools,
         )
 
-    async def invoke(self, stakeholder_inputs: Union[str, List[str]]) -> str:
+    def close(self):
+        """Release this agent's hold on the shared tool servers."""
+        if self.tools is not None:
+            MCP_POOL.release(server_params_list)
+            self.tools = None
+
+    async def invoke(self, stakeholder_inputs: Union[str, List[str]], step_callback=None, task_callback=None) -> str:
         logger.info(f"[BusinessAnalystAgent] Starting requirements analysis...")
         current_date = datetime.now().strftime("%Y-%m-%d")
 
@@ -342,12 +341,16 @@ class BusinessAnalystAgent:
             tasks=[business_analysis_task],
             process=Process.sequential,
             verbose=True,
+            step_callback=step_callback,
+            task_callback=task_callback,
         )
 
         try:
             result = await crew.kickoff_async(inputs={"stakeholder_inputs": stakeholder_inputs})
             logger.info(f"[BusinessAnalystAgent] Crew final response: {result}")
             return str(result)
+        except CrewCancelledError:
+            raise
         except Exception as e:
             logger.error(f"[BusinessAnalystAgent] Crew execution failed: {e}")
-            return "Sorry, I couldn't generate the Business Requirements Document at this moment."
+            raise
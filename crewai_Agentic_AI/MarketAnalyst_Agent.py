@@ -4,8 +4,9 @@ from crewai import LLM, Agent, Crew, Process, Task
 from dotenv import load_dotenv
 from datetime import datetime
 from typing import Union, List
-from crewai_tools import MCPServerAdapter
 from mcp import StdioServerParameters
+from mcp_pool import MCP_POOL
+from crew_runtime import CrewCancelledError
 
 server_params_list = [
     StdioServerParameters(
@@ -54,7 +55,25 @@ class MarketAnalystAgent:
             llm=self.llm,
         )
 
-    async def invoke(self, stakeholder_input: Union[str, List[str]]) -> str:
+        # Keep the search server warm for the agent's lifetime instead of spawning it per request.
+        self.tools = None
+        try:
+            self._get_tools()
+        except Exception as e:
+            logger.warning(f"[MarketAnalystAgent] Search tools unavailable, will retry on first request: {e}")
+
+    def _get_tools(self):
+        if self.tools is None:
+            self.tools = MCP_POOL.acquire(server_params_list)
+            logger.info(f"[MarketAnalystAgent] Available MCP tools: {[tool.name for tool in self.tools]}")
+        return self.tools
+
+    def close(self):
+        if self.tools is not None:
+            MCP_POOL.release(server_params_list)
+            self.tools = None
+
+    async def invoke(self, stakeholder_input: Union[str, List[str]], step_callback=None, task_callback=None) -> str:
         """
         Run the market analysis task using the stakeholder input provided.
         """
@@ -62,15 +81,11 @@ class MarketAnalystAgent:
 
         current_date = datetime.now().strftime("%Y-%m-%d")
 
-
-        # with MCPServerAdapter(server_params_list) as tools:
-        #             print(f"Available MCP tools: {[tool.name for tool in tools]}")
-
-        
-
-        with MCPServerAdapter(server_params_list) as tools:
-        
-          logger.info(f"Available MCP tools: {[tool.name for tool in tools]}")
+        try:
+            tools = self._get_tools()
+        except Exception as e:
+            logger.error(f"[MarketAnalystAgent] Could not start search tools: {e}")
+            raise
 
         market_analysis_task = Task(
             description=(
@@ -102,14 +117,18 @@ class MarketAnalystAgent:
             tasks=[market_analysis_task],
             process=Process.sequential,
             verbose=True,
+            step_callback=step_callback,
+            task_callback=task_callback,
         )
 
         try:
             result = await crew.kickoff_async(inputs={"stakeholder_input": stakeholder_input})
             logger.info(f"[MarketAnalystAgent] Crew final response: {result}")
             return str(result)
+        except CrewCancelledError:
+            raise
         except Exception as e:
             logger.error(f"[MarketAnalystAgent] Crew execution failed: {e}")
-            return "Sorry, I couldn't generate the Market Analysis Report at this moment. Please try again later."
+            raise
 
     
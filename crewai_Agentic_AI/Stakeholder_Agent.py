@@ -3,11 +3,12 @@ import logging
 from crewai import LLM, Agent, Crew, Process, Task
 from dotenv import load_dotenv
 from datetime import datetime
-from crewai_tools import MCPServerAdapter
 from mcp import StdioServerParameters
+from mcp_pool import MCP_POOL
 from crewai.memory import LongTermMemory, ShortTermMemory
 from crewai.memory.storage.ltm_sqlite_storage import LTMSQLiteStorage
 from crewai.memory.storage.rag_storage import RAGStorage
+from crew_runtime import MULTIMODAL_CONTENT_TYPES, CrewCancelledError
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -27,30 +28,10 @@ server_params_list = [
 ]
 
 
-long_term_memory = LongTermMemory(
-    storage=LTMSQLiteStorage(db_path="./memory/long_term_memory.db")
-)
-
-short_term_memory = ShortTermMemory(
-    storage=RAGStorage(
-        embedder_config={
-            "provider": "ollama",
-            "config": {"model": "mxbai-embed-large"}
-        },
-        type="short_term",
-        path="./memory/"
-    )
-)
-
-
 class StakeholderAgent:
     """Agent that handles stakeholder requirements analysis and BRD generation."""
 
-    SUPPORTED_CONTENT_TYPES = [
-        "text/plain", "application/pdf",
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "image/jpeg", "image/png", "audio/wav", "audio/mp3"
-    ]
+    SUPPORTED_CONTENT_TYPES = MULTIMODAL_CONTENT_TYPES
 
     def __init__(self):
        
@@ -64,8 +45,24 @@ class StakeholderAgent:
             raise ValueError("GEMINI_API_KEY environment variable not set.")
 
        
-        self.tools_adapter = MCPServerAdapter(server_params_list)
-        self.tools = self.tools_adapter.__enter__()  
+        # Memory storage is opened with the agent rather than at import time, so importing this
+        # module stays cheap.
+        self.long_term_memory = LongTermMemory(
+            storage=LTMSQLiteStorage(db_path="./memory/long_term_memory.db")
+        )
+        self.short_term_memory = ShortTermMemory(
+            storage=RAGStorage(
+                embedder_config={
+                    "provider": "ollama",
+                    "config": {"model": "mxbai-embed-large"}
+                },
+                type="short_term",
+                path="./memory/"
+            )
+        )
+
+        # Tool servers are shared with every other agent in this process.
+        self.tools = MCP_POOL.acquire(server_params_list)
 
         logger.info(f"[StakeholderAgent] Available MCP tools: {[tool.name for tool in self.tools]}")
 
@@ -102,7 +99,13 @@ class StakeholderAgent:
             tools=self.tools,
         )
 
-    async def invoke(self, stakeholder_inputs: str) -> str:
+    def close(self):
+        """Release this agent's hold on the shared tool servers."""
+        if self.tools is not None:
+            MCP_POOL.release(server_params_list)
+            self.tools = None
+
+    async def invoke(self, stakeholder_inputs: str, step_callback=None, task_callback=None) -> str:
         """Run the workflow to generate a High-Level Vision Document."""
         logger.info(f"[StakeholderAgent] Starting BRD generation workflow for inputs: {stakeholder_inputs[:100]}...")
         current_date = datetime.now().strftime("%Y-%m-%d")
@@ -163,21 +166,25 @@ class StakeholderAgent:
             agents=[self.stakeholder_agent],
             tasks=[high_level_vision_task],
             memory=True,
-            long_term_memory=long_term_memory,
-            short_term_memory=short_term_memory,
+            long_term_memory=self.long_term_memory,
+            short_term_memory=self.short_term_memory,
             planning=True,
             planning_llm=self.llm,
             process=Process.sequential,
             verbose=True,
+            step_callback=step_callback,
+            task_callback=task_callback,
         )
 
         try:
             result = await crew.kickoff_async(inputs={"stakeholder_inputs": stakeholder_inputs})
             logger.info(f"[StakeholderAgent] Crew final response: {result}")
             return str(result)
+        except CrewCancelledError:
+            raise
         except Exception as e:
             logger.error(f"[StakeholderAgent] Crew execution failed: {e}")
-            return "Sorry, I couldn't generate the Business Requirements Document at this moment."
+            raise
 
 
 # stakeholder_agent_wrapper = StakeholderAgent()
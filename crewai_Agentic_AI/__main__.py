@@ -1,45 +1,55 @@
 import logging
 import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import multiprocessing
 import uvicorn
 import asyncio
 from dotenv import load_dotenv
 
 from a2a.server.apps import A2AStarletteApplication
 from a2a.server.request_handlers import DefaultRequestHandler
-from a2a.server.tasks import InMemoryTaskStore
 from a2a.types import AgentCapabilities, AgentCard, AgentSkill
+from starlette.requests import Request
+from starlette.responses import JSONResponse
 
-from Stakeholder_Agent import StakeholderAgent
-from BusinessAnalyst_Agent import BusinessAnalystAgent
-from business_analyst_domain_expert import BusinessAnalystDomainExpert
-from MarketAnalyst_Agent import MarketAnalystAgent
-from product_manager import ProductManagerAgent
-from agile_project_manager import AgileProjectManagerAgent
+from task_store import create_task_store
+from agent_executor import CrewAgentExecutor
+from crew_runtime import MULTIMODAL_CONTENT_TYPES, TEXT_CONTENT_TYPES, record_startup, runtime_stats, startup_profile
 
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
+class MissingAPIKeyError(Exception):
+    """Exception for missing API key."""
 
 
+async def metrics_endpoint(request: Request) -> JSONResponse:
+    """Queue length, service time and pool metrics of the agents hosted by this process."""
+    # mcp_pool imports crewai, so it is only loaded once an agent with MCP tools has been built.
+    mcp_pool = sys.modules.get("mcp_pool")
+    return JSONResponse({"pid": os.getpid(), "agents": runtime_stats(), "startup": startup_profile(),
+                         "mcp_servers": mcp_pool.MCP_POOL.stats() if mcp_pool else {}})
 
 
-from agent_executor import (
-    StakeholderAgentExecutor,
-    BusinessAnalystAgentExecutor,
-    DomainExpertAgentExecutor,
-    MarketAnalystAgentExecutor,
-    ProductManagerAgentExecutor,
-    AgileProjectManagerAgentExecutor,
-)
+def build_app(a2a_app: A2AStarletteApplication):
+    app = a2a_app.build()
+    app.add_route("/metrics", metrics_endpoint, methods=["GET"])
+    return app
 
-load_dotenv()
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
-class MissingAPIKeyError(Exception):
-    """Exception for missing API key."""
+async def close_agents(*a2a_apps: A2AStarletteApplication):
+    """Tear down the apps' agents after their servers stopped, releasing their pooled MCP servers."""
+    for a2a_app in a2a_apps:
+        await a2a_app.handler.request_handler.agent_executor.close()
 
 
 def create_stakeholder_app(host: str, port: int):
-    capabilities = AgentCapabilities(streaming=False)
+    capabilities = AgentCapabilities(streaming=True)
     skill = AgentSkill(
         id="stakeholder_requirements_analyst",
         name="Stakeholder Requirements Analyst",
@@ -65,17 +75,17 @@ def create_stakeholder_app(host: str, port: int):
         description="Processes multimodal stakeholder inputs (text, docs, images, audio) into audit-ready project vision document.",
         url=f"http://{host}:{port}/",
         version="1.0.0",
-        defaultInputModes=StakeholderAgent.SUPPORTED_CONTENT_TYPES,
+        defaultInputModes=MULTIMODAL_CONTENT_TYPES,
         defaultOutputModes=["text/markdown"],
         capabilities=capabilities,
         skills=[skill],
     )
-    handler = DefaultRequestHandler(agent_executor=StakeholderAgentExecutor(), task_store=InMemoryTaskStore())
+    handler = DefaultRequestHandler(agent_executor=CrewAgentExecutor("stakeholder"), task_store=create_task_store("stakeholder"))
     return A2AStarletteApplication(agent_card=agent_card, http_handler=handler)
 
 
 def create_business_app(host: str, port: int):
-    capabilities = AgentCapabilities(streaming=False)
+    capabilities = AgentCapabilities(streaming=True)
     skill = AgentSkill(
         id="business_analyst_general",
         name="Business Analyst (General)",
@@ -92,17 +102,17 @@ def create_business_app(host: str, port: int):
         description="Translates business needs into actionable BRDs and User Stories with clear objectives and acceptance criteria.",
         url=f"http://{host}:{port}/",
         version="1.0.0",
-        defaultInputModes=BusinessAnalystAgent.SUPPORTED_CONTENT_TYPES,
+        defaultInputModes=MULTIMODAL_CONTENT_TYPES,
         defaultOutputModes=["text/markdown"],
         capabilities=capabilities,
         skills=[skill],
     )
-    handler = DefaultRequestHandler(agent_executor=BusinessAnalystAgentExecutor(), task_store=InMemoryTaskStore())
+    handler = DefaultRequestHandler(agent_executor=CrewAgentExecutor("business_analyst"), task_store=create_task_store("business_analyst"))
     return A2AStarletteApplication(agent_card=agent_card, http_handler=handler)
 
 
 def create_domain_expert_app(host: str, port: int):
-    capabilities = AgentCapabilities(streaming=False)
+    capabilities = AgentCapabilities(streaming=True)
     skill = AgentSkill(
         id="business_analyst_domain_expert",
         name="Business Analyst (Domain Expert)",
@@ -119,18 +129,18 @@ def create_domain_expert_app(host: str, port: int):
         description="Ingests multimodal stakeholder inputs and produces traceable BRDs/User Stories aligned with domain standards.",
         url=f"http://{host}:{port}/",
         version="1.0.0",
-        defaultInputModes=BusinessAnalystDomainExpert.SUPPORTED_CONTENT_TYPES,
+        defaultInputModes=MULTIMODAL_CONTENT_TYPES,
         defaultOutputModes=["text/markdown"],
         capabilities=capabilities,
         skills=[skill],
     )
-    handler = DefaultRequestHandler(agent_executor=DomainExpertAgentExecutor(), task_store=InMemoryTaskStore())
+    handler = DefaultRequestHandler(agent_executor=CrewAgentExecutor("domain_expert"), task_store=create_task_store("domain_expert"))
     return A2AStarletteApplication(agent_card=agent_card, http_handler=handler)
 
 
 
 def create_market_app(host: str, port: int):
-    capabilities = AgentCapabilities(streaming=False)
+    capabilities = AgentCapabilities(streaming=True)
     skill = AgentSkill(
         id="market_analyst",
         name="Market Analyst",
@@ -148,16 +158,16 @@ def create_market_app(host: str, port: int):
         description="Transforms stakeholder input into actionable market research reports.",
         url=f"http://{host}:{port}/",
         version="1.0.0",
-        defaultInputModes=["text/plain"],  # adjust to multimodal if needed
+        defaultInputModes=TEXT_CONTENT_TYPES,  # adjust to multimodal if needed
         defaultOutputModes=["text/markdown"],
         capabilities=capabilities,
         skills=[skill],
     )
-    handler = DefaultRequestHandler(agent_executor=MarketAnalystAgentExecutor(), task_store=InMemoryTaskStore())
+    handler = DefaultRequestHandler(agent_executor=CrewAgentExecutor("market_analyst"), task_store=create_task_store("market_analyst"))
     return A2AStarletteApplication(agent_card=agent_card, http_handler=handler)
 
 def create_product_manager_app(host: str, port: int):
-    capabilities = AgentCapabilities(streaming=False)
+    capabilities = AgentCapabilities(streaming=True)
     skill = AgentSkill(
         id="product_manager",
         name="Product Manager",
@@ -174,17 +184,17 @@ def create_product_manager_app(host: str, port: int):
         description="Creates actionable product roadmaps with priorities, timelines, and success metrics.",
         url=f"http://{host}:{port}/",
         version="1.0.0",
-        defaultInputModes=ProductManagerAgent.SUPPORTED_CONTENT_TYPES,
+        defaultInputModes=TEXT_CONTENT_TYPES,
         defaultOutputModes=["text/markdown"],
         capabilities=capabilities,
         skills=[skill],
     )
-    handler = DefaultRequestHandler(agent_executor=ProductManagerAgentExecutor(), task_store=InMemoryTaskStore())
+    handler = DefaultRequestHandler(agent_executor=CrewAgentExecutor("product_manager"), task_store=create_task_store("product_manager"))
     return A2AStarletteApplication(agent_card=agent_card, http_handler=handler)
 
 
 def create_agile_pm_app(host: str, port: int):
-    capabilities = AgentCapabilities(streaming=False)
+    capabilities = AgentCapabilities(streaming=True)
     skill = AgentSkill(
         id="agile_pm",
         name="Agile Project Manager",
@@ -201,12 +211,12 @@ def create_agile_pm_app(host: str, port: int):
         description="Generates sprint plans with backlog items, estimates, goals, and risks for agile teams.",
         url=f"http://{host}:{port}/",
         version="1.0.0",
-        defaultInputModes=AgileProjectManagerAgent.SUPPORTED_CONTENT_TYPES,
+        defaultInputModes=TEXT_CONTENT_TYPES,
         defaultOutputModes=["text/markdown"],
         capabilities=capabilities,
         skills=[skill],
     )
-    handler = DefaultRequestHandler(agent_executor=AgileProjectManagerAgentExecutor(), task_store=InMemoryTaskStore())
+    handler = DefaultRequestHandler(agent_executor=CrewAgentExecutor("agile_pm"), task_store=create_task_store("agile_pm"))
     return A2AStarletteApplication(agent_card=agent_card, http_handler=handler)
 
 
@@ -216,7 +226,8 @@ async def main():
         if not os.getenv("GEMINI_API_KEY") and not os.getenv("OPENAI_API_KEY"):
             raise MissingAPIKeyError("Either GEMINI_API_KEY or OPENAI_API_KEY must be set in .env.")
 
-        # Build apps
+        # Build apps; agents themselves are built on first request (or pre-warmed in the background).
+        started = time.perf_counter()
         stakeholder_app = create_stakeholder_app(host, 10004)
         business_app = create_business_app(host, 10005)
         domain_expert_app = create_domain_expert_app(host, 10006)
@@ -225,12 +236,12 @@ async def main():
         agile_pm_app = create_agile_pm_app(host, 10009)
 
         # Configs
-        config1 = uvicorn.Config(stakeholder_app.build(), host=host, port=10004, log_level="info")
-        config2 = uvicorn.Config(business_app.build(), host=host, port=10005, log_level="info")
-        config3 = uvicorn.Config(domain_expert_app.build(), host=host, port=10006, log_level="info")
-        config4 = uvicorn.Config(market_app.build(), host=host, port=10007, log_level="info") 
-        config5 = uvicorn.Config(product_manager_app.build(), host=host, port=10008, log_level="info")
-        config6 = uvicorn.Config(agile_pm_app.build(), host=host, port=10009, log_level="info")
+        config1 = uvicorn.Config(build_app(stakeholder_app), host=host, port=10004, log_level="info")
+        config2 = uvicorn.Config(build_app(business_app), host=host, port=10005, log_level="info")
+        config3 = uvicorn.Config(build_app(domain_expert_app), host=host, port=10006, log_level="info")
+        config4 = uvicorn.Config(build_app(market_app), host=host, port=10007, log_level="info") 
+        config5 = uvicorn.Config(build_app(product_manager_app), host=host, port=10008, log_level="info")
+        config6 = uvicorn.Config(build_app(agile_pm_app), host=host, port=10009, log_level="info")
 
         # Servers
         server1 = uvicorn.Server(config1)
@@ -239,19 +250,24 @@ async def main():
         server4 = uvicorn.Server(config4)
         server5 = uvicorn.Server(config5)
         server6 = uvicorn.Server(config6)
+        logger.info(f"Agent apps ready in {time.perf_counter() - started:.3f}s")
 
         logger.info(
             "Starting Stakeholder (10004), Business Analyst (10005), Domain Expert (10006), Market Analyst (10007) "
             "Product Manager (10008), and Agile Project Manager (10009) ..."
         )
-        await asyncio.gather(
-            server1.serve(),
-            server2.serve(),
-            server3.serve(),
-            server4.serve(),
-            server5.serve(),
-            server6.serve(),
-        )
+        try:
+            await asyncio.gather(
+                server1.serve(),
+                server2.serve(),
+                server3.serve(),
+                server4.serve(),
+                server5.serve(),
+                server6.serve(),
+            )
+        finally:
+            await close_agents(stakeholder_app, business_app, domain_expert_app, market_app,
+                               product_manager_app, agile_pm_app)
 
     except MissingAPIKeyError as e:
         logger.error(f"Configuration error: {e}")
@@ -261,7 +277,244 @@ async def main():
         exit(1)
 
 
+# ------------------- Supervisor mode -------------------
+AGENT_APPS = {
+    "stakeholder": (create_stakeholder_app, 10004),
+    "business_analyst": (create_business_app, 10005),
+    "domain_expert": (create_domain_expert_app, 10006),
+    "market_analyst": (create_market_app, 10007),
+    "product_manager": (create_product_manager_app, 10008),
+    "agile_pm": (create_agile_pm_app, 10009),
+}
+
+# Agents whose Rag_tools MCP server writes the shared Chroma and SQLite stores under ./memory. Each
+# worker process starts its own server, so these must share one group served by a single worker.
+SINGLE_WRITER_AGENTS = ("stakeholder", "business_analyst")
+
+
+def _serve_group(group, sockets, host):
+    """Worker process entry point: serve every agent of the group on the sockets bound by the supervisor."""
+    logging.basicConfig(level=logging.INFO)
+
+    async def serve():
+        apps, servers = [], []
+        for name in group:
+            factory, port = AGENT_APPS[name]
+            started = time.perf_counter()
+            app = factory(host, port)
+            record_startup(name, "app", time.perf_counter() - started)
+            apps.append(app)
+            servers.append(uvicorn.Server(uvicorn.Config(build_app(app), log_level="info")).serve(sockets=[sockets[name]]))
+        try:
+            await asyncio.gather(*servers)
+        finally:
+            await close_agents(*apps)
+
+    asyncio.run(serve())
+
+
+def _read_proc_usage(pid: int):
+    """(rss_bytes, cpu_seconds) from /proc, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/status") as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    return rss_kb * 1024, cpu_seconds
+
+
+class Supervisor:
+    """Runs agent groups in worker processes that share listening sockets pre-bound by the parent.
+
+    Ports and agent cards are the same as in single-process mode. Workers share task state through
+    the SQLite task store, so any worker can answer tasks/get for a task another one ran. The
+    SINGLE_WRITER_AGENTS group is kept to one worker by parse_args. A tasks/cancel only stops a crew
+    running in the worker that receives it (see CrewAgentExecutor).
+
+    A crashed worker is restarted after restart_delay, doubled for every crash in a row up to
+    max_restart_delay; a worker that stayed up for stable_uptime seconds starts the count again.
+    """
+
+    def __init__(self, host: str, groups, workers, report_interval: float = 60.0, restart_delay: float = 1.0,
+                 max_restart_delay: float = 60.0, stable_uptime: float = 60.0):
+        self.host = host
+        self.groups = [tuple(group) for group in groups]
+        self.workers = workers
+        self.report_interval = report_interval
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stable_uptime = stable_uptime
+        self.ctx = multiprocessing.get_context("spawn")
+        self.sockets = {}
+        self.processes = {}
+        self.restarts = {}
+        self.started_at = {}
+        self.crash_streak = {}
+        self.restart_due = {}
+        self.cpu_seen = {}
+        self.stopping = False
+        self.rolling_restart = False
+
+    def bind(self):
+        for group in self.groups:
+            for name in group:
+                _, port = AGENT_APPS[name]
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                sock.bind((self.host, port))
+                sock.listen(2048)
+                self.sockets[name] = sock
+
+    def group_size(self, group) -> int:
+        return max(self.workers.get(name, 1) for name in group)
+
+    def spawn(self, group, index: int):
+        sockets = {name: self.sockets[name] for name in group}
+        process = self.ctx.Process(target=_serve_group, args=(group, sockets, self.host),
+                                   name=f"agents-{'+'.join(group)}-{index}", daemon=False)
+        process.start()
+        self.processes[(group, index)] = process
+        self.started_at[(group, index)] = time.monotonic()
+        logger.info(f"[Supervisor] Started {process.name} (pid {process.pid})")
+
+    def stop_process(self, process, timeout: float = 30.0):
+        process.terminate()  # SIGTERM lets uvicorn drain in-flight requests
+        process.join(timeout)
+        if process.is_alive():
+            logger.warning(f"[Supervisor] {process.name} did not exit in {timeout}s, killing it")
+            process.kill()
+            process.join()
+
+    def restart_all(self):
+        """Rolling restart: a replacement starts before the old worker stops, so the sockets always have a listener."""
+        for key, old in list(self.processes.items()):
+            self.spawn(*key)
+            self.stop_process(old)
+        logger.info("[Supervisor] Rolling restart finished")
+
+    def restart_crashed(self, key, process):
+        """Schedule a restart with exponential backoff the first time a crash is seen, then restart when due."""
+        now = time.monotonic()
+        if key not in self.restart_due:
+            uptime = now - self.started_at[key]
+            streak = 0 if uptime >= self.stable_uptime else min(self.crash_streak.get(key, 0) + 1, 16)
+            self.crash_streak[key] = streak
+            delay = min(self.restart_delay * 2 ** streak, self.max_restart_delay)
+            self.restart_due[key] = now + delay
+            logger.warning(f"[Supervisor] {process.name} exited with {process.exitcode} after {uptime:.1f}s, "
+                           f"restarting in {delay:.0f}s")
+        if now >= self.restart_due[key]:
+            del self.restart_due[key]
+            self.restarts[key] = self.restarts.get(key, 0) + 1
+            self.spawn(*key)
+
+    def report(self, interval: float):
+        cpu_seen = {}
+        for (group, index), process in self.processes.items():
+            usage = _read_proc_usage(process.pid)
+            if usage is None:
+                continue
+            rss, cpu_seconds = usage
+            previous = self.cpu_seen.get(process.pid, cpu_seconds)
+            cpu_seen[process.pid] = cpu_seconds
+            logger.info(f"[Supervisor] {process.name} pid={process.pid} rss={rss / 2 ** 20:.1f}MB "
+                        f"cpu={100 * (cpu_seconds - previous) / interval:.1f}% "
+                        f"restarts={self.restarts.get((group, index), 0)}")
+        self.cpu_seen = cpu_seen  # drops the pids of workers that exited or were replaced
+
+    def _handle_stop(self, signum, frame):
+        self.stopping = True
+
+    def _handle_reload(self, signum, frame):
+        self.rolling_restart = True
+
+    def run(self):
+        self.bind()
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        for group in self.groups:
+            for index in range(self.group_size(group)):
+                self.spawn(group, index)
+
+        last_report = time.monotonic()
+        while not self.stopping:
+            time.sleep(self.restart_delay)
+            if self.rolling_restart:
+                self.rolling_restart = False
+                self.restart_all()
+            for key, process in list(self.processes.items()):
+                if not process.is_alive() and not self.stopping:
+                    self.restart_crashed(key, process)
+            if time.monotonic() - last_report >= self.report_interval:
+                self.report(time.monotonic() - last_report)
+                last_report = time.monotonic()
+
+        logger.info("[Supervisor] Shutting down workers")
+        for process in self.processes.values():
+            self.stop_process(process)
+        for sock in self.sockets.values():
+            sock.close()
+
+
+def _parse_workers(value: str):
+    workers = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, count = item.partition("=")
+        workers[name] = int(count or 1)
+    return workers
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the crew agents over A2A.")
+    parser.add_argument("--supervise", action="store_true", default=os.getenv("AGENT_SUPERVISE") == "1",
+                        help="run agents in supervised worker processes")
+    default_groups = [",".join(SINGLE_WRITER_AGENTS)] + [name for name in AGENT_APPS if name not in SINGLE_WRITER_AGENTS]
+    parser.add_argument("--groups", default=os.getenv("AGENT_GROUPS", ";".join(default_groups)),
+                        help="';'-separated groups of ','-separated agents sharing a process, "
+                             "e.g. 'stakeholder,business_analyst;domain_expert,market_analyst,product_manager,agile_pm'; "
+                             f"{', '.join(SINGLE_WRITER_AGENTS)} must share a group")
+    parser.add_argument("--workers", default=os.getenv("AGENT_WORKERS", ""),
+                        help="worker processes per agent, e.g. 'market_analyst=2,product_manager=2' (default 1; "
+                             f"{', '.join(SINGLE_WRITER_AGENTS)} always run in a single worker)")
+    parser.add_argument("--report-interval", type=float, default=float(os.getenv("AGENT_REPORT_INTERVAL", "60")))
+    parser.add_argument("--prewarm", default=os.getenv("AGENT_PREWARM", ""),
+                        help="build agents in the background right after startup: 'all' or ','-separated agent names "
+                             "(default: build each agent on its first request)")
+    args = parser.parse_args(argv)
+    args.groups = [[name.strip() for name in group.split(",") if name.strip()] for group in args.groups.split(";")]
+    args.groups = [group for group in args.groups if group]
+    names = [name for group in args.groups for name in group]
+    unknown = set(names) - set(AGENT_APPS)
+    if unknown:
+        parser.error(f"unknown agents: {', '.join(sorted(unknown))}")
+    if len(names) != len(set(names)):
+        parser.error("each agent can only belong to one group")
+    args.workers = _parse_workers(args.workers)
+    writer_groups = {i for i, group in enumerate(args.groups) for name in group if name in SINGLE_WRITER_AGENTS}
+    if len(writer_groups) > 1:
+        parser.error(f"{', '.join(SINGLE_WRITER_AGENTS)} write the same RAG stores and must share one group")
+    for i in writer_groups:
+        over = [name for name in args.groups[i] if args.workers.get(name, 1) > 1]
+        if over:
+            parser.error(f"the group of {', '.join(SINGLE_WRITER_AGENTS)} runs a single worker "
+                         f"(one writer of the RAG stores); drop --workers for {', '.join(over)}")
+    return args
+
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    # Read by CrewAgentExecutor, and inherited by supervised worker processes.
+    os.environ["AGENT_PREWARM"] = args.prewarm
+    if args.supervise:
+        if not os.getenv("GEMINI_API_KEY") and not os.getenv("OPENAI_API_KEY"):
+            logger.error("Configuration error: Either GEMINI_API_KEY or OPENAI_API_KEY must be set in .env.")
+            sys.exit(1)
+        Supervisor("localhost", args.groups, args.workers, report_interval=args.report_interval).run()
+    else:
+        asyncio.run(main())
 
 
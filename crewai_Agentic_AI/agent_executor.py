@@ -1,304 +1,264 @@
+import os
+import time
+import uuid
+import base64
+import hashlib
+import asyncio
+import inspect
 import logging
+import importlib
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events import EventQueue
 from a2a.server.tasks import TaskUpdater
-from a2a.types import InternalError, InvalidParamsError, Part, TextPart, UnsupportedOperationError
+from a2a.types import FilePart, FileWithBytes, InternalError, InvalidParamsError, Message, Part, TaskState, TextPart
 from a2a.utils.errors import ServerError
 
-from Stakeholder_Agent import StakeholderAgent
-from BusinessAnalyst_Agent import BusinessAnalystAgent
-from business_analyst_domain_expert import BusinessAnalystDomainExpert
-from product_manager import ProductManagerAgent
-from agile_project_manager import AgileProjectManagerAgent
-from MarketAnalyst_Agent import MarketAnalystAgent
-
+from crew_runtime import (
+    AgentBusyError,
+    CancelToken,
+    CrewCancelledError,
+    ProgressForwarder,
+    get_admission_controller,
+    get_runner,
+    record_startup,
+    split_chunks,
+    wait_until_stopped,
+)
 
 logger = logging.getLogger(__name__)
 
-
-# ---------------- Stakeholder ----------------
-class StakeholderAgentExecutor(AgentExecutor):
-    """AgentExecutor for the Stakeholder Requirements Analysis agent."""
-
-    def __init__(self):
-        try:
-            self.agent = StakeholderAgent()
-        except Exception as e:
-            logger.error(f"Failed to initialize StakeholderAgent: {e}")
-            raise
-
-    async def execute(self, context: RequestContext, event_queue: EventQueue) -> None:
-        if not context.task_id or not context.context_id:
-            raise ValueError("RequestContext must have task_id and context_id")
-        if not context.message:
-            raise ValueError("RequestContext must have a message")
-
-        updater = TaskUpdater(event_queue, context.task_id, context.context_id)
-        if not context.current_task:
-            await updater.submit()
-        await updater.start_work()
-
-        if self._validate_request(context):
-            raise ServerError(error=InvalidParamsError())
-
-        try:
-            result = await self.agent.invoke(context.get_user_input())
-            logger.info(f"StakeholderAgent result: {result}")
-        except Exception as e:
-            logger.error(f"Error invoking StakeholderAgent: {e}")
-            raise ServerError(error=InternalError()) from e
-
-        parts = [Part(root=TextPart(text=result))]
-        await updater.add_artifact(parts)
-        await updater.complete()
-
-    async def cancel(self, context: RequestContext, event_queue: EventQueue) -> None:
-        logger.warning("Cancel operation not supported.")
-        raise ServerError(error=UnsupportedOperationError())
-
-    def _validate_request(self, context: RequestContext) -> bool:
-        try:
-            user_input = context.get_user_input()
-            return not user_input or not user_input.strip()
-        except Exception:
-            return True
-
-
-# ---------------- Business Analyst ----------------
-class BusinessAnalystAgentExecutor(AgentExecutor):
-    """AgentExecutor for the Business Analyst agent."""
-
-    def __init__(self):
-        try:
-            self.agent = BusinessAnalystAgent()
-        except Exception as e:
-            logger.error(f"Failed to initialize BusinessAnalystAgent: {e}")
-            raise
-
-    async def execute(self, context: RequestContext, event_queue: EventQueue) -> None:
-        if not context.task_id or not context.context_id:
-            raise ValueError("RequestContext must have task_id and context_id")
-        if not context.message:
-            raise ValueError("RequestContext must have a message")
-
-        updater = TaskUpdater(event_queue, context.task_id, context.context_id)
-        if not context.current_task:
-            await updater.submit()
-        await updater.start_work()
-
-        if self._validate_request(context):
-            raise ServerError(error=InvalidParamsError())
-
-        try:
-            result =await self.agent.invoke(context.get_user_input())
-            logger.info(f"BusinessAnalystAgent result: {result}")
-        except Exception as e:
-            logger.error(f"Error invoking BusinessAnalystAgent: {e}")
-            raise ServerError(error=InternalError()) from e
-
-        parts = [Part(root=TextPart(text=result))]
-        await updater.add_artifact(parts)
-        await updater.complete()
-
-    async def cancel(self, context: RequestContext, event_queue: EventQueue) -> None:
-        logger.warning("Cancel operation not supported.")
-        raise ServerError(error=UnsupportedOperationError())
-
-    def _validate_request(self, context: RequestContext) -> bool:
-        try:
-            user_input = context.get_user_input()
-            return not user_input or not user_input.strip()
-        except Exception:
-            return True
-
-
-# ---------------- Domain Expert ----------------
-class DomainExpertAgentExecutor(AgentExecutor):
-    """AgentExecutor for the Business Analyst Domain Expert agent."""
-
-    def __init__(self):
-        try:
-            self.agent = BusinessAnalystDomainExpert()
-        except Exception as e:
-            logger.error(f"Failed to initialize BusinessAnalystDomainExpert: {e}")
-            raise
-
-    async def execute(self, context: RequestContext, event_queue: EventQueue) -> None:
-        if not context.task_id or not context.context_id:
-            raise ValueError("RequestContext must have task_id and context_id")
-        if not context.message:
-            raise ValueError("RequestContext must have a message")
-
-        updater = TaskUpdater(event_queue, context.task_id, context.context_id)
-        if not context.current_task:
-            await updater.submit()
-        await updater.start_work()
-
-        if self._validate_request(context):
-            raise ServerError(error=InvalidParamsError())
-
+ARTIFACT_CHUNK_CHARS = int(os.getenv("A2A_ARTIFACT_CHUNK_CHARS", "4000"))
+ATTACHMENT_DIR = os.getenv("A2A_ATTACHMENT_DIR", "./memory/attachments")
+
+
+def progress_forwarder(updater: TaskUpdater, token: CancelToken = None) -> ProgressForwarder:
+    """Publish crew step and task callbacks as working-state TaskStatusUpdateEvents."""
+    async def publish(text, metadata):
+        message = updater.new_agent_message([Part(root=TextPart(text=text))], metadata=metadata)
+        await updater.update_status(TaskState.working, message=message)
+
+    return ProgressForwarder(asyncio.get_running_loop(), publish, token)
+
+
+async def stream_artifact(updater: TaskUpdater, text: str, name: str) -> None:
+    """Send the final document as appended chunks of a single artifact."""
+    artifact_id = str(uuid.uuid4())
+    chunks = split_chunks(text, ARTIFACT_CHUNK_CHARS)
+    for i, chunk in enumerate(chunks):
+        await updater.add_artifact([Part(root=TextPart(text=chunk))], artifact_id=artifact_id, name=name,
+                                   append=i > 0, last_chunk=i == len(chunks) - 1)
+
+
+def _save_inline_file(file: FileWithBytes) -> str:
+    """Write a small inline file to ATTACHMENT_DIR (content-addressed) so tools can open it by path."""
+    data = base64.b64decode(file.bytes)
+    digest = hashlib.sha256(data).hexdigest()
+    path = os.path.join(ATTACHMENT_DIR, digest, os.path.basename(file.name or digest))
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+    return os.path.abspath(path)
+
+
+def attachment_note(message: Message) -> str:
+    """List the message's files by uri or local path; large files arrive as blob-store uris, not bytes."""
+    lines = []
+    for part in message.parts:
+        if not isinstance(part.root, FilePart):
+            continue
+        file = part.root.file
+        location = _save_inline_file(file) if isinstance(file, FileWithBytes) else file.uri
+        lines.append(f"- {file.name or os.path.basename(location)} ({file.mime_type or 'unknown type'}): {location}")
+    if not lines:
+        return ""
+    return ("Attached files (ingest them with knowledge_base_manager_tool, action 'ingest_document', "
+            "passing the location as file_path):\n" + "\n".join(lines))
+
+
+class AgentSpec:
+    """How to build and run one crew agent behind the generic executor.
+
+    The agent class is named by module and attribute so crewai and the agent's dependencies are
+    only imported when the agent is first built.
+    """
+
+    def __init__(self, module: str, class_name: str, label: str, artifact_name: str,
+                 max_concurrency: int = 2, max_queue: int = 8):
+        self.module = module
+        self.class_name = class_name
+        self.label = label
+        self.artifact_name = artifact_name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+
+    def load(self, name: str):
+        started = time.perf_counter()
+        factory = getattr(importlib.import_module(self.module), self.class_name)
+        record_startup(name, "import", time.perf_counter() - started)
+        return factory
+
+
+AGENT_REGISTRY = {
+    "stakeholder": AgentSpec("Stakeholder_Agent", "StakeholderAgent", "StakeholderAgent", "project_vision_document"),
+    "business_analyst": AgentSpec("BusinessAnalyst_Agent", "BusinessAnalystAgent", "BusinessAnalystAgent",
+                                  "business_requirements"),
+    "domain_expert": AgentSpec("business_analyst_domain_expert", "BusinessAnalystDomainExpert", "DomainExpertAgent",
+                               "business_requirements"),
+    "market_analyst": AgentSpec("MarketAnalyst_Agent", "MarketAnalystAgent", "MarketAnalystAgent",
+                                "market_analysis_report"),
+    "product_manager": AgentSpec("product_manager", "ProductManagerAgent", "ProductManagerAgent", "product_roadmap"),
+    "agile_pm": AgentSpec("agile_project_manager", "AgileProjectManagerAgent", "AgileProjectManagerAgent",
+                          "sprint_plan"),
+}
+
+
+def prewarm_enabled(name: str) -> bool:
+    """AGENT_PREWARM is '1'/'all' for every agent or a ','-separated list of agent names."""
+    value = os.getenv("AGENT_PREWARM", "").strip()
+    return value in ("1", "all") or name in {item.strip() for item in value.split(",")}
+
+
+class CrewAgentExecutor(AgentExecutor):
+    """AgentExecutor for any registered crew agent.
+
+    Runs are admitted through a per-agent concurrency limit and bounded wait queue, synchronous
+    agents run in the agent's thread pool, and every run can be cancelled at its next crew step;
+    a run keeps its admission slot until its crew has actually stopped.
+    The agent itself (LLM, tools, memory) is built on the first request, or in the background right
+    after startup when pre-warming is enabled, so the agent card is served at once.
+
+    Cancel tokens live in the process that runs the crew. Under the supervisor with several workers
+    for an agent, a tasks/cancel served by another worker marks the task canceled without stopping
+    the crew, and the owning worker later overwrites that state with the crew's result.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spec = AGENT_REGISTRY[name]
+        self.agent = None
+        self.runner = None
+        self.admission = get_admission_controller(name, self.spec.max_concurrency, self.spec.max_queue)
+        self._build_lock = asyncio.Lock()
+        self._prewarm_task = None
+        self._cancel_tokens: dict[str, CancelToken] = {}
+        if prewarm_enabled(name):
+            self.prewarm()
+
+    def prewarm(self):
+        """Start building the agent in the background if an event loop is running."""
         try:
-            result = self.agent.invoke(context.get_user_input())
-            logger.info(f"DomainExpertAgent result: {result}")
-        except Exception as e:
-            logger.error(f"Error invoking DomainExpertAgent: {e}")
-            raise ServerError(error=InternalError()) from e
-
-        parts = [Part(root=TextPart(text=result))]
-        await updater.add_artifact(parts)
-        await updater.complete()
-
-    async def cancel(self, context: RequestContext, event_queue: EventQueue) -> None:
-        logger.warning("Cancel operation not supported.")
-        raise ServerError(error=UnsupportedOperationError())
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning(f"Cannot pre-warm {self.spec.label} outside an event loop; it will be built on first use")
+            return
+        self._prewarm_task = loop.create_task(self._prewarm())
 
-    def _validate_request(self, context: RequestContext) -> bool:
+    async def _prewarm(self):
         try:
-            user_input = context.get_user_input()
-            return not user_input or not user_input.strip()
+            await self.get_agent()
         except Exception:
-            return True
+            pass  # already logged; the next request retries the build
 
+    async def get_agent(self):
+        if self.agent is None:
+            async with self._build_lock:
+                if self.agent is None:
+                    await asyncio.to_thread(self._build)
+        return self.agent
 
-# ---------------- Market Analyst ----------------
-class MarketAnalystAgentExecutor(AgentExecutor):
-    """AgentExecutor for the Market Analyst agent."""
-
-    def __init__(self):
+    def _build(self):
         try:
-            self.agent = MarketAnalystAgent()
+            factory = self.spec.load(self.name)
+            started = time.perf_counter()
+            agent = factory()
+            record_startup(self.name, "init", time.perf_counter() - started)
         except Exception as e:
-            logger.error(f"Failed to initialize MarketAnalystAgent: {e}")
+            logger.error(f"Failed to initialize {self.spec.label}: {e}")
             raise
+        if not inspect.iscoroutinefunction(agent.invoke):
+            # invoke() blocks on crew.kickoff; run it in the agent's pool so other agents keep serving.
+            self.runner = get_runner(self.name, default_workers=self.admission.max_concurrency)
+        self.agent = agent
+
+    async def close(self):
+        """Tear the agent down, releasing its pooled MCP servers; a later request builds it again."""
+        async with self._build_lock:  # lets a pre-warm build in progress finish first
+            agent, self.agent = self.agent, None
+        close = getattr(agent, "close", None)
+        if close is not None:
+            try:
+                await asyncio.to_thread(close)
+            except Exception as e:
+                logger.warning(f"Error closing {self.spec.label}: {e}")
 
     async def execute(self, context: RequestContext, event_queue: EventQueue) -> None:
         if not context.task_id or not context.context_id:
             raise ValueError("RequestContext must have task_id and context_id")
         if not context.message:
             raise ValueError("RequestContext must have a message")
-
-        updater = TaskUpdater(event_queue, context.task_id, context.context_id)
-        if not context.current_task:
-            await updater.submit()
-        await updater.start_work()
-
         if self._validate_request(context):
             raise ServerError(error=InvalidParamsError())
 
         try:
-            result = await self.agent.invoke(context.get_user_input())
-            logger.info(f"MarketAnalystAgent result: {result}")
-        except Exception as e:
-            logger.error(f"Error invoking MarketAnalystAgent: {e}")
-            raise ServerError(error=InternalError()) from e
-
-        parts = [Part(root=TextPart(text=result))]
-        await updater.add_artifact(parts)
-        await updater.complete()
-
-    async def cancel(self, context: RequestContext, event_queue: EventQueue) -> None:
-        logger.warning("Cancel operation not supported.")
-        raise ServerError(error=UnsupportedOperationError())
-
-    def _validate_request(self, context: RequestContext) -> bool:
-        try:
-            user_input = context.get_user_input()
-            return not user_input or not user_input.strip()
-        except Exception:
-            return True
-
-
-# ---------------- Product Manager ----------------
-class ProductManagerAgentExecutor(AgentExecutor):
-    """AgentExecutor for the Product Manager agent."""
-
-    def __init__(self):
-        try:
-            self.agent = ProductManagerAgent()
-        except Exception as e:
-            logger.error(f"Failed to initialize ProductManagerAgent: {e}")
-            raise
-
-    async def execute(self, context: RequestContext, event_queue: EventQueue) -> None:
-        if not context.task_id or not context.context_id:
-            raise ValueError("RequestContext must have task_id and context_id")
-        if not context.message:
-            raise ValueError("RequestContext must have a message")
-
+            async with self.admission.slot():
+                await self._run(context, event_queue)
+        except AgentBusyError as e:
+            logger.warning(f"Rejecting task {context.task_id}: {e}")
+            raise ServerError(error=InternalError(
+                message=str(e), data={"reason": "busy", "agent": self.name, "retry_after": e.retry_after}
+            )) from e
+
+    async def _run(self, context: RequestContext, event_queue: EventQueue) -> None:
         updater = TaskUpdater(event_queue, context.task_id, context.context_id)
         if not context.current_task:
             await updater.submit()
         await updater.start_work()
 
-        if self._validate_request(context):
-            raise ServerError(error=InvalidParamsError())
-
+        token = self._cancel_tokens[context.task_id] = CancelToken()
+        progress = progress_forwarder(updater, token)
         try:
-            result = self.agent.invoke(context.get_user_input())
-            logger.info(f"ProductManagerAgent result: {result}")
+            user_input = "\n\n".join(filter(None, [context.get_user_input(), attachment_note(context.message)]))
+            agent = await self.get_agent()
+            if self.runner is None:
+                # Async agents run their crew in a thread too; it stops at progress.step_callback.
+                run = agent.invoke(user_input, progress.step_callback, progress.task_callback)
+            else:
+                run = self.runner.run(agent.invoke, user_input,
+                                      progress.step_callback, progress.task_callback, token=token)
+            result = await wait_until_stopped(run, token)
+            logger.info(f"{self.spec.label} result: {result}")
+        except CrewCancelledError:
+            logger.info(f"{self.spec.label} run for task {context.task_id} was cancelled")
+            return
         except Exception as e:
-            logger.error(f"Error invoking ProductManagerAgent: {e}")
-            raise ServerError(error=InternalError()) from e
-
-        parts = [Part(root=TextPart(text=result))]
-        await updater.add_artifact(parts)
+            # Agents raise when their crew fails; the task ends as failed, never as a completed apology.
+            logger.error(f"Error invoking {self.spec.label}: {e}")
+            await progress.drain()
+            await updater.failed(message=updater.new_agent_message(
+                [Part(root=TextPart(text=f"{self.spec.label} failed: {e}"))]))
+            return
+        finally:
+            self._cancel_tokens.pop(context.task_id, None)
+
+        if token.cancelled:
+            return
+        await progress.drain()
+        await stream_artifact(updater, result, self.spec.artifact_name)
         await updater.complete()
 
     async def cancel(self, context: RequestContext, event_queue: EventQueue) -> None:
-        logger.warning("Cancel operation not supported.")
-        raise ServerError(error=UnsupportedOperationError())
-
-    def _validate_request(self, context: RequestContext) -> bool:
-        try:
-            user_input = context.get_user_input()
-            return not user_input or not user_input.strip()
-        except Exception:
-            return True
-
-
-# ---------------- Agile Project Manager ----------------
-class AgileProjectManagerAgentExecutor(AgentExecutor):
-    """AgentExecutor for the Agile Project Manager agent."""
-
-    def __init__(self):
-        try:
-            self.agent = AgileProjectManagerAgent()
-        except Exception as e:
-            logger.error(f"Failed to initialize AgileProjectManagerAgent: {e}")
-            raise
-
-    async def execute(self, context: RequestContext, event_queue: EventQueue) -> None:
-        if not context.task_id or not context.context_id:
-            raise ValueError("RequestContext must have task_id and context_id")
-        if not context.message:
-            raise ValueError("RequestContext must have a message")
-
+        token = self._cancel_tokens.get(context.task_id)
+        if token is not None:
+            logger.info(f"Cancelling crew run for task {context.task_id}")
+            token.cancel()
         updater = TaskUpdater(event_queue, context.task_id, context.context_id)
-        if not context.current_task:
-            await updater.submit()
-        await updater.start_work()
-
-        if self._validate_request(context):
-            raise ServerError(error=InvalidParamsError())
-
-        try:
-            result = self.agent.invoke(context.get_user_input())
-            logger.info(f"AgileProjectManagerAgent result: {result}")
-        except Exception as e:
-            logger.error(f"Error invoking AgileProjectManagerAgent: {e}")
-            raise ServerError(error=InternalError()) from e
-
-        parts = [Part(root=TextPart(text=result))]
-        await updater.add_artifact(parts)
-        await updater.complete()
-
-    async def cancel(self, context: RequestContext, event_queue: EventQueue) -> None:
-        logger.warning("Cancel operation not supported.")
-        raise ServerError(error=UnsupportedOperationError())
+        await updater.cancel()
 
     def _validate_request(self, context: RequestContext) -> bool:
         try:
             user_input = context.get_user_input()
-            return not user_input or not user_input.strip()
+            has_files = any(isinstance(part.root, FilePart) for part in context.message.parts)
+            return not has_files and (not user_input or not user_input.strip())
         except Exception:
             return True
@@ -5,6 +5,7 @@ from typing import Union, List
 
 from dotenv import load_dotenv
 from crewai import LLM, Agent, Crew, Process, Task
+from crew_runtime import TEXT_CONTENT_TYPES, CrewCancelledError
 
 # Load environment variables
 load_dotenv()
@@ -17,7 +18,7 @@ logging.basicConfig(level=logging.INFO)
 class AgileProjectManagerAgent:
     """Agent that facilitates Agile projects and sprint planning."""
 
-    SUPPORTED_CONTENT_TYPES = ["text/plain"]
+    SUPPORTED_CONTENT_TYPES = TEXT_CONTENT_TYPES
 
     def __init__(self):
         # Load LLM (Gemini preferred, fallback to OpenAI)
@@ -56,7 +57,7 @@ class AgileProjectManagerAgent:
             llm=self.llm,
         )
 
-    def invoke(self, backlog_context: Union[str, List[str]]) -> str:
+    def invoke(self, backlog_context: Union[str, List[str]], step_callback=None, task_callback=None) -> str:
         """
         Generate a sprint plan based on backlog items, priorities, and business objectives.
         """
@@ -90,18 +91,19 @@ class AgileProjectManagerAgent:
             tasks=[sprint_planning_task],
             process=Process.sequential,
             verbose=True,
+            step_callback=step_callback,
+            task_callback=task_callback,
         )
 
         try:
             result = crew.kickoff(inputs={"backlog_context": backlog_context})
             logger.info(f"[AgileProjectManagerAgent] Crew final response: {result}")
             return str(result)
+        except CrewCancelledError:
+            raise
         except Exception as e:
             logger.error(f"[AgileProjectManagerAgent] Crew execution failed: {e}")
-            return (
-                "Sorry, I couldn't generate the Sprint Plan at this moment. "
-                "Please try again later."
-            )
+            raise
 
 
 # if __name__ == "__main__":
@@ -5,6 +5,7 @@ from typing import Union, List
 
 from dotenv import load_dotenv
 from crewai import LLM, Agent, Crew, Process, Task
+from crew_runtime import MULTIMODAL_CONTENT_TYPES, CrewCancelledError
 
 # Load environment variables
 load_dotenv()
@@ -17,15 +18,7 @@ logging.basicConfig(level=logging.INFO)
 class BusinessAnalystDomainExpert:
     """Multimodal Agent that performs requirement gathering and BRD/User Story generation."""
 
-    SUPPORTED_CONTENT_TYPES = [
-        "text/plain",
-        "application/pdf",
-        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-        "image/jpeg",
-        "image/png",
-        "audio/wav",
-        "audio/mp3",
-    ]
+    SUPPORTED_CONTENT_TYPES = MULTIMODAL_CONTENT_TYPES
 
     def __init__(self):
         # Load LLM (Gemini preferred, fallback to OpenAI)
@@ -65,7 +58,7 @@ class BusinessAnalystDomainExpert:
             llm=self.llm,
         )
 
-    def invoke(self, stakeholder_inputs: Union[str, List[str]]) -> str:
+    def invoke(self, stakeholder_inputs: Union[str, List[str]], step_callback=None, task_callback=None) -> str:
         """
         Accepts raw project context (str) OR a list of multimodal inputs (file paths, transcripts).
         """
@@ -100,18 +93,19 @@ class BusinessAnalystDomainExpert:
             tasks=[requirements_analysis_task],
             process=Process.sequential,
             verbose=True,
+            step_callback=step_callback,
+            task_callback=task_callback,
         )
 
         try:
             result = crew.kickoff(inputs={"stakeholder_inputs": stakeholder_inputs})
             logger.info(f"[BusinessAnalystDomainExpert] Crew final response: {result}")
             return str(result)
+        except CrewCancelledError:
+            raise
         except Exception as e:
             logger.error(f"[BusinessAnalystDomainExpert] Crew execution failed: {e}")
-            return (
-                "Sorry, I couldn't generate the Business Requirements Document at this moment. "
-                "Please try again later."
-            )
+            raise
 
 
 if __name__ == "__main__":
@@ -0,0 +1,346 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Content types are kept here, away from the agent modules, so agent cards can be built
+# without importing crewai.
+TEXT_CONTENT_TYPES = ["text/plain"]
+MULTIMODAL_CONTENT_TYPES = [
+    "text/plain",
+    "application/pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "image/jpeg",
+    "image/png",
+    "audio/wav",
+    "audio/mp3",
+]
+
+
+class CrewCancelledError(TimeoutError):
+    """Raised inside a crew to stop it at the next step boundary.
+
+    It subclasses TimeoutError because crewai re-raises timeouts straight away instead of
+    retrying the task, which is exactly what a cancelled run needs.
+    """
+
+
+class CancelToken:
+    """Thread-safe flag checked by running and queued crew work."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise CrewCancelledError("Crew run was cancelled")
+
+
+async def wait_until_stopped(run: Awaitable, token: CancelToken) -> Any:
+    """Await a crew run; if the caller is cancelled, cancel the token and keep waiting for the run to stop.
+
+    A crew only stops at its next step, so giving up at once would release the caller's concurrency
+    slot while the crew's thread is still busy.
+    """
+    task = asyncio.ensure_future(run)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        token.cancel()
+        while not task.done():
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                pass
+        if not task.cancelled():
+            task.exception()  # the run's own outcome is superseded by the cancellation
+        raise
+
+
+def _percentile(samples, fraction: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+class AgentRunner:
+    """Bounded thread pool that runs one agent's blocking crew work off the event loop."""
+
+    def __init__(self, name: str, max_workers: int = 1, sample_size: int = 1000):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"crew-{name}")
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.wait_ms = deque(maxlen=sample_size)
+        self.run_ms = deque(maxlen=sample_size)
+        self._lock = threading.Lock()
+
+    async def run(self, func: Callable, *args, token: CancelToken = None, **kwargs) -> Any:
+        """Run func in this agent's pool and await its result without blocking the loop.
+
+        Cancelling the awaiting coroutine drops the job if it has not started yet; a job that is
+        still queued when its token is cancelled is skipped as well.
+        """
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+
+        def job():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.wait_ms.append((started - submitted) * 1000)
+                if token is not None and token.cancelled:
+                    self.cancelled += 1
+                    raise CrewCancelledError("Crew run was cancelled before it started")
+                self.running += 1
+            outcome = "failed"
+            try:
+                result = func(*args, **kwargs)
+                outcome = "completed"
+                return result
+            except CrewCancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.run_ms.append((time.perf_counter() - started) * 1000)
+                    setattr(self, outcome, getattr(self, outcome) + 1)
+
+        future = self.executor.submit(job)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancel():
+                with self._lock:
+                    self.queued -= 1
+                    self.cancelled += 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            wait_ms, run_ms = list(self.wait_ms), list(self.run_ms)
+            return {
+                'max_workers': self.max_workers,
+                'queue_depth': self.queued,
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'cancelled': self.cancelled,
+                'wait_ms': {'p50': _percentile(wait_ms, 0.5), 'p95': _percentile(wait_ms, 0.95)},
+                'run_ms': {'p50': _percentile(run_ms, 0.5), 'p95': _percentile(run_ms, 0.95)},
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_runners: Dict[str, AgentRunner] = {}
+_runners_lock = threading.Lock()
+
+
+def _env_int(name: str, agent: str, default: int) -> int:
+    """Per-agent setting NAME_<AGENT>, falling back to NAME and then to default."""
+    return int(os.getenv(f"{name}_{agent.upper()}", os.getenv(name, str(default))))
+
+
+def get_runner(name: str, default_workers: int = 1) -> AgentRunner:
+    """Per-agent runner; size comes from CREW_WORKERS_<NAME>, falling back to CREW_WORKERS."""
+    with _runners_lock:
+        runner = _runners.get(name)
+        if runner is None:
+            workers = _env_int("CREW_WORKERS", name, default_workers)
+            runner = _runners[name] = AgentRunner(name, workers)
+            logger.info(f"[crew_runtime] Runner '{name}' started with {runner.max_workers} worker(s)")
+        return runner
+
+
+def runner_stats() -> Dict[str, Any]:
+    return {name: runner.stats() for name, runner in _runners.items()}
+
+
+# ------------------- Admission control -------------------
+class AgentBusyError(Exception):
+    """Raised when an agent is at its concurrency limit and its wait queue is full."""
+
+    def __init__(self, agent: str, retry_after: float):
+        super().__init__(f"Agent '{agent}' is busy, retry in {retry_after:.0f}s")
+        self.agent = agent
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Per-agent concurrency limit with a bounded wait queue; requests beyond it are rejected at once."""
+
+    def __init__(self, name: str, max_concurrency: int = 2, max_queue: int = 8, sample_size: int = 1000):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_ms = deque(maxlen=sample_size)
+        self.service_ms = deque(maxlen=sample_size)
+        self._semaphore = None
+
+    def retry_after(self) -> float:
+        """Rough time until a slot frees up: median service time per queued request and slot."""
+        median_ms = _percentile(list(self.service_ms), 0.5) or 30000
+        return round(median_ms / 1000 * (self.waiting + 1) / self.max_concurrency, 1)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self.in_flight + self.waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise AgentBusyError(self.name, self.retry_after())
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        queued = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.perf_counter()
+        self.wait_ms.append((started - queued) * 1000)
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.service_ms.append((time.perf_counter() - started) * 1000)
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        wait_ms, service_ms = list(self.wait_ms), list(self.service_ms)
+        return {
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'in_flight': self.in_flight,
+            'queue_length': self.waiting,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'wait_ms': {'p50': _percentile(wait_ms, 0.5), 'p95': _percentile(wait_ms, 0.95)},
+            'service_ms': {'p50': _percentile(service_ms, 0.5), 'p95': _percentile(service_ms, 0.95)},
+        }
+
+
+_controllers: Dict[str, AdmissionController] = {}
+
+
+def get_admission_controller(name: str, max_concurrency: int = 2, max_queue: int = 8) -> AdmissionController:
+    """Per-agent controller; limits come from CREW_MAX_CONCURRENCY[_<NAME>] and CREW_MAX_QUEUE[_<NAME>]."""
+    with _runners_lock:
+        controller = _controllers.get(name)
+        if controller is None:
+            controller = _controllers[name] = AdmissionController(
+                name,
+                max_concurrency=_env_int("CREW_MAX_CONCURRENCY", name, max_concurrency),
+                max_queue=_env_int("CREW_MAX_QUEUE", name, max_queue),
+            )
+        return controller
+
+
+def runtime_stats() -> Dict[str, Any]:
+    """Admission and runner metrics for every agent hosted in this process."""
+    return {
+        name: {'admission': controller.stats(), 'runner': _runners[name].stats() if name in _runners else None}
+        for name, controller in _controllers.items()
+    }
+
+
+# ------------------- Startup profile -------------------
+_startup_profile: Dict[str, Dict[str, Any]] = {}
+
+
+def record_startup(name: str, phase: str, seconds: float):
+    """Record how long one startup phase ('import', 'init', 'app') of an agent took."""
+    _startup_profile.setdefault(name, {})[f'{phase}_seconds'] = round(seconds, 3)
+    logger.info(f"[crew_runtime] {name}: {phase} took {seconds:.3f}s")
+
+
+def startup_profile() -> Dict[str, Dict[str, Any]]:
+    return {name: dict(phases) for name, phases in _startup_profile.items()}
+
+
+# ------------------- Progress streaming -------------------
+def describe_step(step: Any, limit: int = 300) -> str:
+    """One-line summary of a crew step (tool call, thought or final answer)."""
+    tool = getattr(step, "tool", None)
+    if tool:
+        return f"Using tool `{tool}` with {str(getattr(step, 'tool_input', ''))[:limit]}"
+    thought = (getattr(step, "thought", "") or "").strip()
+    if getattr(step, "output", None) is not None:
+        return f"Step finished{': ' + thought[:limit] if thought else ''}"
+    if getattr(step, "result", None) is not None:
+        return f"Tool returned {str(step.result)[:limit]}"
+    return thought[:limit] or str(step)[:limit]
+
+
+def split_chunks(text: str, size: int = 4000) -> List[str]:
+    """Split text into chunks of at most size characters, preferring line breaks."""
+    chunks = []
+    while len(text) > size:
+        cut = text.rfind("\n", 0, size)
+        cut = cut + 1 if cut > size // 2 else size
+        chunks.append(text[:cut])
+        text = text[cut:]
+    chunks.append(text)
+    return chunks
+
+
+class ProgressForwarder:
+    """Bridges crew callbacks, which fire on worker threads, to an async publisher on the event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, publish: Callable[[str, Dict[str, Any]], Awaitable],
+                 token: CancelToken = None):
+        self.loop = loop
+        self.publish = publish
+        self.token = token
+        self.futures = []
+
+    def _send(self, text: str, metadata: Dict[str, Any]):
+        self.futures.append(asyncio.run_coroutine_threadsafe(self.publish(text, metadata), self.loop))
+
+    def step_callback(self, step: Any):
+        # Step boundaries are where a cancelled crew stops, before its next LLM or tool call.
+        if self.token is not None:
+            self.token.raise_if_cancelled()
+        self._send(describe_step(step), {"event": "step"})
+
+    def task_callback(self, output: Any):
+        if self.token is not None:
+            self.token.raise_if_cancelled()
+        name = getattr(output, "name", None) or (getattr(output, "description", "") or "")[:80]
+        self._send(f"Task finished: {name}", {"event": "task", "agent": getattr(output, "agent", None)})
+
+    async def drain(self):
+        """Wait until every forwarded update has been published, so none lands after the result."""
+        for future in self.futures:
+            try:
+                await asyncio.wrap_future(future)
+            except Exception as e:
+                logger.warning(f"[crew_runtime] Dropped progress update: {e}")
+        self.futures.clear()
@@ -0,0 +1,223 @@
+import os
+import time
+import atexit
+import logging
+import threading
+from typing import List, Dict, Any
+
+import anyio
+from crewai.tools import BaseTool
+from mcp import StdioServerParameters
+from mcpadapt.core import MCPAdapt
+from mcpadapt.crewai_adapter import CrewAIAdapter
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# Raised while writing the request to a session whose streams are already closed, so the server
+# never saw the call and it is safe to repeat even for non-idempotent tools (ingest, graph writes).
+NOT_SENT_ERRORS = (anyio.ClosedResourceError, anyio.BrokenResourceError)
+
+
+def _not_sent(error: Exception) -> bool:
+    if isinstance(error, NOT_SENT_ERRORS):
+        return True
+    # run_coroutine_threadsafe on the adapter's closed loop fails before anything is scheduled.
+    return isinstance(error, RuntimeError) and "loop is closed" in str(error)
+
+
+def server_key(params: StdioServerParameters) -> tuple:
+    """Servers are shared by command line; agents passing the same script get the same process."""
+    return params.command, tuple(params.args)
+
+
+class PooledServer:
+    """One long-lived MCP server process whose single session is shared by every agent in the process."""
+
+    def __init__(self, params: StdioServerParameters, connect_timeout: int = 30):
+        self.params = params
+        self.connect_timeout = connect_timeout
+        self.refcount = 0
+        self.restarts = 0
+        self.calls = 0
+        self.failures = 0
+        self.started_at = None
+        self.startup_seconds = None
+        self.first_call_seconds = None
+        self.adapter = None
+        self.tools: Dict[str, BaseTool] = {}
+        self._lock = threading.RLock()
+
+    @property
+    def name(self) -> str:
+        return " ".join([self.params.command, *self.params.args])
+
+    def start(self):
+        with self._lock:
+            started = time.perf_counter()
+            adapter = MCPAdapt(self.params, CrewAIAdapter(), self.connect_timeout)
+            adapter.start()
+            self.adapter = adapter
+            self.tools = {tool.name: tool for tool in adapter.tools()}
+            self.started_at = time.time()
+            self.startup_seconds = round(time.perf_counter() - started, 3)
+            self.first_call_seconds = None
+            logger.info(f"[MCPToolServerPool] Started '{self.name}' in {self.startup_seconds}s "
+                        f"with tools {list(self.tools)}")
+
+    def stop(self):
+        with self._lock:
+            adapter, self.adapter = self.adapter, None
+            if adapter is None:
+                return
+            try:
+                adapter.close()
+            except Exception as e:
+                logger.warning(f"[MCPToolServerPool] Error stopping '{self.name}': {e}")
+
+    def restart(self):
+        with self._lock:
+            logger.warning(f"[MCPToolServerPool] Restarting '{self.name}'")
+            self.stop()
+            self.start()
+            self.restarts += 1
+
+    def healthy(self) -> bool:
+        """Probe the server with a tools/list request, which MCPAdapt bounds by connect_timeout."""
+        adapter = self.adapter
+        if adapter is None:
+            return False
+        try:
+            adapter.tools()
+            return True
+        except Exception as e:
+            logger.warning(f"[MCPToolServerPool] Health check failed for '{self.name}': {e}")
+            return False
+
+    def ensure_healthy(self):
+        with self._lock:
+            if self.refcount and not self.healthy():
+                self.restart()
+
+    def call(self, tool_name: str, *args, **kwargs) -> Any:
+        """Run a tool on the current server instance, restarting the server if it died.
+
+        The call is repeated on the new instance only if it failed before the request was sent;
+        a call that may have reached the server is never run twice.
+        """
+        self.calls += 1
+        if self.adapter is None:
+            # A previous restart failed; reconnect on demand.
+            with self._lock:
+                if self.adapter is None:
+                    self.start()
+        adapter = self.adapter
+        started = time.perf_counter()
+        try:
+            result = self.tools[tool_name]._run(*args, **kwargs)
+            if self.first_call_seconds is None:
+                self.first_call_seconds = round(time.perf_counter() - started, 3)
+            return result
+        except Exception as e:
+            with self._lock:
+                # Another caller may already have replaced the dead instance.
+                if self.adapter is adapter:
+                    if self.healthy():
+                        raise
+                    self.failures += 1
+                    self.restart()
+            if not _not_sent(e):
+                raise
+            return self.tools[tool_name]._run(*args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'refcount': self.refcount,
+            'tools': list(self.tools),
+            'running': self.adapter is not None,
+            'startup_seconds': self.startup_seconds,
+            'first_call_seconds': self.first_call_seconds,
+            'uptime_seconds': round(time.time() - self.started_at, 1) if self.started_at else None,
+            'restarts': self.restarts,
+            'calls': self.calls,
+            'failures': self.failures,
+        }
+
+
+class PooledTool(BaseTool):
+    """Stable tool handle that always dispatches to the pooled server's current session."""
+
+    _server: PooledServer = PrivateAttr(default=None)
+
+    def _run(self, *args: Any, **kwargs: Any) -> Any:
+        return self._server.call(self.name, *args, **kwargs)
+
+
+class MCPToolServerPool:
+    """Reference-counted pool of MCP tool servers with background health checks."""
+
+    def __init__(self, health_interval: float = 30.0):
+        self.health_interval = health_interval
+        self._servers: Dict[tuple, PooledServer] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+
+    def acquire(self, params_list: List[StdioServerParameters]) -> List[BaseTool]:
+        """Start (or reuse) each server and return proxy tools for all of them."""
+        tools = []
+        for params in params_list:
+            with self._lock:
+                server = self._servers.get(server_key(params))
+                if server is None:
+                    server = self._servers[server_key(params)] = PooledServer(params)
+            with server._lock:
+                if server.adapter is None:
+                    server.start()
+                server.refcount += 1
+            for tool in server.tools.values():
+                proxy = PooledTool(name=tool.name, description=tool.description, args_schema=tool.args_schema)
+                proxy._server = server
+                tools.append(proxy)
+        self._start_health_checks()
+        return tools
+
+    def release(self, params_list: List[StdioServerParameters]):
+        """Drop one reference per server; a server stops once nobody holds it."""
+        for params in params_list:
+            server = self._servers.get(server_key(params))
+            if server is None:
+                continue
+            with server._lock:
+                server.refcount = max(0, server.refcount - 1)
+                if server.refcount == 0:
+                    server.stop()
+
+    def _start_health_checks(self):
+        with self._lock:
+            if self._health_thread is None and self.health_interval > 0:
+                self._health_thread = threading.Thread(target=self._health_loop, name="mcp-pool-health", daemon=True)
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for server in list(self._servers.values()):
+                try:
+                    server.ensure_healthy()
+                except Exception as e:
+                    logger.error(f"[MCPToolServerPool] Could not restart '{server.name}': {e}")
+
+    def stats(self, params_list: List[StdioServerParameters] = None) -> Dict[str, Any]:
+        """Per-server metrics, optionally limited to the given servers."""
+        servers = self._servers.values() if params_list is None else \
+            [self._servers[server_key(p)] for p in params_list if server_key(p) in self._servers]
+        return {server.name: server.stats() for server in servers}
+
+    def shutdown(self):
+        self._stop.set()
+        for server in list(self._servers.values()):
+            server.stop()
+
+
+MCP_POOL = MCPToolServerPool(health_interval=float(os.getenv("MCP_HEALTH_INTERVAL", "30")))
+atexit.register(MCP_POOL.shutdown)
@@ -5,6 +5,7 @@ from typing import Union, List
 
 from dotenv import load_dotenv
 from crewai import LLM, Agent, Crew, Process, Task
+from crew_runtime import TEXT_CONTENT_TYPES, CrewCancelledError
 
 # Load environment variables
 load_dotenv()
@@ -17,7 +18,7 @@ logging.basicConfig(level=logging.INFO)
 class ProductManagerAgent:
     """Agent that defines product vision, strategy, and roadmap."""
 
-    SUPPORTED_CONTENT_TYPES = ["text/plain"]
+    SUPPORTED_CONTENT_TYPES = TEXT_CONTENT_TYPES
 
     def __init__(self):
         # Load LLM (Gemini preferred, fallback to OpenAI)
@@ -55,7 +56,7 @@ class ProductManagerAgent:
             llm=self.llm,
         )
 
-    def invoke(self, stakeholder_inputs: Union[str, List[str]]) -> str:
+    def invoke(self, stakeholder_inputs: Union[str, List[str]], step_callback=None, task_callback=None) -> str:
         """
         Generate a product roadmap based on customer feedback, market trends, and business objectives.
         """
@@ -88,18 +89,19 @@ class ProductManagerAgent:
             tasks=[define_roadmap_task],
             process=Process.sequential,
             verbose=True,
+            step_callback=step_callback,
+            task_callback=task_callback,
         )
 
         try:
             result = crew.kickoff(inputs={"stakeholder_inputs": stakeholder_inputs})
             logger.info(f"[ProductManagerAgent] Crew final response: {result}")
             return str(result)
+        except CrewCancelledError:
+            raise
         except Exception as e:
             logger.error(f"[ProductManagerAgent] Crew execution failed: {e}")
-            return (
-                "Sorry, I couldn't generate the Product Roadmap at this moment. "
-                "Please try again later."
-            )
+            raise
 
 
 if __name__ == "__main__":
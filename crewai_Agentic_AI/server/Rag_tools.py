@@ -1,7 +1,24 @@
 import os
+import re
+import sys
 import json
+import atexit
 import logging
 import hashlib
+import bisect
+import heapq
+import itertools
+import importlib.machinery
+import queue
+import tempfile
+import threading
+import time
+import multiprocessing
+import urllib.request
+from urllib.parse import unquote, urlparse
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Dict, Any
 from datetime import datetime
 import uuid
@@ -35,23 +52,702 @@ from dotenv import load_dotenv
 import sqlite3
 from mcp.server.fastmcp import FastMCP
 
+from extraction_workers import (
+    extract_pdf_page_range,
+    init_whisper_worker,
+    transcribe_audio_window,
+    whisper_segments,
+)
+
 load_dotenv()
 
 mcp = FastMCP("rag_and_markdown_tools")
 
 
+# ------------------- Shared Embedding Models -------------------
+class EmbeddingModelPool:
+    """Process-wide registry of SentenceTransformer models, keyed by model name.
+
+    Every collection asks the pool for its model, so a model is loaded at most once per
+    process no matter how many collections use it. Loading is lazy and guarded by a
+    per-model lock, so concurrent first use waits for one load instead of starting several.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._load_seconds = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _lock_for(self, model_name: str) -> threading.Lock:
+        with self._registry_lock:
+            return self._locks.setdefault(model_name, threading.Lock())
+
+    def get(self, model_name: str) -> SentenceTransformer:
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+        with self._lock_for(model_name):
+            model = self._models.get(model_name)
+            if model is None:
+                started = time.perf_counter()
+                model = SentenceTransformer(model_name)
+                self._load_seconds[model_name] = time.perf_counter() - started
+                self._models[model_name] = model
+                self.logger.info(f"Loaded embedding model '{model_name}' in {self._load_seconds[model_name]:.2f}s")
+        return model
+
+    @staticmethod
+    def _memory_bytes(model) -> int:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                'memory_mb': round(self._memory_bytes(model) / (1024 * 1024), 2),
+                'load_seconds': round(self._load_seconds.get(name, 0.0), 3),
+                'device': str(model.device),
+            }
+            for name, model in list(self._models.items())
+        }
+
+
+EMBEDDING_MODELS = EmbeddingModelPool()
+
+
+# ------------------- Extraction Worker Pools -------------------
+class _IdleResources:
+    """Base for holders of lazily created resources that are released after idle_timeout seconds unused."""
+
+    def __init__(self, idle_timeout: float):
+        self.idle_timeout = idle_timeout
+        self._active = 0
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+        self._evictor = None
+        self.logger = logging.getLogger(__name__)
+
+    def _loaded(self) -> bool:
+        raise NotImplementedError
+
+    def _take(self):
+        """Detach the held resources (called under the lock) and return them for _release."""
+        raise NotImplementedError
+
+    def _release(self, resources):
+        raise NotImplementedError
+
+    @contextmanager
+    def _use(self):
+        with self._lock:
+            self._active += 1
+            self._start_evictor()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last_used = time.monotonic()
+
+    def _start_evictor(self):
+        if self._evictor is None or not self._evictor.is_alive():
+            self._evictor = threading.Thread(target=self._evict_when_idle, daemon=True)
+            self._evictor.start()
+
+    def _evict_when_idle(self):
+        while True:
+            time.sleep(min(self.idle_timeout, 30))
+            with self._lock:
+                if not self._loaded():
+                    return
+                if self._active or time.monotonic() - self._last_used < self.idle_timeout:
+                    continue
+                resources = self._take()
+            self._release(resources)
+            return
+
+    def shutdown(self):
+        with self._lock:
+            resources = self._take()
+        self._release(resources)
+
+
+def _spawn_pool(max_workers: int, **kwargs) -> ProcessPoolExecutor:
+    # Spawned, not forked: the server process runs threads (MCP loop, ingestion workers)
+    # whose locks a forked child could inherit in a held state.
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"), **kwargs)
+
+
+class PdfWorkerPool(_IdleResources):
+    """Worker processes that parse page ranges of large PDFs, started on first use and stopped when idle."""
+
+    def __init__(self, workers: int = 2, idle_timeout: float = 300):
+        super().__init__(idle_timeout)
+        self.workers = max(1, workers)
+        self._pool = None
+
+    @contextmanager
+    def pool(self):
+        with self._use():
+            with self._lock:
+                if self._pool is None:
+                    self._pool = _spawn_pool(self.workers)
+                pool = self._pool
+            yield pool
+
+    def _loaded(self) -> bool:
+        return self._pool is not None
+
+    def _take(self):
+        pool, self._pool = self._pool, None
+        return pool
+
+    def _release(self, pool):
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.logger.info("Stopped idle PDF worker processes")
+
+
+PDF_WORKERS = PdfWorkerPool(
+    workers=int(os.getenv("RAG_PDF_WORKERS", str(max(1, min(2, (os.cpu_count() or 2) - 1))))),
+    idle_timeout=float(os.getenv("RAG_PDF_IDLE_TIMEOUT", "300")),
+)
+
+
+class WhisperModelCache(_IdleResources):
+    """Holds the Whisper model (and the worker pool for long recordings) for the process lifetime.
+
+    Both are loaded on first use and dropped after idle_timeout seconds without a
+    transcription, so an idle MCP server gives the memory back.
+    """
+
+    def __init__(self, model_name: str = "base", idle_timeout: float = 600, workers: int = 2):
+        super().__init__(idle_timeout)
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self._model = None
+        self._pool = None
+        # One model instance is shared by every ingestion thread; Whisper models are not thread-safe.
+        self._transcribe_lock = threading.Lock()
+
+    @contextmanager
+    def model(self):
+        with self._use():
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = whisper.load_model(self.model_name)
+                    self.logger.info(f"Loaded Whisper model '{self.model_name}' in {time.perf_counter() - started:.2f}s")
+                model = self._model
+            yield model
+
+    def transcribe(self, audio, offset: float = 0.0) -> List[tuple]:
+        """Transcribe samples in this process, one call at a time."""
+        with self.model() as model, self._transcribe_lock:
+            return whisper_segments(model, audio, offset)
+
+    @contextmanager
+    def pool(self):
+        with self._use():
+            with self._lock:
+                if self._pool is None:
+                    torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+                    self._pool = _spawn_pool(self.workers, initializer=init_whisper_worker,
+                                             initargs=(self.model_name, torch_threads))
+                pool = self._pool
+            yield pool
+
+    def _loaded(self) -> bool:
+        return self._model is not None or self._pool is not None
+
+    def _take(self):
+        resources = (self._model, self._pool)
+        self._model, self._pool = None, None
+        return resources
+
+    def _release(self, resources):
+        model, pool = resources
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if model is not None or pool is not None:
+            self.logger.info(f"Evicted idle Whisper model '{self.model_name}'")
+
+
+WHISPER_MODELS = WhisperModelCache(
+    model_name=os.getenv("WHISPER_MODEL", "base"),
+    idle_timeout=float(os.getenv("WHISPER_IDLE_TIMEOUT", "600")),
+    workers=int(os.getenv("WHISPER_WORKERS", str(max(1, min(4, (os.cpu_count() or 2) // 2))))),
+)
+atexit.register(PDF_WORKERS.shutdown)
+atexit.register(WHISPER_MODELS.shutdown)
+
+
+# ------------------- Chunking Engines -------------------
+class CharChunker:
+    """Fixed-size character windows (the original chunking behaviour)."""
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def spans(self, text: str) -> List[tuple]:
+        if len(text) <= self.chunk_size:
+            return [(0, len(text))]
+        spans, start = [], 0
+        while start < len(text):
+            spans.append((start, min(start + self.chunk_size, len(text))))
+            start += self.chunk_size - self.chunk_overlap
+        return spans
+
+
+_CHUNK_BOUNDARIES = re.compile(
+    r"(?P<heading>\n+(?=#{1,6}\s))"
+    r"|(?P<paragraph>\n[ \t]*\n\s*)"
+    r"|(?P<item>\n(?=[ \t]*(?:[-*+]|\d+\.)\s))"
+    r"|(?P<sentence>(?<=[.!?])[\"')\]]*\s+)"
+)
+_BOUNDARY_WEIGHTS = {'heading': 4, 'paragraph': 3, 'item': 2, 'sentence': 1}
+
+
+class TokenChunker:
+    """Token-budgeted chunks cut at heading, paragraph, list-item or sentence boundaries.
+
+    The text is tokenized once with offsets and boundaries are found in a single regex
+    pass; both are then aligned with numpy, so packing never re-tokenizes candidate chunks.
+    Chunks never exceed the embedding model's sequence length, and overlap is in tokens.
+    """
+
+    def __init__(self, model_getter, max_tokens: int = None, overlap_tokens: int = 32):
+        self.model_getter = model_getter
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def _budget(self, model) -> int:
+        # Leave room for the [CLS]/[SEP] tokens the model adds around every input.
+        model_limit = (getattr(model, 'max_seq_length', None) or 256) - 2
+        return min(self.max_tokens or model_limit, model_limit)
+
+    @staticmethod
+    def boundaries(text: str):
+        """Return (char_offsets, weights) of every candidate boundary, in one pass."""
+        offsets, weights = [], []
+        for match in _CHUNK_BOUNDARIES.finditer(text):
+            offsets.append(match.end())
+            weights.append(_BOUNDARY_WEIGHTS[match.lastgroup])
+        return np.array(offsets, dtype=np.int64), np.array(weights, dtype=np.int8)
+
+    def spans(self, text: str) -> List[tuple]:
+        model = self.model_getter()
+        budget = self._budget(model)
+        encoding = model.tokenizer(text, return_offsets_mapping=True, add_special_tokens=False,
+                                   truncation=False, verbose=False)
+        token_offsets = np.array(encoding['offset_mapping'], dtype=np.int64).reshape(-1, 2)
+        token_count = len(token_offsets)
+        if token_count <= budget:
+            return [(0, len(text))]
+
+        boundary_chars, boundary_weights = self.boundaries(text)
+        # A boundary at char c ends a chunk before the first token starting at or after c.
+        boundary_tokens = np.searchsorted(token_offsets[:, 0], boundary_chars, side='left')
+        valid = (boundary_tokens > 0) & (boundary_tokens < token_count)
+        boundary_tokens, boundary_weights = boundary_tokens[valid], boundary_weights[valid]
+
+        overlap = min(self.overlap_tokens, budget // 2)
+        min_tokens = budget // 4
+        spans, start = [], 0
+        while start < token_count:
+            limit = start + budget
+            if limit >= token_count:
+                end = token_count
+            else:
+                lo = np.searchsorted(boundary_tokens, start + min_tokens, side='right')
+                hi = np.searchsorted(boundary_tokens, limit, side='right')
+                if lo < hi:
+                    candidates = boundary_weights[lo:hi]
+                    end = int(boundary_tokens[lo + np.flatnonzero(candidates == candidates.max())[-1]])
+                else:
+                    end = limit
+            char_end = len(text) if end >= token_count else int(token_offsets[end - 1, 1])
+            spans.append((int(token_offsets[start, 0]), char_end))
+            if end >= token_count:
+                break
+            next_start = max(end - overlap, start + 1)
+            # Prefer starting the overlap at a boundary inside the overlap window.
+            j = np.searchsorted(boundary_tokens, next_start, side='left')
+            if j < len(boundary_tokens) and boundary_tokens[j] < end:
+                next_start = int(boundary_tokens[j])
+            start = next_start
+        return spans
+
+
+class _ChunkBatchWriter:
+    """Packs chunk records from any number of documents into fixed-size embedding batches.
+
+    Chunks written for a document are tracked until it is committed, so a document that fails
+    partway can be discarded without leaving its earlier chunks behind.
+    """
+
+    def __init__(self, core: "RAGKnowledgeGraphCore", batch_size: int):
+        self.core = core
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+        self.pending_ids = set()
+        self.uncommitted = {}
+        self.embedded = 0
+        self.batches = 0
+
+    def add(self, chunk_id: str, chunk: str, chunk_meta: Dict[str, Any]):
+        if chunk_id in self.pending_ids:
+            return
+        self.pending_ids.add(chunk_id)
+        self.pending.append((chunk_id, chunk, chunk_meta))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending, self.pending_ids = self.pending, [], set()
+        try:
+            known_ids = self.core.existing_chunk_ids([chunk_id for chunk_id, _, _ in batch])
+            batch = [record for record in batch if record[0] not in known_ids]
+            if not batch:
+                return
+            embeddings = self.core.generate_embeddings([chunk for _, chunk, _ in batch])
+            self.core.collection.add(embeddings=embeddings, documents=[chunk for _, chunk, _ in batch],
+                                     metadatas=[meta for _, _, meta in batch], ids=[chunk_id for chunk_id, _, _ in batch])
+        except Exception:
+            # Keep the batch: it can hold chunks of documents other than the one that will be discarded.
+            self.pending = batch + self.pending
+            self.pending_ids = {record[0] for record in self.pending}
+            raise
+        for chunk_id, _, chunk_meta in batch:
+            self.uncommitted.setdefault(chunk_meta['document_id'], []).append(chunk_id)
+        self.core.lexical_index.add([(chunk_id, chunk) for chunk_id, chunk, _ in batch])
+        self.core.mark_written()
+        self.core.update_knowledge_graph(batch)
+        self.embedded += len(batch)
+        self.batches += 1
+
+    def commit(self, doc_id: str):
+        self.uncommitted.pop(doc_id, None)
+
+    def discard(self, doc_id: str):
+        """Drop a document's pending chunks and delete the ones already written."""
+        self.pending = [record for record in self.pending if record[2]['document_id'] != doc_id]
+        self.pending_ids = {record[0] for record in self.pending}
+        written = self.uncommitted.pop(doc_id, None)
+        if not written:
+            return
+        found = self.core.collection.get(ids=written, include=['documents', 'metadatas'])
+        records = list(zip(found['ids'], found['documents'], found['metadatas']))
+        self.core.collection.delete(ids=written)
+        self.core.lexical_index.remove([(chunk_id, chunk) for chunk_id, chunk, _ in records])
+        self.core.update_knowledge_graph(records, remove=True)
+        self.core.mark_written()
+        self.embedded -= len(written)
+
+
+class _SectionStream:
+    """Sections handed from an extraction thread to the ingesting thread through a bounded buffer."""
+
+    _END = object()
+
+    def __init__(self, max_buffered: int = 8):
+        self._queue = queue.Queue(maxsize=max_buffered)
+        self._closed = threading.Event()
+
+    def _put(self, item) -> bool:
+        # Time out now and then so a producer whose consumer went away can stop.
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(self, sections):
+        try:
+            for section in sections:
+                if not self._put(section):
+                    return
+            self._put((self._END, None))
+        except Exception as e:
+            self._put((self._END, e))
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item[0] is self._END:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+
+    def close(self):
+        self._closed.set()
+
+
+# ------------------- Lexical Index -------------------
+_LEXICAL_TOKEN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+RRF_K = 60
+# Query terms looked up per statement; SQLite allows only 999 host parameters before 3.32.
+_TERMS_PER_STATEMENT = 500
+
+
+def lexical_terms(text: str) -> List[str]:
+    """Lower-cased terms; identifiers such as REQ-101 or v2.1 stay a single term."""
+    return _LEXICAL_TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """Inverted index kept in the collection's metadata database and scored with Okapi BM25."""
+
+    def __init__(self, conn: sqlite3.Connection, read_conn, k1: float = 1.5, b: float = 0.75):
+        self.conn = conn
+        self.read_conn = read_conn
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS postings (
+                    term TEXT, chunk_id TEXT, tf INTEGER, PRIMARY KEY (term, chunk_id)
+                ) WITHOUT ROWID
+            ''')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS chunk_lengths (chunk_id TEXT PRIMARY KEY, length INTEGER)')
+
+    def add(self, chunks: List[tuple]):
+        """Index (chunk_id, text) pairs; re-adding a chunk replaces its postings."""
+        postings, lengths = [], []
+        for chunk_id, text in chunks:
+            terms = lexical_terms(text)
+            lengths.append((chunk_id, len(terms)))
+            postings.extend((term, chunk_id, tf) for term, tf in Counter(terms).items())
+        with self._lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO chunk_lengths VALUES (?, ?)', lengths)
+            self.conn.executemany('INSERT OR REPLACE INTO postings VALUES (?, ?, ?)', postings)
+
+    def remove(self, chunks: List[tuple]):
+        """Drop the postings of (chunk_id, text) pairs."""
+        postings = [(term, chunk_id) for chunk_id, text in chunks for term in set(lexical_terms(text))]
+        with self._lock, self.conn:
+            self.conn.executemany('DELETE FROM postings WHERE term = ? AND chunk_id = ?', postings)
+            self.conn.executemany('DELETE FROM chunk_lengths WHERE chunk_id = ?', [(chunk_id,) for chunk_id, _ in chunks])
+
+    def size(self) -> int:
+        return self.read_conn().execute('SELECT COUNT(*) FROM chunk_lengths').fetchone()[0]
+
+    def clear(self):
+        with self._lock, self.conn:
+            self.conn.execute('DELETE FROM postings')
+            self.conn.execute('DELETE FROM chunk_lengths')
+
+    def search(self, query_text: str, n: int) -> List[tuple]:
+        """Return up to n (chunk_id, score) pairs, best first."""
+        terms = list(dict.fromkeys(lexical_terms(query_text)))
+        if not terms:
+            return []
+        conn = self.read_conn()
+        total, avg_length = conn.execute('SELECT COUNT(*), AVG(length) FROM chunk_lengths').fetchone()
+        if not total:
+            return []
+        rows = []
+        for i in range(0, len(terms), _TERMS_PER_STATEMENT):
+            batch = terms[i:i + _TERMS_PER_STATEMENT]
+            rows.extend(conn.execute(
+                f'SELECT p.term, p.chunk_id, p.tf, l.length FROM postings p '
+                f'JOIN chunk_lengths l ON l.chunk_id = p.chunk_id WHERE p.term IN ({",".join("?" * len(batch))})', batch
+            ).fetchall())
+        doc_freq = Counter(term for term, _, _, _ in rows)
+        scores = {}
+        for term, chunk_id, tf, length in rows:
+            idf = np.log1p((total - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / (avg_length or 1))
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + float(idf * tf * (self.k1 + 1) / norm)
+        return heapq.nlargest(n, scores.items(), key=lambda item: item[1])
+
+
+# ------------------- Query Caches -------------------
+class LRUCache:
+    """Thread-safe LRU mapping with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+# Query embeddings depend only on the model and the query text, so they are shared by all collections.
+QUERY_EMBEDDINGS = LRUCache(maxsize=int(os.getenv("RAG_QUERY_EMBEDDING_CACHE_SIZE", "1024")))
+
+
+# ------------------- Query Log -------------------
+_INTERACTION_COLUMNS = {
+    'collection': 'TEXT', 'top_k': 'INTEGER', 'embed_ms': 'REAL', 'search_ms': 'REAL',
+    'total_ms': 'REAL', 'distances': 'TEXT', 'cache_hit': 'INTEGER',
+}
+_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class _QueryLogWriter:
+    """Buffers interaction rows and writes them in batches from a background thread,
+    so logging never adds a SQLite commit to the query path."""
+
+    def __init__(self, db_path: str, flush_interval: float = 1.0, max_batch: int = 500):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.queue = queue.Queue(maxsize=10000)
+        self.dropped = 0
+        self.logger = logging.getLogger(__name__)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def log(self, row: tuple):
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0):
+        """Block until everything logged so far has been written."""
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        while True:
+            items = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.max_batch and not isinstance(items[-1], threading.Event):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    items.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            rows = [item for item in items if not isinstance(item, threading.Event)]
+            if rows:
+                try:
+                    with conn:
+                        conn.executemany(
+                            'INSERT INTO interactions (id, query, response, relevant_chunks, timestamp, confidence_score, '
+                            'collection, top_k, embed_ms, search_ms, total_ms, distances, cache_hit) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                except sqlite3.Error as e:
+                    self.logger.error(f"Error writing query log: {e}")
+            for item in items:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+
+# ------------------- Knowledge Graph Extraction -------------------
+_ENTITY_PATTERN = re.compile(
+    r"\b(?P<identifier>[A-Z][A-Z0-9]*(?:[-_.][A-Z0-9]+)+)\b"
+    r"|\b(?P<acronym>[A-Z]{2,}[0-9]*)\b"
+    r"|\b(?P<phrase>[A-Z][a-z]+(?:\s+(?:(?:of|and|for|&)\s+)?[A-Z][a-z]+)+)\b"
+)
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_LEADING_STOPWORDS = {'The', 'This', 'These', 'That', 'Those', 'A', 'An', 'Our', 'We', 'Each', 'Every', 'All', 'Any'}
+_MAX_ENTITIES_PER_SENTENCE = 12
+
+
+def extract_entities_and_relations(text: str):
+    """Cheap rule-based extraction: identifiers, acronyms and capitalised phrases become
+    entities, and entities mentioned in the same sentence are related."""
+    entities, relations = {}, []
+    for sentence in _SENTENCE_SPLIT.split(text):
+        found = []
+        for match in _ENTITY_PATTERN.finditer(sentence):
+            label, entity_type = match.group(), match.lastgroup
+            if entity_type == 'phrase':
+                words = label.split()
+                if words[0] in _LEADING_STOPWORDS:
+                    words = words[1:]
+                if len(words) < 2:
+                    continue
+                label = " ".join(words)
+            entities.setdefault(label, entity_type)
+            if label not in found:
+                found.append(label)
+        found = found[:_MAX_ENTITIES_PER_SENTENCE]
+        relations.extend(itertools.combinations(sorted(found), 2))
+    return entities, relations
+
+
+def _merge_graph_delta(graph: nx.DiGraph, delta: Dict[str, Any]):
+    """Apply a knowledge-graph delta; counts and weights are increments, so deltas replay in order.
+
+    Negative increments retract an earlier delta: edges left without weight are removed, and so
+    are nodes left without a count or any edge.
+    """
+    for node, attrs in delta.get('nodes', {}).items():
+        if graph.has_node(node):
+            graph.nodes[node]['count'] = graph.nodes[node].get('count', 0) + attrs.get('count', 0)
+        else:
+            graph.add_node(node, **attrs)
+    for source, target, attrs in delta.get('edges', []):
+        if graph.has_edge(source, target):
+            graph[source][target]['weight'] = graph[source][target].get('weight', 0) + attrs.get('weight', 0)
+        else:
+            graph.add_edge(source, target, **attrs)
+        if graph[source][target]['weight'] <= 0:
+            graph.remove_edge(source, target)
+    for node in delta.get('nodes', {}):
+        if graph.has_node(node) and graph.nodes[node].get('count', 0) <= 0 and not graph.degree(node):
+            graph.remove_node(node)
+
+
 # ------------------- Core RAG + Knowledge Graph -------------------
 class RAGKnowledgeGraphCore:
     """Core RAG and Knowledge Graph functionality for CrewAI tools."""
 
+    SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt', '.jpg', '.jpeg', '.png', '.mp3', '.wav')
+
     _instances = {}
+    _instances_lock = threading.Lock()
 
     def __new__(cls, collection_name: str = "default_collection", **kwargs):
-        if collection_name not in cls._instances:
-            instance = super(RAGKnowledgeGraphCore, cls).__new__(cls)
-            cls._instances[collection_name] = instance
-            instance._initialized = False
-        return cls._instances[collection_name]
+        with cls._instances_lock:
+            if collection_name not in cls._instances:
+                instance = super(RAGKnowledgeGraphCore, cls).__new__(cls)
+                cls._instances[collection_name] = instance
+                instance._initialized = False
+            return cls._instances[collection_name]
 
     def __init__(self,
                  collection_name: str = "default_collection",
@@ -59,7 +755,17 @@ class RAGKnowledgeGraphCore:
                  knowledge_graph_path: str = "./knowledge_graph.json",
                  embedding_model: str = "all-MiniLM-L6-v2",
                  chunk_size: int = 1000,
-                 chunk_overlap: int = 200):
+                 chunk_overlap: int = 200,
+                 embedding_batch_size: int = 64,
+                 pdf_parallel_threshold: int = 40,
+                 pdf_pages_per_task: int = 25,
+                 stream_buffer_chars: int = 20000,
+                 audio_window_seconds: float = 300,
+                 audio_window_overlap_seconds: float = 5,
+                 chunking: str = "token",
+                 chunk_size_tokens: int = None,
+                 chunk_overlap_tokens: int = 32,
+                 kg_compact_bytes: int = 8 * 1024 * 1024):
 
         if hasattr(self, '_initialized') and self._initialized:
             return
@@ -69,11 +775,24 @@ class RAGKnowledgeGraphCore:
         self.knowledge_graph_path = knowledge_graph_path
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.embedding_batch_size = embedding_batch_size
+        self.pdf_parallel_threshold = pdf_parallel_threshold
+        self.pdf_pages_per_task = pdf_pages_per_task
+        self.stream_buffer_chars = stream_buffer_chars
+        self.audio_window_seconds = audio_window_seconds
+        self.audio_window_overlap_seconds = audio_window_overlap_seconds
+        self._thread_local = threading.local()
+        self.write_generation = 0
+        self.kg_compact_bytes = kg_compact_bytes
+        self._kg_lock = threading.RLock()
+        self._backfill_lock = threading.Lock()
+        self.result_cache = LRUCache(maxsize=int(os.getenv("RAG_RESULT_CACHE_SIZE", "256")))
 
         logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
         self.logger = logging.getLogger(__name__)
 
-        self.embedding_model = SentenceTransformer(embedding_model)
+        self.embedding_model_name = embedding_model
+        self.chunker = self._create_chunker(chunking, chunk_size_tokens, chunk_overlap_tokens)
 
         os.makedirs(self.vector_db_path, exist_ok=True)
         self.chroma_client = chromadb.PersistentClient(path=self.vector_db_path)
@@ -106,32 +825,160 @@ class RAGKnowledgeGraphCore:
                 upload_date TEXT, content_hash TEXT, chunk_count INTEGER, metadata TEXT
             )
         ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_content_hash ON documents(content_hash)')
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS interactions (
                 id TEXT PRIMARY KEY, query TEXT, response TEXT,
                 relevant_chunks TEXT, timestamp TEXT, confidence_score REAL
             )
         ''')
+        existing_columns = {row[1] for row in cursor.execute('PRAGMA table_info(interactions)')}
+        for column, column_type in _INTERACTION_COLUMNS.items():
+            if column not in existing_columns:
+                cursor.execute(f'ALTER TABLE interactions ADD COLUMN {column} {column_type}')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_interactions_total_ms ON interactions(collection, total_ms)')
         self.conn.commit()
+        self.query_log = _QueryLogWriter(self.db_path)
+        self.lexical_index = BM25Index(self.conn, self._read_conn)
+
+    @property
+    def kg_path(self) -> str:
+        return f"{self.knowledge_graph_path.replace('.json', '')}_{self.collection_name}.json"
+
+    @property
+    def kg_delta_path(self) -> str:
+        return self.kg_path.replace('.json', '.deltas.jsonl')
 
     def load_existing_data(self):
         try:
             self.logger.info(f"Connected to ChromaDB collection '{self.collection.name}' with {self.collection.count()} items.")
-            kg_path = f"{self.knowledge_graph_path.replace('.json', '')}_{self.collection_name}.json"
-            if os.path.exists(kg_path):
-                with open(kg_path, 'r') as f:
+            if os.path.exists(self.kg_path):
+                with open(self.kg_path, 'r') as f:
                     graph_data = json.load(f)
                     self.knowledge_graph = nx.node_link_graph(graph_data)
+            if os.path.exists(self.kg_delta_path):
+                with open(self.kg_delta_path, 'r') as f:
+                    for line in f:
+                        if line.strip():
+                            _merge_graph_delta(self.knowledge_graph, json.loads(line))
+                if os.path.getsize(self.kg_delta_path) > self.kg_compact_bytes:
+                    self.compact_knowledge_graph()
+            if self.knowledge_graph.number_of_nodes():
                 self.logger.info(f"Loaded knowledge graph with {self.knowledge_graph.number_of_nodes()} nodes")
         except Exception as e:
             self.logger.error(f"Error loading existing data: {e}")
 
+    # --- Knowledge Graph ---
+    def update_knowledge_graph(self, records: List[tuple], remove: bool = False):
+        """Extract entities from newly stored chunks and append the graph delta to the log.
+
+        With remove=True the delta retracts what the same chunks added, for chunks being deleted.
+        """
+        nodes, edges = {}, {}
+        for _, chunk, chunk_meta in records:
+            entities, relations = extract_entities_and_relations(chunk)
+            doc_node = f"doc:{chunk_meta.get('document_id')}"
+            if entities and doc_node not in nodes:
+                nodes[doc_node] = {'type': 'document', 'label': chunk_meta.get('filename') or doc_node, 'count': 0}
+            for label, entity_type in entities.items():
+                node = nodes.setdefault(label, {'type': entity_type, 'label': label, 'count': 0})
+                node['count'] += 1
+                edges.setdefault((doc_node, label), {'relation': 'mentions', 'weight': 0})['weight'] += 1
+            for source, target in relations:
+                edges.setdefault((source, target), {'relation': 'co_occurs', 'weight': 0})['weight'] += 1
+        if not nodes:
+            return
+
+        if remove:
+            for attrs in itertools.chain(nodes.values(), edges.values()):
+                attrs['count' if 'count' in attrs else 'weight'] *= -1
+        delta = {'nodes': nodes, 'edges': [[source, target, attrs] for (source, target), attrs in edges.items()]}
+        with self._kg_lock:
+            _merge_graph_delta(self.knowledge_graph, delta)
+            with open(self.kg_delta_path, 'a') as f:
+                f.write(json.dumps(delta) + "\n")
+
+    def compact_knowledge_graph(self):
+        """Fold the delta log into a fresh node-link snapshot."""
+        with self._kg_lock:
+            tmp_path = self.kg_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(nx.node_link_data(self.knowledge_graph), f)
+            os.replace(tmp_path, self.kg_path)
+            if os.path.exists(self.kg_delta_path):
+                os.remove(self.kg_delta_path)
+
+    def visualize_knowledge_graph(self, output_file: str = None, max_nodes: int = 150) -> str:
+        graph = self.knowledge_graph
+        if graph.number_of_nodes() == 0:
+            return f"Knowledge graph for '{self.collection_name}' is empty"
+
+        output_file = output_file or os.path.join("output", f"knowledge_graph_{self.collection_name}.html")
+        os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+
+        # Pick the best-connected nodes straight off the degree view and render a subgraph view of them.
+        with self._kg_lock:
+            top_nodes = [node for node, _ in heapq.nlargest(max_nodes, graph.degree, key=lambda item: item[1])]
+            subgraph = graph.subgraph(top_nodes)
+            net = Network(height="750px", width="100%", directed=True)
+            for node, attrs in subgraph.nodes(data=True):
+                net.add_node(node, label=attrs.get('label', node), title=attrs.get('type', ''),
+                             value=attrs.get('count', 1) or 1, group=attrs.get('type', 'entity'))
+            for source, target, attrs in subgraph.edges(data=True):
+                net.add_edge(source, target, title=attrs.get('relation', ''), value=attrs.get('weight', 1))
+        net.write_html(output_file)
+        return (f"Knowledge graph visualization saved to {output_file} "
+                f"({len(top_nodes)} of {graph.number_of_nodes()} nodes)")
+
+    def clear_database(self):
+        """Remove every vector, document record, query log entry and graph node of this collection."""
+        self.chroma_client.delete_collection(self.collection_name)
+        self.collection = self.chroma_client.get_or_create_collection(
+            name=self.collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+        self.query_log.flush()
+        with self.conn:
+            self.conn.execute('DELETE FROM documents')
+            self.conn.execute('DELETE FROM interactions')
+        self.lexical_index.clear()
+        with self._kg_lock:
+            self.knowledge_graph = nx.DiGraph()
+            for path in (self.kg_path, self.kg_delta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.mark_written()
+
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+        return EMBEDDING_MODELS.get(self.embedding_model_name)
+
     # --- Extractors (pdf, docx, image OCR, audio, etc.) ---
+    def iter_pdf_pages(self, file_path: str):
+        """Yield (page_number, text) as pages are parsed; large PDFs are split across processes."""
+        with open(file_path, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            page_count = len(pdf_reader.pages)
+            if page_count <= self.pdf_parallel_threshold:
+                for page_number, page in enumerate(pdf_reader.pages, start=1):
+                    yield page_number, page.extract_text() or ""
+                return
+
+        with PDF_WORKERS.pool() as pool:
+            futures = [pool.submit(extract_pdf_page_range, file_path, start,
+                                   min(start + self.pdf_pages_per_task, page_count))
+                       for start in range(0, page_count, self.pdf_pages_per_task)]
+            try:
+                # Ranges are consumed in order, so early pages flow on while later ranges are still parsing.
+                for future in futures:
+                    yield from future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
     def extract_text_from_pdf(self, file_path: str) -> str:
         try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                return "".join(page.extract_text() + "\n" for page in pdf_reader.pages)
+            return "".join(text + "\n" for _, text in self.iter_pdf_pages(file_path))
         except Exception as e:
             self.logger.error(f"Error extracting text from PDF: {e}")
             return ""
@@ -153,38 +1000,47 @@ class RAGKnowledgeGraphCore:
             self.logger.error(f"Error extracting text from image: {e}")
             return ""
 
+    def iter_audio_segments(self, file_path: str):
+        """Yield (text, {'start_time', 'end_time'}) segments in order as they are transcribed.
+
+        Recordings longer than audio_window_seconds are split into windows that are
+        transcribed in parallel by the Whisper worker processes. Neighbouring windows overlap
+        by audio_window_overlap_seconds so words at a boundary are heard whole by one of them;
+        each segment is kept only from the window whose side of the overlap's midpoint it starts on.
+        """
+        audio = whisper.load_audio(file_path)
+        rate = whisper.audio.SAMPLE_RATE
+        window = int(self.audio_window_seconds * rate)
+        if len(audio) <= window:
+            yield from WHISPER_MODELS.transcribe(audio, 0.0)
+            return
+
+        overlap = min(int(self.audio_window_overlap_seconds * rate), window // 2)
+        starts = list(range(0, len(audio) - overlap, window - overlap))
+        cuts = [(start + overlap / 2) / rate for start in starts[1:]]
+        with WHISPER_MODELS.pool() as pool:
+            futures = [pool.submit(transcribe_audio_window, audio[start:start + window], start / rate)
+                       for start in starts]
+            try:
+                for i, future in enumerate(futures):
+                    lower = cuts[i - 1] if i else float('-inf')
+                    upper = cuts[i] if i < len(cuts) else float('inf')
+                    yield from (segment for segment in future.result()
+                                if lower <= segment[1]['start_time'] < upper)
+            finally:
+                for future in futures:
+                    future.cancel()
+
     def transcribe_audio(self, file_path: str) -> str:
         if not whisper:
             return ""
         try:
-            model = whisper.load_model("base")
-            result = model.transcribe(file_path)
-            return result["text"]
+            return "".join(text for text, _ in self.iter_audio_segments(file_path))
         except Exception as e:
             self.logger.error(f"Error transcribing audio: {e}")
             return ""
 
-    # --- Chunking + Embeddings ---
-    def chunk_text(self, text: str) -> List[str]:
-        if len(text) <= self.chunk_size:
-            return [text]
-        chunks, start = [], 0
-        while start < len(text):
-            end = start + self.chunk_size
-            chunk = text[start:end].strip()
-            if chunk: chunks.append(chunk)
-            start += self.chunk_size - self.chunk_overlap
-        return chunks
-
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
-        return self.embedding_model.encode(texts).tolist()
-
-    # --- Ingestion Methods ---
-    def ingest_document(self, file_path: str, metadata: Dict = None) -> str:
-        doc_id = str(uuid.uuid4())
-        filename = os.path.basename(file_path)
-        file_type = os.path.splitext(filename)[1].lower()
-
+    def _extractor_for(self, file_type: str):
         text_extractors = {
             '.pdf': self.extract_text_from_pdf,
             '.docx': self.extract_text_from_docx,
@@ -193,80 +1049,568 @@ class RAGKnowledgeGraphCore:
             '.png': self.extract_text_from_image,
             '.mp3': self.transcribe_audio, '.wav': self.transcribe_audio,
         }
+        return text_extractors.get(file_type)
 
-        if file_type not in text_extractors:
+    def iter_sections(self, file_path: str, file_type: str):
+        """Yield (text, location) sections of a file; location feeds chunk metadata (e.g. page numbers)."""
+        if file_type == '.pdf':
+            for page_number, text in self.iter_pdf_pages(file_path):
+                yield text + "\n", {'page': page_number}
+            return
+        if file_type in ('.mp3', '.wav') and whisper:
+            yield from self.iter_audio_segments(file_path)
+            return
+        extractor = self._extractor_for(file_type)
+        if extractor is None:
             raise ValueError(f"Unsupported file type: {file_type}")
+        yield extractor(file_path), {}
 
-        text = text_extractors[file_type](file_path)
-        if not text.strip():
-            raise ValueError("No text could be extracted")
+    # --- Chunking + Embeddings ---
+    def _create_chunker(self, chunking: str, chunk_size_tokens: int, chunk_overlap_tokens: int):
+        if chunking == 'char':
+            return CharChunker(self.chunk_size, self.chunk_overlap)
+        if chunking == 'token':
+            return TokenChunker(lambda: self.embedding_model, chunk_size_tokens, chunk_overlap_tokens)
+        raise ValueError(f"Unknown chunking strategy: {chunking}")
+
+    def chunk_spans(self, text: str) -> List[tuple]:
+        if isinstance(self.chunker, TokenChunker) and not getattr(self.embedding_model.tokenizer, 'is_fast', False):
+            self.logger.warning("Tokenizer has no offset mapping; falling back to character chunking")
+            self.chunker = CharChunker(self.chunk_size, self.chunk_overlap)
+        return self.chunker.spans(text)
+
+    def chunk_text(self, text: str) -> List[str]:
+        chunks = [text[start:end].strip() for start, end in self.chunk_spans(text)]
+        return [chunk for chunk in chunks if chunk]
+
+    @staticmethod
+    def _span_metadata(first: Dict[str, Any], last: Dict[str, Any]) -> Dict[str, Any]:
+        meta = {}
+        if 'page' in first:
+            meta['page_start'] = first['page']
+            meta['page_end'] = last.get('page', first['page'])
+        if 'start_time' in first:
+            meta['start_time'] = first['start_time']
+            meta['end_time'] = last.get('end_time', first.get('end_time'))
+        return meta
+
+    def iter_chunks(self, sections):
+        """Chunk a stream of (text, location) sections without holding the whole document.
 
-        chunks = self.chunk_text(text)
-        embeddings = self.generate_embeddings(chunks)
-        chunk_ids = [str(uuid.uuid4()) for _ in chunks]
-        chunk_metadatas = []
-        for i, chunk in enumerate(chunks):
+        Text is buffered until it spans several chunks; chunks that end before the buffer
+        does are emitted, and the rest is carried over to be completed by later sections.
+        """
+        buffer, offsets, locations = "", [], []
+
+        def emit(spans):
+            for start, end in spans:
+                chunk = buffer[start:end].strip()
+                if chunk:
+                    first = locations[bisect.bisect_right(offsets, start) - 1]
+                    last = locations[bisect.bisect_right(offsets, max(start, end - 1)) - 1]
+                    yield chunk, self._span_metadata(first, last)
+
+        for text, location in sections:
+            if not text:
+                continue
+            offsets.append(len(buffer))
+            locations.append(location)
+            buffer += text
+            if len(buffer) < self.stream_buffer_chars:
+                continue
+            spans = self.chunk_spans(buffer)
+            complete = [span for span in spans if span[1] < len(buffer)]
+            if not complete:
+                continue
+            yield from emit(complete)
+            cut = spans[len(complete)][0]
+            keep = bisect.bisect_right(offsets, cut) - 1
+            buffer = buffer[cut:]
+            offsets = [0] + [offset - cut for offset in offsets[keep + 1:]]
+            locations = locations[keep:]
+
+        if buffer:
+            yield from emit(self.chunk_spans(buffer))
+
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self.embedding_model.encode(texts).tolist()
+
+    # --- Ingestion Methods ---
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.md5(text.encode()).hexdigest()
+
+    @staticmethod
+    def file_hash(file_path: str) -> str:
+        digest = hashlib.md5()
+        with open(file_path, 'rb') as file:
+            for block in iter(lambda: file.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _read_conn(self) -> sqlite3.Connection:
+        """Per-thread read connection, so extraction workers can look up hashes concurrently."""
+        conn = getattr(self._thread_local, 'conn', None)
+        if conn is None:
+            conn = self._thread_local.conn = sqlite3.connect(self.db_path)
+        return conn
+
+    def find_document_by_hash(self, content_hash: str):
+        row = self._read_conn().execute(
+            'SELECT id FROM documents WHERE content_hash = ? LIMIT 1', (content_hash,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def existing_chunk_ids(self, chunk_ids: List[str]) -> set:
+        if not chunk_ids:
+            return set()
+        return set(self.collection.get(ids=chunk_ids, include=[])['ids'])
+
+    def _document_chunks(self, doc_id: str, sections, filename: str = None, file_type: str = 'text',
+                         metadata: Dict = None):
+        created_at = datetime.now().isoformat()
+        for i, (chunk, location) in enumerate(self.iter_chunks(sections)):
+            # Chunk ids hash the content within its document: re-ingesting a document reuses its chunks,
+            # while a chunk repeated in another document gets its own record and provenance.
+            chunk_id = self.content_hash(f"{doc_id}:{chunk}")
             chunk_meta = {
-                'chunk_id': chunk_ids[i], 'document_id': doc_id, 'chunk_index': i,
-                'filename': filename, 'file_type': file_type, 'created_at': datetime.now().isoformat(),
+                'chunk_id': chunk_id, 'document_id': doc_id, 'chunk_index': i,
+                'file_type': file_type, 'created_at': created_at,
             }
+            chunk_meta.update(location)
+            if filename: chunk_meta['filename'] = filename
             if metadata: chunk_meta.update(metadata)
-            chunk_metadatas.append(chunk_meta)
+            yield chunk_id, chunk, chunk_meta
 
-        self.collection.add(embeddings=embeddings, documents=chunks, metadatas=chunk_metadatas, ids=chunk_ids)
+    def _ingest_sections(self, writer: _ChunkBatchWriter, content_hash: str, sections, filename: str = None,
+                         file_type: str = 'text', metadata: Dict = None) -> tuple:
+        """Stream a document's chunks into the writer and return its documents row."""
+        doc_id = content_hash
+        chunk_count = 0
+        for record in self._document_chunks(doc_id, sections, filename, file_type, metadata):
+            writer.add(*record)
+            chunk_count += 1
+        if not chunk_count:
+            raise ValueError("No text could be extracted")
+        return (doc_id, filename, file_type, datetime.now().isoformat(),
+                content_hash, chunk_count, json.dumps(metadata or {}))
 
-        cursor = self.conn.cursor()
-        cursor.execute('INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)',
-                       (doc_id, filename, file_type, datetime.now().isoformat(),
-                        hashlib.md5(text.encode()).hexdigest(), len(chunks), json.dumps(metadata or {})))
-        self.conn.commit()
+    def _record_documents(self, rows: List[tuple]):
+        if not rows:
+            return
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def _ingest(self, content_hash: str, sections, filename: str = None, file_type: str = 'text',
+                metadata: Dict = None) -> Dict[str, Any]:
+        """Ingest one document idempotently; unchanged content is never extracted or re-embedded."""
+        existing_doc_id = self.find_document_by_hash(content_hash)
+        if existing_doc_id:
+            self.logger.info(f"Skipping ingestion of unchanged content (document {existing_doc_id})")
+            return {'doc_id': existing_doc_id, 'status': 'unchanged', 'chunks': 0, 'new_chunks': 0}
+
+        writer = _ChunkBatchWriter(self, self.embedding_batch_size)
+        try:
+            row = self._ingest_sections(writer, content_hash, sections(), filename, file_type, metadata)
+            writer.flush()
+        except Exception:
+            writer.discard(content_hash)
+            raise
+        self._record_documents([row])
+
+        return {'doc_id': row[0], 'status': 'ingested', 'chunks': row[5], 'new_chunks': writer.embedded}
+
+    def ingest_document(self, file_path: str, metadata: Dict = None) -> Dict[str, Any]:
+        filename = os.path.basename(file_path)
+        file_type = os.path.splitext(filename)[1].lower()
+        if file_type not in self.SUPPORTED_EXTENSIONS:
+            raise ValueError(f"Unsupported file type: {file_type}")
+        return self._ingest(self.file_hash(file_path), lambda: self.iter_sections(file_path, file_type),
+                            filename, file_type, metadata)
+
+    def ingest_text_idea(self, idea_text: str, metadata: Dict = None) -> Dict[str, Any]:
+        return self._ingest(self.content_hash(idea_text), lambda: [(idea_text, {})], metadata=metadata)
+
+    def _check_file(self, file_path: str):
+        """Hash a file and look it up among ingested documents."""
+        filename = os.path.basename(file_path)
+        file_type = os.path.splitext(filename)[1].lower()
+        if file_type not in self.SUPPORTED_EXTENSIONS:
+            raise ValueError(f"Unsupported file type: {file_type}")
+        content_hash = self.file_hash(file_path)
+        return filename, file_type, content_hash, self.find_document_by_hash(content_hash)
+
+    def _extract_file(self, file_path: str, checked: Future, stream: _SectionStream):
+        """Worker step for batch ingestion: check the file, then stream its sections unless already ingested."""
+        try:
+            info = self._check_file(file_path)
+        except Exception as e:
+            checked.set_exception(e)
+            return
+        checked.set_result(info)
+        if not info[3]:
+            stream.produce(self.iter_sections(file_path, info[1]))
+
+    def _iter_extracted(self, file_paths: List[str], max_workers: int):
+        """Yield (path, extraction or exception) in order while up to max_workers later files extract ahead.
+
+        Each file is extracted by a pool worker into a _SectionStream, so later files are parsed while
+        the caller chunks and embeds earlier ones, and the streams' bounded buffers keep every document
+        from being held in memory whole.
+        """
+        pending_paths = iter(file_paths)
+        window = deque()
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+
+            def start(path):
+                checked, stream = Future(), _SectionStream()
+                pool.submit(self._extract_file, path, checked, stream)
+                window.append((path, checked, stream))
+
+            try:
+                for path in itertools.islice(pending_paths, max_workers):
+                    start(path)
+                while window:
+                    path, checked, stream = window.popleft()
+                    # Files are yielded in submission order, so the stream being consumed always holds
+                    # a worker; the file started here queues behind it and the ones already running.
+                    next_path = next(pending_paths, None)
+                    if next_path is not None:
+                        start(next_path)
+                    try:
+                        filename, file_type, content_hash, existing_doc_id = checked.result()
+                    except Exception as e:
+                        yield path, e
+                        continue
+                    try:
+                        yield path, (filename, file_type, content_hash, existing_doc_id,
+                                     None if existing_doc_id else stream)
+                    finally:
+                        stream.close()
+            finally:
+                for _, _, stream in window:
+                    stream.close()
+
+    def ingest_batch(self, file_paths: List[str], metadata: Dict = None,
+                     batch_size: int = None, max_workers: int = 4) -> Dict[str, Any]:
+        """Ingest many files, packing chunks from all of them into shared embedding batches."""
+        started = time.perf_counter()
+        writer = _ChunkBatchWriter(self, batch_size or self.embedding_batch_size)
+        results, rows, seen_hashes = [], [], set()
+
+        for path, extracted in self._iter_extracted(file_paths, max(1, max_workers)):
+            if isinstance(extracted, Exception):
+                self.logger.error(f"Error extracting {path}: {extracted}")
+                results.append({'file': path, 'status': 'error', 'error': str(extracted)})
+                continue
+            filename, file_type, content_hash, existing_doc_id, sections = extracted
+            if existing_doc_id or content_hash in seen_hashes:
+                results.append({'file': path, 'status': 'unchanged', 'doc_id': existing_doc_id or content_hash})
+                continue
+            try:
+                row = self._ingest_sections(writer, content_hash, sections, filename, file_type, metadata)
+            except Exception as e:
+                self.logger.error(f"Error ingesting {path}: {e}")
+                writer.discard(content_hash)
+                results.append({'file': path, 'status': 'error', 'error': str(e)})
+                continue
+            writer.commit(content_hash)
+            seen_hashes.add(content_hash)
+            rows.append(row)
+            results.append({'file': path, 'status': 'ingested', 'doc_id': row[0], 'chunks': row[5]})
+
+        writer.flush()
+        self._record_documents(rows)
+
+        elapsed = time.perf_counter() - started
+        total_chunks = sum(r.get('chunks', 0) for r in results)
+        stats = {
+            'files': len(results),
+            'ingested': sum(r['status'] == 'ingested' for r in results),
+            'unchanged': sum(r['status'] == 'unchanged' for r in results),
+            'errors': sum(r['status'] == 'error' for r in results),
+            'chunks': total_chunks,
+            'embedded_chunks': writer.embedded,
+            'embedding_batches': writer.batches,
+            'elapsed_seconds': round(elapsed, 3),
+            'files_per_second': round(len(results) / elapsed, 2) if elapsed else None,
+            'chunks_per_second': round(total_chunks / elapsed, 2) if elapsed else None,
+        }
+        return {'results': results, 'stats': stats}
+
+    def ingest_directory(self, directory: str, recursive: bool = False, **kwargs) -> Dict[str, Any]:
+        if recursive:
+            paths = [os.path.join(root, name) for root, _, names in os.walk(directory) for name in names]
+        else:
+            paths = [os.path.join(directory, name) for name in os.listdir(directory)]
+        file_paths = sorted(p for p in paths
+                            if os.path.isfile(p) and os.path.splitext(p)[1].lower() in self.SUPPORTED_EXTENSIONS)
+        return self.ingest_batch(file_paths, **kwargs)
+
+    @staticmethod
+    def _dedupe_results(results: Dict[str, Any], top_k: int) -> Dict[str, Any]:
+        """Drop hits whose text repeats a better-ranked hit, keeping at most top_k."""
+        documents = (results.get('documents') or [[]])[0]
+        keep, seen = [], set()
+        for i, document in enumerate(documents):
+            key = hashlib.md5((document or '').strip().encode()).hexdigest()
+            if key in seen:
+                continue
+            seen.add(key)
+            keep.append(i)
+            if len(keep) == top_k:
+                break
+        deduped = dict(results)
+        for field in ('ids', 'documents', 'metadatas', 'distances', 'scores', 'embeddings', 'uris', 'data'):
+            values = results.get(field)
+            if values is not None and len(values):
+                deduped[field] = [[values[0][i] for i in keep]]
+        return deduped
+
+    def mark_written(self):
+        """Bump the write generation; cached results from earlier generations are never served."""
+        self.write_generation += 1
+        self.result_cache.clear()
+
+    def _normalize_query(self, query_text: str) -> str:
+        normalized = " ".join(query_text.split())
+        # Lower-casing only when the tokenizer does it anyway keeps the embedding identical.
+        if getattr(self.embedding_model.tokenizer, 'do_lower_case', False):
+            normalized = normalized.lower()
+        return normalized
 
-        return doc_id
+    def embed_query(self, query_text: str) -> List[float]:
+        key = (self.embedding_model_name, self._normalize_query(query_text))
+        embedding = QUERY_EMBEDDINGS.get(key)
+        if embedding is None:
+            embedding = self.generate_embeddings([key[1]])[0]
+            QUERY_EMBEDDINGS.put(key, embedding)
+        return embedding
 
-    def ingest_text_idea(self, idea_text: str, metadata: Dict = None) -> str:
-        doc_id = str(uuid.uuid4())
-        chunks = self.chunk_text(idea_text)
-        embeddings = self.generate_embeddings(chunks)
-        chunk_ids = [str(uuid.uuid4()) for _ in chunks]
-        self.collection.add(embeddings=embeddings, documents=chunks, ids=chunk_ids)
-        return doc_id
+    def ensure_lexical_index(self, count: int):
+        """Backfill the inverted index from chunks stored before it existed."""
+        if self.lexical_index.size() >= count:
+            return
+        with self._backfill_lock:
+            if self.lexical_index.size() >= count:
+                return
+            self.logger.info(f"Building lexical index for {count} chunks in '{self.collection_name}'")
+            for offset in range(0, count, 1000):
+                page = self.collection.get(include=['documents'], limit=1000, offset=offset)
+                self.lexical_index.add(list(zip(page['ids'], page['documents'])))
 
-    def query(self, query_text: str, top_k: int = 5) -> Dict[str, Any]:
-        if self.collection.count() == 0:
+    def _lexical_search(self, query_text: str, n: int) -> Dict[str, Any]:
+        hits = self.lexical_index.search(query_text, n)
+        if not hits:
+            return {'ids': [[]], 'documents': [[]], 'metadatas': [[]], 'scores': [[]]}
+        found = self.collection.get(ids=[chunk_id for chunk_id, _ in hits], include=['documents', 'metadatas'])
+        by_id = {chunk_id: (doc, meta) for chunk_id, doc, meta in zip(found['ids'], found['documents'], found['metadatas'])}
+        hits = [(chunk_id, score) for chunk_id, score in hits if chunk_id in by_id]
+        return {
+            'ids': [[chunk_id for chunk_id, _ in hits]],
+            'documents': [[by_id[chunk_id][0] for chunk_id, _ in hits]],
+            'metadatas': [[by_id[chunk_id][1] for chunk_id, _ in hits]],
+            'scores': [[round(score, 6) for _, score in hits]],
+        }
+
+    @staticmethod
+    def _fuse_results(vector: Dict[str, Any], lexical: Dict[str, Any]) -> Dict[str, Any]:
+        """Reciprocal rank fusion of the dense and BM25 rankings."""
+        fused, records, distances = {}, {}, {}
+        for results in (vector, lexical):
+            for rank, chunk_id in enumerate(results['ids'][0]):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+                records.setdefault(chunk_id, (results['documents'][0][rank], results['metadatas'][0][rank]))
+        for chunk_id, distance in zip(vector['ids'][0], (vector.get('distances') or [[]])[0] or []):
+            distances[chunk_id] = distance
+        ranked = sorted(fused, key=fused.get, reverse=True)
+        return {
+            'ids': [ranked],
+            'documents': [[records[chunk_id][0] for chunk_id in ranked]],
+            'metadatas': [[records[chunk_id][1] for chunk_id in ranked]],
+            'distances': [[distances.get(chunk_id) for chunk_id in ranked]],
+            'scores': [[round(fused[chunk_id], 6) for chunk_id in ranked]],
+        }
+
+    def query(self, query_text: str, top_k: int = 5, mode: str = "vector") -> Dict[str, Any]:
+        """Retrieve top_k chunks by dense similarity ("vector"), BM25 ("bm25") or both fused ("hybrid")."""
+        if mode not in ('vector', 'bm25', 'hybrid'):
+            raise ValueError(f"Unknown query mode: {mode}")
+        started = time.perf_counter()
+        count = self.collection.count()
+        if count == 0:
             return {"response": "Empty KB."}
-        query_embedding = self.generate_embeddings([query_text])
-        results = self.collection.query(query_embeddings=query_embedding, n_results=top_k)
+        if mode == 'bm25':
+            query_key = self._normalize_query(query_text)
+        else:
+            query_embedding = self.embed_query(query_text)
+            query_key = hashlib.md5(np.asarray(query_embedding, dtype=np.float32).tobytes()).hexdigest()
+            if mode == 'hybrid':
+                query_key = (query_key, self._normalize_query(query_text))
+        embedded = time.perf_counter()
+        # The item count also guards against writes made by another process on the same store.
+        cache_key = (self.write_generation, count, top_k, mode, query_key)
+        results = self.result_cache.get(cache_key)
+        cache_hit = results is not None
+        if not cache_hit:
+            # Over-fetch so that collapsing duplicate chunks still fills top_k slots.
+            if mode != 'bm25':
+                results = self.collection.query(query_embeddings=[query_embedding], n_results=top_k * 2)
+            if mode != 'vector':
+                self.ensure_lexical_index(count)
+                lexical = self._lexical_search(query_text, top_k * 2)
+                results = lexical if mode == 'bm25' else self._fuse_results(results, lexical)
+            results = self._dedupe_results(results, top_k)
+            self.result_cache.put(cache_key, results)
+        finished = time.perf_counter()
+        self._log_query(query_text, top_k, results, cache_hit,
+                        embed_ms=(embedded - started) * 1000, search_ms=(finished - embedded) * 1000,
+                        total_ms=(finished - started) * 1000)
         return results
 
+    def _log_query(self, query_text: str, top_k: int, results: Dict[str, Any], cache_hit: bool,
+                   embed_ms: float, search_ms: float, total_ms: float):
+        ids = (results.get('ids') or [[]])[0]
+        distances = [float(d) for d in ((results.get('distances') or [[]])[0] or []) if d is not None]
+        # Collections use cosine distance, so 1 - best distance is the best cosine similarity.
+        confidence = 1.0 - min(distances) if distances else None
+        self.query_log.log((
+            str(uuid.uuid4()), query_text, None, json.dumps(ids), datetime.now().isoformat(), confidence,
+            self.collection_name, top_k, round(embed_ms, 3), round(search_ms, 3), round(total_ms, 3),
+            json.dumps(distances), int(cache_hit),
+        ))
+
+    def query_stats(self, limit: int = 10) -> Dict[str, Any]:
+        """Latency percentiles, histogram and slowest queries from the query log."""
+        self.query_log.flush()
+        conn = self._read_conn()
+        rows = conn.execute(
+            'SELECT embed_ms, search_ms, total_ms, cache_hit FROM interactions '
+            'WHERE collection = ? AND total_ms IS NOT NULL', (self.collection_name,)
+        ).fetchall()
+        if not rows:
+            return {'collection_name': self.collection_name, 'queries': 0}
+
+        latencies = np.array(rows, dtype=float)
+
+        def percentiles(column):
+            p50, p95, p99 = np.percentile(latencies[:, column], [50, 95, 99])
+            return {'p50': round(float(p50), 3), 'p95': round(float(p95), 3), 'p99': round(float(p99), 3)}
+
+        bucket_counts = np.bincount(np.searchsorted(_LATENCY_BUCKETS_MS, latencies[:, 2]),
+                                    minlength=len(_LATENCY_BUCKETS_MS) + 1)
+        bucket_labels = [f"<={bound}ms" for bound in _LATENCY_BUCKETS_MS] + [f">{_LATENCY_BUCKETS_MS[-1]}ms"]
+        slowest = conn.execute(
+            'SELECT query, total_ms, embed_ms, search_ms, timestamp, cache_hit FROM interactions '
+            'WHERE collection = ? AND total_ms IS NOT NULL ORDER BY total_ms DESC LIMIT ?',
+            (self.collection_name, limit)
+        ).fetchall()
+        return {
+            'collection_name': self.collection_name,
+            'queries': len(rows),
+            'cache_hit_rate': round(float(latencies[:, 3].mean()), 3),
+            'total_ms': percentiles(2),
+            'embed_ms': percentiles(0),
+            'search_ms': percentiles(1),
+            'histogram_ms': dict(zip(bucket_labels, bucket_counts.tolist())),
+            'slowest': [
+                {'query': q, 'total_ms': t, 'embed_ms': e, 'search_ms': s, 'timestamp': ts, 'cache_hit': bool(h)}
+                for q, t, e, s, ts, h in slowest
+            ],
+            'dropped_log_entries': self.query_log.dropped,
+        }
+
     def get_stats(self) -> Dict[str, Any]:
         return {
             'documents': self.collection.count(),
             'collection_name': self.collection_name,
             'kg_nodes': self.knowledge_graph.number_of_nodes(),
-            'kg_edges': self.knowledge_graph.number_of_edges()
+            'kg_edges': self.knowledge_graph.number_of_edges(),
+            'embedding_model': self.embedding_model_name,
+            'embedding_models': EMBEDDING_MODELS.stats(),
+            'write_generation': self.write_generation,
+            'query_embedding_cache': QUERY_EMBEDDINGS.stats(),
+            'result_cache': self.result_cache.stats(),
+            'lexical_index_chunks': self.lexical_index.size(),
         }
 
 
+# ------------------- Remote Files -------------------
+REMOTE_FILE_CACHE = os.getenv("RAG_REMOTE_FILE_CACHE", "./memory/remote_files")
+BLOB_PATH_RE = re.compile(r"/blobs/([0-9a-f]{64})(?:/|$)")
+
+
+def is_remote_path(file_path: str) -> bool:
+    return urlparse(file_path).scheme in ('http', 'https')
+
+
+def fetch_remote_file(url: str, timeout: float = 60.0) -> str:
+    """Stream a file from an http(s) url into the local cache and return its path.
+
+    Blob-store urls carry the content digest, so a blob that was fetched before is served from the
+    cache without a download, and a download whose SHA-256 does not match is rejected with
+    ValueError. The file name (and so the extension) is kept for type detection.
+    """
+    parsed = urlparse(url)
+    name = os.path.basename(unquote(parsed.path)) or 'download'
+    blob = BLOB_PATH_RE.search(parsed.path)
+    key = blob.group(1) if blob else hashlib.sha256(url.encode()).hexdigest()
+    local_path = os.path.join(REMOTE_FILE_CACHE, key, name)
+    if os.path.exists(local_path):
+        return local_path
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(local_path), prefix='.download-')
+    digest = hashlib.sha256()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response, os.fdopen(fd, 'wb') as tmp:
+            for chunk in iter(lambda: response.read(1024 * 1024), b''):
+                digest.update(chunk)
+                tmp.write(chunk)
+        if blob and digest.hexdigest() != key:
+            raise ValueError(f"Content of {url} does not match its digest (got {digest.hexdigest()})")
+        os.replace(tmp_path, local_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    logging.getLogger(__name__).info(f"Fetched {url} to {local_path}")
+    return local_path
+
+
+def resolve_file_path(file_path: str) -> str:
+    return fetch_remote_file(file_path) if is_remote_path(file_path) else file_path
+
+
 # ------------------- Tool Definition -------------------
 @mcp.tool()
 def knowledge_base_manager_tool(
         action: str,
         collection_name: str = "default_collection",
         file_path: str = None,
+        file_paths: List[str] = None,
+        directory: str = None,
+        recursive: bool = False,
+        batch_size: int = 64,
+        max_workers: int = 4,
         text: str = None,
         query_text: str = None,
         metadata: str = None,
         top_k: int = 5,
+        mode: str = "vector",
         output_file: str = None,
         max_nodes: int = 150,
+        limit: int = 10,
         confirm: bool = False
 ) -> str:
     """
     Manage the RAG knowledge base:
-    - ingest_document (needs file_path)
+    - ingest_document (needs file_path; a local path or an http(s) url)
+    - ingest_batch (needs file_paths; local paths or http(s) urls; optional batch_size, max_workers)
+    - ingest_directory (needs directory; optional recursive, batch_size, max_workers)
     - ingest_text (needs text)
-    - query (needs query_text)
+    - query (needs query_text; optional mode: vector, bm25 or hybrid)
     - get_stats
+    - query_stats (optional limit: number of slowest queries to list)
     - visualize
     - clear
     """
@@ -279,37 +1623,76 @@ def knowledge_base_manager_tool(
             metadata = {}
 
     if action == 'ingest_document':
+        if file_path and is_remote_path(file_path):
+            try:
+                file_path = fetch_remote_file(file_path)
+            except Exception as e:
+                return f"Error: could not fetch {file_path}: {e}"
         if not file_path or not os.path.exists(file_path):
             return f"Error: invalid file path {file_path}"
-        doc_id = rag_core.ingest_document(file_path, metadata)
-        return f"Document ingested with ID: {doc_id}"
+        result = rag_core.ingest_document(file_path, metadata)
+        if result['status'] == 'unchanged':
+            return f"Document unchanged, already ingested with ID: {result['doc_id']}"
+        return f"Document ingested with ID: {result['doc_id']} ({result['new_chunks']}/{result['chunks']} new chunks)"
+
+    elif action == 'ingest_batch':
+        if not file_paths:
+            return "Error: missing file_paths"
+        if isinstance(file_paths, str):
+            try:
+                file_paths = json.loads(file_paths)
+            except Exception:
+                file_paths = [p.strip() for p in file_paths.split(',') if p.strip()]
+        try:
+            file_paths = [resolve_file_path(p) for p in file_paths]
+        except Exception as e:
+            return f"Error: could not fetch remote file: {e}"
+        result = rag_core.ingest_batch(file_paths, metadata, batch_size=batch_size, max_workers=max_workers)
+        return json.dumps(result)
+
+    elif action == 'ingest_directory':
+        if not directory or not os.path.isdir(directory):
+            return f"Error: invalid directory {directory}"
+        result = rag_core.ingest_directory(directory, recursive=recursive, metadata=metadata,
+                                           batch_size=batch_size, max_workers=max_workers)
+        return json.dumps(result)
 
     elif action == 'ingest_text':
         if not text:
             return "Error: missing text"
-        doc_id = rag_core.ingest_text_idea(text, metadata)
-        return f"Text ingested with ID: {doc_id}"
+        result = rag_core.ingest_text_idea(text, metadata)
+        if result['status'] == 'unchanged':
+            return f"Text unchanged, already ingested with ID: {result['doc_id']}"
+        return f"Text ingested with ID: {result['doc_id']} ({result['new_chunks']}/{result['chunks']} new chunks)"
 
     elif action == 'query':
         if not query_text:
             return "Error: missing query_text"
-        result = rag_core.query(query_text, top_k)
+        if mode not in ('vector', 'bm25', 'hybrid'):
+            return f"Error: invalid mode {mode}"
+        result = rag_core.query(query_text, top_k, mode)
         return json.dumps(result)
 
     elif action == 'get_stats':
         return json.dumps(rag_core.get_stats())
 
+    elif action == 'query_stats':
+        return json.dumps(rag_core.query_stats(limit))
+
     elif action == 'visualize':
         return rag_core.visualize_knowledge_graph(output_file, max_nodes)
 
     elif action == 'clear':
         if not confirm:
             return "Error: confirm=True required"
-        rag_core.clear_database(collection_name)
+        rag_core.clear_database()
         return f"Knowledge base '{collection_name}' cleared successfully"
 
     return f"Error: unknown action '{action}'"
 
 
 if __name__ == "__main__":
+    # Spawned workers re-run the main script unless it looks like a package's __main__; they only
+    # need extraction_workers, so skip importing the whole server into each of them.
+    sys.modules["__main__"].__spec__ = importlib.machinery.ModuleSpec("__main__", None)
     mcp.run(transport="stdio")
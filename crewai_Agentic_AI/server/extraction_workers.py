@@ -0,0 +1,43 @@
+"""Process-pool workers for Rag_tools.
+
+Kept apart from Rag_tools so spawned workers import PyPDF2 (and Whisper, for audio) only,
+not the vector store, the embedding models or the MCP server.
+"""
+from typing import List
+
+import PyPDF2
+
+try:
+    import whisper
+except ImportError:
+    whisper = None
+
+
+def extract_pdf_page_range(file_path: str, start: int, end: int) -> List[tuple]:
+    """Parse pages [start, end) and return (page_number, text) pairs."""
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(i + 1, pdf_reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+
+_whisper_model = None
+
+
+def init_whisper_worker(model_name: str, torch_threads: int):
+    """Initializer: load Whisper once per worker for the life of the pool."""
+    global _whisper_model
+    import torch
+    torch.set_num_threads(torch_threads)
+    _whisper_model = whisper.load_model(model_name)
+
+
+def whisper_segments(model, audio, offset: float) -> List[tuple]:
+    result = model.transcribe(audio, fp16=False)
+    return [(segment["text"], {'start_time': round(offset + float(segment["start"]), 2),
+                               'end_time': round(offset + float(segment["end"]), 2)})
+            for segment in result.get("segments", [])]
+
+
+def transcribe_audio_window(audio, offset: float) -> List[tuple]:
+    """Transcribe one window of samples, with timestamps shifted by offset."""
+    return whisper_segments(_whisper_model, audio, offset)
@@ -0,0 +1,202 @@
+import os
+import time
+import asyncio
+import itertools
+import logging
+import sqlite3
+import threading
+from typing import Dict, List
+
+from a2a.server.context import ServerCallContext
+from a2a.server.tasks import InMemoryTaskStore, TaskStore
+from a2a.types import Task, TaskState
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = {TaskState.completed, TaskState.canceled, TaskState.failed, TaskState.rejected}
+
+
+class SQLiteTaskStore(TaskStore):
+    """Task store in a WAL-mode SQLite file that several agents and worker processes can share.
+
+    Saves are coalesced in memory and written in batches by a background thread; a task reaching a
+    terminal state is written immediately, and a batch that fails to write is queued again. Terminal
+    tasks older than ttl_seconds are evicted, and so are tasks abandoned in a non-terminal state
+    (their agent process died mid-run) once they have not changed for stale_ttl_seconds.
+    """
+
+    def __init__(self, db_path: str = "./memory/a2a_tasks.db", namespace: str = "default",
+                 ttl_seconds: float = 24 * 3600, stale_ttl_seconds: float = 7 * 24 * 3600,
+                 flush_interval: float = 0.05, eviction_interval: float = 300.0, max_retry_delay: float = 5.0):
+        self.db_path = db_path
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.stale_ttl_seconds = stale_ttl_seconds
+        self.flush_interval = flush_interval
+        self.eviction_interval = eviction_interval
+        self.max_retry_delay = max_retry_delay
+        self.batches = 0
+        self.written = 0
+        self.evicted = 0
+        self.write_errors = 0
+        self._pending: Dict[str, tuple] = {}
+        self._inflight: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flushed = threading.Condition(self._lock)
+        self._thread_local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    namespace TEXT, id TEXT, context_id TEXT, state TEXT,
+                    terminal INTEGER, updated_at REAL, data TEXT,
+                    PRIMARY KEY (namespace, id)
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_context ON tasks(namespace, context_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_expiry ON tasks(terminal, updated_at)')
+        self._writer = conn
+        threading.Thread(target=self._run, name=f"task-store-{namespace}", daemon=True).start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _read_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._thread_local, 'conn', None)
+        if conn is None:
+            conn = self._thread_local.conn = self._connect()
+        return conn
+
+    # --- TaskStore interface ---
+    async def save(self, task: Task, context: ServerCallContext | None = None) -> None:
+        terminal = task.status.state in TERMINAL_STATES
+        row = (self.namespace, task.id, task.context_id, task.status.state.value, int(terminal),
+               time.time(), task.model_dump_json(exclude_none=True))
+        with self._lock:
+            self._pending[task.id] = row
+        if terminal:
+            self._wake.set()
+
+    async def get(self, task_id: str, context: ServerCallContext | None = None) -> Task | None:
+        with self._lock:
+            row = self._pending.get(task_id) or self._inflight.get(task_id)
+        if row is not None:
+            return Task.model_validate_json(row[6])
+        data = await asyncio.to_thread(self._select_one, task_id)
+        return Task.model_validate_json(data) if data else None
+
+    async def delete(self, task_id: str, context: ServerCallContext | None = None) -> None:
+        with self._lock:
+            self._pending.pop(task_id, None)
+            self._inflight.pop(task_id, None)  # not requeued if its batch fails
+        await asyncio.to_thread(self._delete_one, task_id)
+
+    # --- Lookups ---
+    async def list_by_context(self, context_id: str) -> List[Task]:
+        """All tasks of a conversation, oldest first, including saves that are not written yet."""
+        with self._lock:
+            unwritten = [row for row in itertools.chain(self._inflight.values(), self._pending.values())
+                         if row[2] == context_id]
+        latest = {task_id: (updated_at, data)
+                  for task_id, updated_at, data in await asyncio.to_thread(self._select_context, context_id)}
+        for row in unwritten:
+            if row[5] >= latest.get(row[1], (0.0,))[0]:
+                latest[row[1]] = (row[5], row[6])
+        return [Task.model_validate_json(data) for _, data in sorted(latest.values(), key=lambda item: item[0])]
+
+    def _select_context(self, context_id: str):
+        return self._read_conn().execute(
+            'SELECT id, updated_at, data FROM tasks WHERE namespace = ? AND context_id = ?',
+            (self.namespace, context_id)
+        ).fetchall()
+
+    def _select_one(self, task_id: str):
+        row = self._read_conn().execute(
+            'SELECT data FROM tasks WHERE namespace = ? AND id = ?', (self.namespace, task_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _delete_one(self, task_id: str):
+        self.flush()  # so a batch already in flight cannot re-insert the task
+        with self._write_lock, self._writer:
+            self._writer.execute('DELETE FROM tasks WHERE namespace = ? AND id = ?', (self.namespace, task_id))
+
+    # --- Background writer ---
+    def flush(self, timeout: float = 5.0):
+        """Block until every save made so far is on disk."""
+        self._wake.set()
+        deadline = time.monotonic() + timeout
+        with self._flushed:
+            while (self._pending or self._inflight) and time.monotonic() < deadline:
+                self._flushed.wait(deadline - time.monotonic())
+
+    def _run(self):
+        last_eviction = 0.0
+        failures = 0
+        while True:
+            # Back off while the database keeps failing (locked for longer than the busy timeout, disk full).
+            self._wake.wait(min(self.flush_interval * 2 ** failures, self.max_retry_delay))
+            self._wake.clear()
+            with self._lock:
+                # Rows stay readable from _inflight until they are committed.
+                self._inflight, self._pending = self._pending, {}
+                rows = list(self._inflight.values())
+            failed = False
+            if rows:
+                try:
+                    with self._write_lock, self._writer:
+                        self._writer.executemany('INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                    self.batches += 1
+                    self.written += len(rows)
+                except sqlite3.Error as e:
+                    failed = True
+                    self.write_errors += 1
+                    logger.error(f"[SQLiteTaskStore] Error writing {len(rows)} tasks, will retry: {e}")
+            failures = min(failures + 1, 16) if failed else 0
+            with self._flushed:
+                if failed:
+                    # Requeue the batch; a save made meanwhile is newer and wins.
+                    for task_id, row in self._inflight.items():
+                        self._pending.setdefault(task_id, row)
+                self._inflight = {}
+                self._flushed.notify_all()
+            if self.ttl_seconds and time.monotonic() - last_eviction >= self.eviction_interval:
+                last_eviction = time.monotonic()
+                self._evict()
+
+    def _evict(self):
+        now = time.time()
+        try:
+            with self._write_lock, self._writer:
+                cursor = self._writer.execute(
+                    'DELETE FROM tasks WHERE (terminal = 1 AND updated_at < ?) OR (terminal = 0 AND updated_at < ?)',
+                    (now - self.ttl_seconds, now - max(self.stale_ttl_seconds, self.ttl_seconds))
+                )
+            if cursor.rowcount:
+                self.evicted += cursor.rowcount
+                logger.info(f"[SQLiteTaskStore] Evicted {cursor.rowcount} expired tasks")
+        except sqlite3.Error as e:
+            logger.error(f"[SQLiteTaskStore] Eviction failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {'pending': len(self._pending), 'batches': self.batches, 'written': self.written,
+                'evicted': self.evicted, 'write_errors': self.write_errors}
+
+
+def create_task_store(namespace: str) -> TaskStore:
+    """Task store selected by A2A_TASK_STORE ('sqlite', the default, or 'memory')."""
+    if os.getenv("A2A_TASK_STORE", "sqlite") == "memory":
+        return InMemoryTaskStore()
+    return SQLiteTaskStore(
+        db_path=os.getenv("A2A_TASK_DB", "./memory/a2a_tasks.db"),
+        namespace=namespace,
+        ttl_seconds=float(os.getenv("A2A_TASK_TTL_SECONDS", str(24 * 3600))),
+        stale_ttl_seconds=float(os.getenv("A2A_TASK_STALE_TTL_SECONDS", str(7 * 24 * 3600))),
+    )
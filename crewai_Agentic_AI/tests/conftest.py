@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The agents and the MCP server are run as scripts, so their modules import each other flat.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "server")]
@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+from Rag_tools import RAGKnowledgeGraphCore
+
+
+class SlowExtractor:
+    """Stands in for RAGKnowledgeGraphCore with an extractor that takes a fixed time per file."""
+
+    _extract_file = RAGKnowledgeGraphCore._extract_file
+    _iter_extracted = RAGKnowledgeGraphCore._iter_extracted
+
+    def __init__(self, seconds: float, ingested=()):
+        self.seconds = seconds
+        self.ingested = set(ingested)
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def _check_file(self, file_path):
+        if file_path.endswith(".bad"):
+            raise ValueError("Unsupported file type: .bad")
+        return os.path.basename(file_path), ".txt", file_path, file_path if file_path in self.ingested else None
+
+    def iter_sections(self, file_path, file_type):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(self.seconds)
+            yield f"text of {file_path}", {}
+        finally:
+            with self.lock:
+                self.running -= 1
+
+
+def consume(extractor, paths, max_workers):
+    results = []
+    for path, extracted in extractor._iter_extracted(paths, max_workers):
+        if isinstance(extracted, Exception):
+            results.append((path, "error"))
+        elif extracted[4] is None:
+            results.append((path, "unchanged"))
+        else:
+            results.append((path, [text for text, _ in extracted[4]]))
+            time.sleep(extractor.seconds / 4)  # chunking and embedding
+    return results
+
+
+def test_files_extract_concurrently():
+    extractor = SlowExtractor(seconds=0.2)
+    paths = [f"doc{i}.txt" for i in range(8)]
+    started = time.perf_counter()
+    results = consume(extractor, paths, max_workers=4)
+    elapsed = time.perf_counter() - started
+
+    assert results == [(path, [f"text of {path}"]) for path in paths]
+    assert extractor.peak > 1
+    assert extractor.peak <= 4
+    assert elapsed < len(paths) * extractor.seconds * 0.75
+
+
+def test_results_keep_order_with_errors_and_unchanged_files():
+    extractor = SlowExtractor(seconds=0.01, ingested={"old.txt"})
+    results = consume(extractor, ["a.txt", "x.bad", "old.txt", "b.txt"], max_workers=2)
+    assert results == [("a.txt", ["text of a.txt"]), ("x.bad", "error"), ("old.txt", "unchanged"),
+                       ("b.txt", ["text of b.txt"])]
+
+
+def test_abandoned_iteration_stops_producers():
+    extractor = SlowExtractor(seconds=0.05)
+    iterator = extractor._iter_extracted([f"doc{i}.txt" for i in range(6)], 3)
+    next(iterator)
+    iterator.close()
+    assert extractor.running == 0
@@ -0,0 +1,51 @@
+import asyncio
+import sqlite3
+
+from a2a.types import Task, TaskState, TaskStatus
+
+from task_store import SQLiteTaskStore
+
+
+def make_task(task_id: str, context_id: str, state: TaskState = TaskState.working) -> Task:
+    return Task(id=task_id, context_id=context_id, status=TaskStatus(state=state))
+
+
+def test_list_by_context_includes_unwritten_saves(tmp_path):
+    store = SQLiteTaskStore(db_path=str(tmp_path / "tasks.db"), flush_interval=3600)
+
+    async def scenario():
+        await store.save(make_task("t1", "ctx-a", TaskState.completed))  # terminal: written at once
+        store.flush()
+        await store.save(make_task("t2", "ctx-a"))
+        await store.save(make_task("t3", "ctx-b"))
+        await store.save(make_task("t1", "ctx-a", TaskState.failed))
+        return await store.list_by_context("ctx-a")
+
+    tasks = asyncio.run(scenario())
+    assert [task.id for task in tasks] == ["t2", "t1"]
+    assert tasks[1].status.state == TaskState.failed
+
+
+def test_list_by_context_reads_other_writers(tmp_path):
+    db_path = str(tmp_path / "tasks.db")
+    writer, reader = SQLiteTaskStore(db_path=db_path), SQLiteTaskStore(db_path=db_path)
+
+    async def scenario():
+        for i in range(3):
+            await writer.save(make_task(f"t{i}", "ctx"))
+        writer.flush()
+        return await reader.list_by_context("ctx"), await reader.list_by_context("other")
+
+    tasks, other = asyncio.run(scenario())
+    assert [task.id for task in tasks] == ["t0", "t1", "t2"]
+    assert other == []
+
+
+def test_context_lookup_uses_index(tmp_path):
+    db_path = str(tmp_path / "tasks.db")
+    SQLiteTaskStore(db_path=db_path)
+    plan = sqlite3.connect(db_path).execute(
+        'EXPLAIN QUERY PLAN SELECT id, updated_at, data FROM tasks WHERE namespace = ? AND context_id = ?',
+        ("default", "ctx")
+    ).fetchall()
+    assert any("idx_tasks_context" in row[-1] for row in plan)
@@ -0,0 +1,137 @@
+"""Micro-benchmark: artifact extraction from a remote agent's SendMessage response.
+
+Compares the previous model_dump_json -> json.loads round-trip with the typed extraction in
+host/artifacts.py, reporting CPU time per response (timeit) and peak allocations (tracemalloc).
+The typed path includes giving the inline file a deferred blob uri, as the host does; the
+"eager store" row decodes and stores the file on every response instead.
+
+    python benchmarks/bench_artifact_extraction.py [--kb 400] [--chunks 100] [--number 50]
+"""
+import os
+import json
+import base64
+import timeit
+import argparse
+import tempfile
+import tracemalloc
+import importlib.util
+
+from a2a.types import (
+    Artifact,
+    FilePart,
+    FileWithBytes,
+    Part,
+    SendMessageSuccessResponse,
+    Task,
+    TaskState,
+    TaskStatus,
+    TextPart,
+)
+
+
+def _load_host_module(name: str):
+    # Load host modules directly: importing the host package would start the host agent.
+    spec = importlib.util.spec_from_file_location(
+        f"host_{name}", os.path.join(os.path.dirname(__file__), "..", "host", f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+artifacts = _load_host_module("artifacts")
+blob_store = _load_host_module("blob_store")
+
+
+def build_response(total_kb: int, chunks: int, file_kb: int) -> SendMessageSuccessResponse:
+    """A completed task carrying a chunked BRD-sized text artifact and one inline file."""
+    line = "- The system shall record every stakeholder requirement with its source and priority.\n"
+    chunk_chars = total_kb * 1024 // chunks
+    text_chunk = (line * (chunk_chars // len(line) + 1))[:chunk_chars]
+    parts = [Part(root=TextPart(text=text_chunk)) for _ in range(chunks)]
+    file_bytes = base64.b64encode(os.urandom(file_kb * 1024)).decode()
+    task = Task(
+        id="task-1",
+        context_id="context-1",
+        status=TaskStatus(state=TaskState.completed),
+        artifacts=[
+            Artifact(artifact_id="brd", name="business_requirements", parts=parts),
+            Artifact(artifact_id="diagram", name="diagram",
+                     parts=[Part(root=FilePart(file=FileWithBytes(bytes=file_bytes, name="flow.png",
+                                                                  mime_type="image/png")))]),
+        ],
+    )
+    return SendMessageSuccessResponse(id="1", result=task)
+
+
+def extract_round_trip(response: SendMessageSuccessResponse):
+    """The previous implementation of HostAgent.send_message's response handling."""
+    json_content = json.loads(response.model_dump_json(exclude_none=True))
+    resp = []
+    if json_content.get("result", {}).get("artifacts"):
+        for artifact in json_content["result"]["artifacts"]:
+            if artifact.get("parts"):
+                resp.extend(artifact["parts"])
+    return resp
+
+
+def extract_typed(response: SendMessageSuccessResponse, store):
+    return artifacts.reference_files(artifacts.extract_task_parts(response.result), store)
+
+
+def extract_eager(response: SendMessageSuccessResponse, store):
+    """Typed extraction that decodes and stores every inline file whether or not it is read."""
+    parts = artifacts.extract_task_parts(response.result)
+    for part in parts:
+        if isinstance(part, artifacts.FilePartView):
+            digest, _ = store.put_bytes(part.content())
+            part["file"]["uri"] = store.url_for(digest, part["file"]["name"])
+    return parts
+
+
+def peak_allocation(func, response) -> int:
+    tracemalloc.start()
+    func(response)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--kb", type=int, default=400, help="size of the text artifact in KB")
+    parser.add_argument("--chunks", type=int, default=100, help="number of text chunks in the artifact")
+    parser.add_argument("--file-kb", type=int, default=256, help="size of the inline file part in KB")
+    parser.add_argument("--number", type=int, default=50, help="responses per timing run")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as blob_dir:
+        store = blob_store.BlobStore(blob_dir)
+        store.serve("localhost", 0)
+        try:
+            run(args, store)
+        finally:
+            store.shutdown()
+
+
+def run(args, store):
+    response = build_response(args.kb, args.chunks, args.file_kb)
+    old, new = extract_round_trip(response), extract_typed(response, store)
+    assert [p["text"] for p in old if p["kind"] == "text"] == [p["text"] for p in new if p["kind"] == "text"]
+    assert all("uri" in p["file"] and "bytes" not in p["file"] for p in new if p["kind"] == "file")
+
+    print(f"Response: {args.kb} KB text in {args.chunks} chunks + {args.file_kb} KB inline file")
+    print(f"{'path':<14}{'ms/response':>14}{'peak alloc KB':>16}")
+    results = {}
+    for label, func in (("round-trip", extract_round_trip),
+                        ("typed", lambda r: extract_typed(r, store)),
+                        ("eager store", lambda r: extract_eager(r, store))):
+        seconds = min(timeit.repeat(lambda: func(response), number=args.number, repeat=5)) / args.number
+        peak = peak_allocation(func, response)
+        results[label] = (seconds, peak)
+        print(f"{label:<14}{seconds * 1000:>14.3f}{peak / 1024:>16.1f}")
+    (old_s, old_peak), (new_s, new_peak) = results["round-trip"], results["typed"]
+    print(f"CPU {old_s / new_s:.1f}x faster, {(old_peak - new_peak) / 1024:.1f} KB less peak allocation")
+
+
+if __name__ == "__main__":
+    main()
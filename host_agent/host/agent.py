@@ -1,22 +1,29 @@
 import asyncio
+import contextvars
 import json
+import os
+import time
 import uuid
 import base64
 from datetime import datetime
-from typing import Any, AsyncIterable, List, Callable
+from typing import Any, AsyncIterable, List, Optional
 import mimetypes
 
-import httpx
 import nest_asyncio
-from a2a.client import A2ACardResolver, A2AClient
 from a2a.types import (
     AgentCard,
+    JSONRPCErrorResponse,
+    Message,
     MessageSendParams,
     SendMessageRequest,
     SendMessageResponse,
     SendMessageSuccessResponse,
+    SendStreamingMessageRequest,
+    SendStreamingMessageResponse,
+    SendStreamingMessageSuccessResponse,
     Task,
     TaskArtifactUpdateEvent,
+    TaskState,
     TaskStatusUpdateEvent,
 )
 from dotenv import load_dotenv
@@ -30,6 +37,19 @@ from google.adk.tools.tool_context import ToolContext
 from google.genai import types
 import logging
 
+from .artifacts import FilePartView, extract_task_parts, limit_text, part_views, reference_files
+from .blob_store import get_blob_store
+from .card_store import create_card_store
+from .pipeline import PipelineError, create_pipeline
+from .remote_agent_connection import (
+    RemoteAgentConnections,
+    RemoteAgentError,
+    close_shared_client,
+    error_response_error,
+    connection_pool_stats,
+    get_shared_client,
+)
+
 load_dotenv()
 nest_asyncio.apply()
 
@@ -37,42 +57,12 @@ nest_asyncio.apply()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# -------------------------------------------------------------------
-# RemoteAgentConnections
-# -------------------------------------------------------------------
-TaskCallbackArg = Task | TaskStatusUpdateEvent | TaskArtifactUpdateEvent
-TaskUpdateCallback = Callable[[TaskCallbackArg, AgentCard], Task]
-
-
-class RemoteAgentConnections:
-    """Holds the connections to remote agents."""
-
-    def __init__(self, agent_card: AgentCard, agent_url: str):
-        logger.info(f"Initializing connection - Agent: {agent_card.name}, URL: {agent_url}")
-        # Increase timeout for file uploads
-        self._httpx_client = httpx.AsyncClient(timeout=httpx.Timeout(120.0))  # 2 minutes
-        self.agent_client = A2AClient(self._httpx_client, agent_card, url=agent_url)
-        self.card = agent_card
-        self.conversation_name = None
-        self.conversation = None
-        self.pending_tasks = set()
-
-    def get_agent(self) -> AgentCard:
-        return self.card
-
-    async def send_message(
-        self, message_request: SendMessageRequest
-    ) -> SendMessageResponse:
-        """Send a message to the remote agent (task is created automatically)."""
-        try:
-            logger.info(f"Sending message to {self.card.name}")
-            response = await self.agent_client.send_message(message_request)
-            logger.info(f"Received response from {self.card.name}")
-            return response
-        except Exception as e:
-            logger.error(f"Error sending message to {self.card.name}: {e}")
-            raise
+# Terminal task states in which a remote agent produced no usable result.
+UNSUCCESSFUL_STATES = (TaskState.failed, TaskState.canceled, TaskState.rejected)
 
+# Set by HostAgent.stream for the request it runs; tools called by the runner inherit it and report
+# remote agents' progress through it as (agent_name, state, text).
+_progress_sink: contextvars.ContextVar = contextvars.ContextVar("host_progress_sink", default=None)
 
 # -------------------------------------------------------------------
 # HostAgent
@@ -84,6 +74,18 @@ class HostAgent:
         self.remote_agent_connections: dict[str, RemoteAgentConnections] = {}
         self.cards: dict[str, AgentCard] = {}
         self.agents: str = ""
+        self.remote_agent_addresses: List[str] = []
+        self.card_store = None
+        self.refresh_interval = float(os.getenv("HOST_CARD_REFRESH_INTERVAL", "30"))
+        self._cards_signature = None
+        self._refresh_task = None
+        self.fanout_timeout = float(os.getenv("HOST_FANOUT_TIMEOUT", "900"))
+        # Resends of a task an agent rejected as busy, each after the agent's retry_after (capped).
+        self.busy_retries = int(os.getenv("HOST_BUSY_RETRIES", "2"))
+        self.max_busy_wait = float(os.getenv("HOST_MAX_BUSY_WAIT", "30"))
+        # Text returned per remote response; 0 means unlimited.
+        self.max_response_chars = int(os.getenv("HOST_MAX_RESPONSE_CHARS", "0"))
+        self.pipeline = create_pipeline()
         self._agent = self.create_agent()
         self._user_id = "host_agent"
         self._runner = Runner(
@@ -95,22 +97,33 @@ class HostAgent:
         )
 
     async def _async_init_components(self, remote_agent_addresses: List[str]):
-        async with httpx.AsyncClient(timeout=httpx.Timeout(30.0)) as client:
-            for address in remote_agent_addresses:
-                card_resolver = A2ACardResolver(client, address)
-                try:
-                    logger.info(f"Getting agent card from {address}")
-                    card = await card_resolver.get_agent_card()
-                    remote_connection = RemoteAgentConnections(
-                        agent_card=card, agent_url=address
-                    )
-                    self.remote_agent_connections[card.name] = remote_connection
-                    self.cards[card.name] = card
-                    logger.info(f"Successfully connected to agent: {card.name}")
-                except httpx.ConnectError as e:
-                    logger.error(f"Connection error for {address}: {e}")
-                except Exception as e:
-                    logger.error(f"Failed to initialize connection for {address}: {e}")
+        self.remote_agent_addresses = list(remote_agent_addresses)
+        self.card_store = create_card_store(get_shared_client())
+        await self.refresh_agents(force=True)
+
+    async def refresh_agents(self, force: bool = False):
+        """Resolve all agent cards concurrently and update the connections if the set of cards changed."""
+        entries = await self.card_store.resolve_all(self.remote_agent_addresses, force=force)
+        signature = tuple((address, entry.digest) for address, entry in entries.items())
+        if signature == self._cards_signature:
+            return
+        self._cards_signature = signature
+
+        connections, cards = {}, {}
+        for address, entry in entries.items():
+            card = entry.card
+            existing = self.remote_agent_connections.get(card.name)
+            # Keep the connection (and its pending tasks) when the agent's card did not change.
+            if existing is not None and existing.card == card:
+                connections[card.name] = existing
+            else:
+                connections[card.name] = RemoteAgentConnections(agent_card=card, agent_url=address)
+                logger.info(f"Successfully connected to agent: {card.name}")
+            cards[card.name] = card
+        for name in self.remote_agent_connections.keys() - connections.keys():
+            logger.warning(f"Agent {name} is no longer available")
+        self.remote_agent_connections = connections
+        self.cards = cards
 
         agent_info = [
             json.dumps({"name": card.name, "description": card.description})
@@ -119,28 +132,62 @@ class HostAgent:
         logger.info(f"Available agents: {[card.name for card in self.cards.values()]}")
         self.agents = "\n".join(agent_info) if agent_info else "No agents found"
 
+    def _ensure_refresh(self):
+        """Keep a background card refresh running on the loop currently serving the host agent."""
+        if self.card_store is None or self.refresh_interval <= 0:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._refresh_task is None or self._refresh_task.done() or self._refresh_task.get_loop() is not loop:
+            self._refresh_task = loop.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_agents()
+            except Exception as e:
+                logger.error(f"Agent card refresh failed: {e}")
+
     @classmethod
     async def create(cls, remote_agent_addresses: List[str]):
         instance = cls()
         await instance._async_init_components(remote_agent_addresses)
         return instance
 
+    def connection_stats(self) -> dict[str, Any]:
+        """Metrics of the connection pool shared by all remote agents (active, idle, wait time)."""
+        return connection_pool_stats()
+
+    async def close(self):
+        """Stop the card refresh and close the pooled connections to the remote agents."""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+        await close_shared_client()
+
     def create_agent(self) -> Agent:
         return Agent(
             model="gemini-2.5-flash",
             name="Host_Agent",
             instruction=self.root_instruction,
             description="This Host agent orchestrates tasks and scheduling with remote agents.",
-            tools=[self.send_message],
+            tools=[self.send_message, self.send_message_many, self.run_pipeline],
         )
 
     def root_instruction(self, context: ReadonlyContext) -> str:
+        self._ensure_refresh()
         return f"""
         **Role:** You are the Host Agent, an expert orchestrator for task coordination and scheduling.
 
         **Directives:**
         * Analyze tasks and delegate to the right remote agents.
         * Use `send_message` to communicate with agents.
+        * When several agents can work independently (e.g. Market Analyst, Product Manager and Agile PM on the
+          same input), use `send_message_many` to contact them in one call instead of one after another.
+        * For a complete run from stakeholder input to sprint plan, use `run_pipeline`. If a run fails, call it
+          again with the returned run_id as `resume_run_id` to continue from the completed stages.
         * You may send multimodal inputs: text, images, PDFs, Word docs, or structured data.
         * Integrate responses into clear outputs (including multimodal artifacts).
         * Always show which agents you contacted and why.
@@ -169,39 +216,139 @@ class HostAgent:
                 session_id=session_id,
             )
         
+        # Runner events and remote agents' progress updates are merged into one queue, so progress
+        # is yielded while a tool is still waiting on a remote agent.
+        updates: asyncio.Queue = asyncio.Queue()
+
+        def on_progress(agent_name: str, state: str, text: str):
+            updates.put_nowait({"is_task_complete": False, "updates": f"{agent_name} ({state}): {text}"})
+
+        async def run():
+            _progress_sink.set(on_progress)
+            try:
+                async for event in self._runner.run_async(
+                    user_id=self._user_id, session_id=session.id, new_message=content
+                ):
+                    updates.put_nowait(_event_update(event))
+            except Exception as e:
+                logger.error(f"Error in stream processing: {e}")
+                updates.put_nowait({
+                    "is_task_complete": True,
+                    "content": [{"type": "text", "text": f"Error processing request: {str(e)}"}],
+                })
+            finally:
+                updates.put_nowait(None)
+
+        runner_task = asyncio.create_task(run())
         try:
-            async for event in self._runner.run_async(
-                user_id=self._user_id, session_id=session.id, new_message=content
-            ):
-                if event.is_final_response():
-                    response_parts = []
-                    if event.content and event.content.parts:
-                        for p in event.content.parts:
-                            if p.text:
-                                response_parts.append({"type": "text", "text": p.text})
-                            elif p.inline_data:
-                                response_parts.append({"type": "file", "file": p.inline_data})
-                    yield {
-                        "is_task_complete": True,
-                        "content": response_parts,
-                    }
-                else:
-                    yield {
-                        "is_task_complete": False,
-                        "updates": "The host agent is thinking...",
-                    }
-        except Exception as e:
-            logger.error(f"Error in stream processing: {e}")
-            yield {
-                "is_task_complete": True,
-                "content": [{"type": "text", "text": f"Error processing request: {str(e)}"}],
-            }
+            while (update := await updates.get()) is not None:
+                yield update
+        finally:
+            runner_task.cancel()
 
     async def send_message(self, agent_name: str, parts: list[dict], tool_context: ToolContext):
         """Sends a multimodal task to a remote agent."""
         logger.info(f"send_message called with agent_name: {agent_name}")
+        self._ensure_refresh()
+        try:
+            return await self._send_to_agent(agent_name, parts)
+        except RemoteAgentError as e:
+            return [{"type": "text", "text": str(e)}]
+
+    async def send_message_many(self, requests: list[dict], tool_context: ToolContext,
+                                timeout_s: Optional[float] = None):
+        """Sends tasks to several remote agents at once and waits for all of them.
+
+        Each request is {"agent_name": ..., "parts": [...]}. The agents work concurrently, so the call
+        takes as long as the slowest agent. Agents that have not answered within timeout_s seconds
+        (default: the host's fan-out timeout) are reported with status "timeout" and their tasks are
+        cancelled, while the others' results are still returned.
+        """
+        logger.info(f"send_message_many called for {[r.get('agent_name') for r in requests]}")
+        self._ensure_refresh()
+        started = time.perf_counter()
+        timeout = timeout_s if timeout_s and timeout_s > 0 else self.fanout_timeout
+
+        async def timed(request: dict, remote_task: dict):
+            """(parts, error, seconds), timed from when this agent's call starts rather than the fan-out."""
+            agent_started = time.perf_counter()
+            try:
+                parts, error = await self._send_to_agent(request["agent_name"], request.get("parts", []),
+                                                         remote_task), None
+            except Exception as e:
+                parts, error = None, e
+            return parts, error, round(time.perf_counter() - agent_started, 3)
+
+        results = [{"agent_name": r.get("agent_name"), "status": "timeout", "latency_seconds": None, "parts": []}
+                   for r in requests]
+        remote_tasks = [{} for _ in requests]
+        tasks = {asyncio.ensure_future(timed(request, remote_task)): (result, remote_task)
+                 for request, result, remote_task in zip(requests, results, remote_tasks)}
+        pending = set(tasks)
+        deadline = started + timeout
+        while pending and time.perf_counter() < deadline:
+            done, pending = await asyncio.wait(pending, timeout=deadline - time.perf_counter(),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result, _ = tasks[task]
+                parts, error, result["latency_seconds"] = task.result()
+                if error is None:
+                    result["status"], result["parts"] = "completed", parts
+                else:
+                    result["status"] = "error"
+                    text = str(error) if isinstance(error, RemoteAgentError) else \
+                        f"Error communicating with {result['agent_name']}: {error}"
+                    result["parts"] = [{"type": "text", "text": text}]
+                logger.info(f"send_message_many: {result['agent_name']} {result['status']} "
+                            f"in {result['latency_seconds']}s")
+        cancels = []
+        for task in pending:
+            task.cancel()
+            result, remote_task = tasks[task]
+            logger.warning(f"send_message_many: {result['agent_name']} did not answer within {timeout}s")
+            # Only streamed sends learn the task id before the result; a blocking send cannot be cancelled.
+            if "task_id" in remote_task:
+                cancels.append(self._cancel_remote_task(result["agent_name"], remote_task["task_id"]))
+        if cancels:
+            await asyncio.gather(*cancels)
+        return {"results": results, "wall_seconds": round(time.perf_counter() - started, 3)}
+
+    async def _cancel_remote_task(self, agent_name: str, task_id: str):
+        client = self.remote_agent_connections.get(agent_name)
+        if client is None:
+            return
+        try:
+            await asyncio.wait_for(client.cancel_task(task_id), timeout=10)
+        except Exception as e:
+            logger.warning(f"Could not cancel task {task_id} on {agent_name}: {e}")
+
+    async def run_pipeline(self, project_input: str, resume_run_id: str, tool_context: ToolContext):
+        """Runs the full Stakeholder -> (Market Analyst, Domain Expert) -> Business Analyst -> Product Manager
+        -> Agile PM pipeline, handing each stage's output to the stages that depend on it.
+
+        Pass an empty resume_run_id for a new run, or the run_id of a failed run to resume it without
+        repeating its completed stages.
+        """
+        logger.info(f"run_pipeline called (resume_run_id={resume_run_id or None})")
+        self._ensure_refresh()
+        try:
+            state = await self.pipeline.run(self._send_to_agent, project_input, run_id=resume_run_id or None)
+        except PipelineError as e:
+            return {"run_id": resume_run_id, "status": "error", "error": str(e)}
+        stages = {name: {key: value for key, value in result.items() if key != "output"}
+                  for name, result in state["stages"].items()}
+        outputs = {name: result["output"] for name, result in state["stages"].items() if result["output"]}
+        return {"run_id": state["run_id"], "status": state["status"], "seconds": state["seconds"],
+                "stages": stages, "outputs": outputs}
+
+    async def _send_to_agent(self, agent_name: str, parts: list[dict], remote_task: dict = None):
+        """Normalize the parts and send them to one remote agent; returns the response parts.
+
+        Raises RemoteAgentError when the agent cannot be reached or fails the task. When remote_task
+        is given, the remote task's id is stored in it under "task_id" as soon as it is known.
+        """
         logger.info(f"Parts received: {len(parts)} parts")
-        
+
         if agent_name not in self.remote_agent_connections:
             error_msg = f"Agent {agent_name} not found. Available agents: {list(self.remote_agent_connections.keys())}"
             logger.error(error_msg)
@@ -229,7 +376,8 @@ class HostAgent:
                     logger.error(f"Malformed file part: {part}")
                     raise ValueError(f"Malformed file part: {part}")
                 
-                file_data = part["file"]
+                # Copy, so the caller's part is left as it was passed in.
+                file_data = dict(part["file"]) if isinstance(part["file"], dict) else part["file"]
                 logger.info(f"File data keys: {list(file_data.keys()) if isinstance(file_data, dict) else 'Not a dict'}")
                 
                 # Handle different file data formats
@@ -245,6 +393,8 @@ class HostAgent:
                         mime_type, _ = mimetypes.guess_type(file_name)
                         file_data["mimeType"] = mime_type or "application/octet-stream"
                 
+                if isinstance(file_data, dict):
+                    file_data = await asyncio.to_thread(_offload_inline_bytes, file_data)
                 normalized_parts.append({"type": "file", "file": file_data})
 
             elif ptype == "data":
@@ -282,7 +432,7 @@ class HostAgent:
                     elif "uri" in inline_data:
                         file_info["uri"] = inline_data["uri"]
                     
-                    normalized_parts.append({"type": "file", "file": file_info})
+                    normalized_parts.append({"type": "file", "file": await asyncio.to_thread(_offload_inline_bytes, file_info)})
 
             else:
                 # Fallback: try to extract text
@@ -302,17 +452,31 @@ class HostAgent:
 
         # ------------------------------------------------
         context_id = str(uuid.uuid4())
-        message_id = str(uuid.uuid4())
-
-        payload = {
-            "message": {
-                "role": "user",
-                "parts": normalized_parts,
-                "messageId": message_id,
-                "contextId": context_id,
-            },
-        }
-
+        for attempt in range(self.busy_retries + 1):
+            message_id = str(uuid.uuid4())
+            payload = {
+                "message": {
+                    "role": "user",
+                    "parts": normalized_parts,
+                    "messageId": message_id,
+                    "contextId": context_id,
+                },
+            }
+            try:
+                if client.supports_streaming:
+                    return await self._send_streaming(agent_name, client, message_id, payload, remote_task)
+                return await self._send_blocking(agent_name, client, message_id, payload)
+            except RemoteAgentError as e:
+                # A busy rejection happens before the agent starts work, so resending is safe.
+                if not e.retryable or attempt == self.busy_retries:
+                    raise
+                delay = min(e.retry_after, self.max_busy_wait)
+                logger.warning(f"{e}; resending in {delay:.1f}s (attempt {attempt + 1}/{self.busy_retries})")
+                await asyncio.sleep(delay)
+
+    async def _send_blocking(self, agent_name: str, client: RemoteAgentConnections, message_id: str, payload: dict):
+        """Send with message/send and wait for the finished task."""
+        normalized_parts = payload["message"]["parts"]
         message_request = SendMessageRequest(
             id=message_id, params=MessageSendParams.model_validate(payload)
         )
@@ -324,53 +488,173 @@ class HostAgent:
             logger.info(f"Received response from {agent_name}")
         except asyncio.TimeoutError as e:
             logger.error(f"Timeout error when sending to {agent_name}: {e}")
-            return [{"type": "text", "text": f"Timeout error communicating with {agent_name}. The request may have been too large or the agent is busy."}]
+            raise RemoteAgentError(f"Timeout error communicating with {agent_name}. The request may have been too large or the agent is busy.") from e
         except Exception as e:
             logger.error(f"Error sending message to {agent_name}: {e}")
-            return [{"type": "text", "text": f"Error communicating with {agent_name}: {str(e)}"}]
+            raise RemoteAgentError(f"Error communicating with {agent_name}: {str(e)}") from e
 
+        if isinstance(send_response.root, JSONRPCErrorResponse):
+            logger.error(f"Received an error response from {agent_name}: {send_response.root.error}")
+            raise error_response_error(agent_name, send_response.root.error)
         if not isinstance(send_response.root, SendMessageSuccessResponse) or not isinstance(send_response.root.result, Task):
             logger.error("Received a non-success or non-task response")
-            return [{"type": "text", "text": "Received invalid response from remote agent"}]
-
-        response_content = send_response.root.model_dump_json(exclude_none=True)
-        json_content = json.loads(response_content)
-
-        resp = []
-        if json_content.get("result", {}).get("artifacts"):
-            for artifact in json_content["result"]["artifacts"]:
-                if artifact.get("parts"):
-                    resp.extend(artifact["parts"])
-        elif json_content.get("result", {}).get("text"):
-            resp.append({"type": "text", "text": json_content["result"]["text"]})
-        
+            raise RemoteAgentError("Received invalid response from remote agent")
+        status = send_response.root.result.status
+        if status.state in UNSUCCESSFUL_STATES:
+            raise RemoteAgentError(f"{agent_name} {status.state.value}: {_message_text(status.message) or 'no details'}")
+
+        resp = _reference_inline_files(extract_task_parts(send_response.root.result, self.max_response_chars))
         logger.info(f"Returning {len(resp)} response parts from {agent_name}")
         return resp
 
+    async def _send_streaming(self, agent_name: str, client: RemoteAgentConnections, message_id: str, payload: dict,
+                              remote_task: dict = None):
+        """Consume the remote agent's event stream, reporting progress and reassembling chunked artifacts.
+
+        Progress goes to the log and, inside HostAgent.stream, to the caller as "updates" events.
+        """
+        request = SendStreamingMessageRequest(id=message_id, params=MessageSendParams.model_validate(payload))
+        progress_sink = _progress_sink.get()
+        artifacts: dict[str, list[dict]] = {}
+        final_task = None
+        reply = None
+        try:
+            async for response in client.send_message_streaming(request):
+                if isinstance(response.root, JSONRPCErrorResponse):
+                    logger.error(f"Received an error event from {agent_name}: {response.root.error}")
+                    raise error_response_error(agent_name, response.root.error)
+                if not isinstance(response.root, SendStreamingMessageSuccessResponse):
+                    logger.error(f"Received an invalid event from {agent_name}: {response.root}")
+                    raise RemoteAgentError("Received invalid response from remote agent")
+                event = response.root.result
+                if remote_task is not None and not isinstance(event, Message):
+                    remote_task["task_id"] = event.id if isinstance(event, Task) else event.task_id
+                if isinstance(event, TaskStatusUpdateEvent):
+                    progress = _message_text(event.status.message)
+                    logger.info(f"[{agent_name}] {event.status.state.value}{': ' + progress if progress else ''}")
+                    if event.status.state in UNSUCCESSFUL_STATES:
+                        raise RemoteAgentError(f"{agent_name} {event.status.state.value}: {progress or 'no details'}")
+                    if progress and progress_sink is not None:
+                        progress_sink(agent_name, event.status.state.value, progress)
+                elif isinstance(event, TaskArtifactUpdateEvent):
+                    parts = part_views(event.artifact.parts)
+                    collected = artifacts.setdefault(event.artifact.artifact_id, [])
+                    # Appended text chunks continue the previous text part of the same artifact.
+                    if event.append and collected and parts and collected[-1].get("kind") == "text" \
+                            and parts[0].get("kind") == "text":
+                        collected[-1]["text"] += parts.pop(0)["text"]
+                    collected.extend(parts)
+                elif isinstance(event, Task):
+                    if event.status.state in UNSUCCESSFUL_STATES:
+                        raise RemoteAgentError(f"{agent_name} {event.status.state.value}: "
+                                               f"{_message_text(event.status.message) or 'no details'}")
+                    final_task = event
+                elif isinstance(event, Message):
+                    reply = event
+        except RemoteAgentError:
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming from {agent_name}: {e}")
+            raise RemoteAgentError(f"Error communicating with {agent_name}: {str(e)}") from e
+
+        resp = [part for parts in artifacts.values() for part in parts]
+        if not resp and final_task:
+            resp = extract_task_parts(final_task)
+        if not resp and reply:
+            resp = part_views(reply.parts)
+        resp = _reference_inline_files(limit_text(resp, self.max_response_chars))
+        logger.info(f"Returning {len(resp)} streamed response parts from {agent_name}")
+        return resp
+
+
+def _event_update(event) -> dict[str, Any]:
+    """HostAgent.stream item for one runner event."""
+    if not event.is_final_response():
+        return {"is_task_complete": False, "updates": "The host agent is thinking..."}
+    response_parts = []
+    if event.content and event.content.parts:
+        for p in event.content.parts:
+            if p.text:
+                response_parts.append({"type": "text", "text": p.text})
+            elif p.inline_data:
+                response_parts.append({"type": "file", "file": p.inline_data})
+    return {"is_task_complete": True, "content": response_parts}
+
+
+def _message_text(message: Message | None) -> str:
+    if not message:
+        return ""
+    return " ".join(part.root.text for part in message.parts if getattr(part.root, "text", None))
+
 
 # -------------------------------------------------------------------
 # Helper: build multimodal parts
 # -------------------------------------------------------------------
+INLINE_BYTES_LIMIT = int(os.getenv("HOST_INLINE_BYTES_LIMIT", str(64 * 1024)))
+
+
+def _offload_inline_bytes(file_info: dict) -> dict:
+    """Move inline file bytes above INLINE_BYTES_LIMIT into the blob store and reference them by uri.
+
+    Blocking; run it in a worker thread. If the blob store is unavailable the bytes stay inline.
+    """
+    data = file_info.get("bytes")
+    if data is None or len(data) <= INLINE_BYTES_LIMIT:
+        return file_info
+    try:
+        store = get_blob_store()
+        digest, size = store.put_bytes(base64.b64decode(data) if isinstance(data, str) else data)
+    except Exception as e:
+        logger.warning(f"Could not move {file_info.get('name')} to the blob store, sending it inline: {e}")
+        return file_info
+    logger.info(f"Moved {size} inline bytes of {file_info.get('name')} to blob {digest}")
+    file_info = {key: value for key, value in file_info.items() if key != "bytes"}
+    file_info["uri"] = store.url_for(digest, file_info.get("name") or digest)
+    return file_info
+
+
+def _reference_inline_files(parts: list[dict]) -> list[dict]:
+    """Give inline files returned by an agent deferred blob uris; a file is decoded and stored only if fetched.
+
+    Without a blob server the files keep only their metadata.
+    """
+    if any(isinstance(part, FilePartView) for part in parts):
+        try:
+            reference_files(parts, get_blob_store())
+        except Exception as e:
+            logger.warning(f"Could not reference returned files: {e}")
+    return parts
+
+
+def _store_file(file_path: str):
+    store = get_blob_store()
+    digest, size = store.put_file(file_path)
+    return store, digest, size
+
+
 def build_parts(text: str = None, file_path: str = None, file_uri: str = None, mime_type: str = None) -> list[dict]:
+    """Message parts for text, a local file or a file uri; blocks while a local file is stored."""
     parts = []
     if text:
         parts.append({"type": "text", "text": text})
     if file_path:
         try:
-            with open(file_path, "rb") as f:
-                content = base64.b64encode(f.read()).decode()
-            
+            # The file is streamed into the blob store and sent by reference, never inlined.
+            store, digest, size = _store_file(file_path)
+            name = os.path.basename(file_path)
+
             # Auto-detect mime type if not provided
             if not mime_type:
                 mime_type, _ = mimetypes.guess_type(file_path)
                 mime_type = mime_type or "application/octet-stream"
-            
+
+            logger.info(f"Stored {file_path} ({size} bytes) as blob {digest}")
             parts.append({
                 "type": "file",
                 "file": {
-                    "name": file_path.split("/")[-1], 
-                    "mimeType": mime_type, 
-                    "bytes": content
+                    "name": name,
+                    "mimeType": mime_type,
+                    "uri": store.url_for(digest, name)
                 }
             })
         except Exception as e:
@@ -393,6 +677,12 @@ def build_parts(text: str = None, file_path: str = None, file_uri: str = None, m
     return parts
 
 
+async def build_parts_async(text: str = None, file_path: str = None, file_uri: str = None,
+                            mime_type: str = None) -> list[dict]:
+    """build_parts for callers on the event loop: the file is stored in a worker thread."""
+    return await asyncio.to_thread(build_parts, text, file_path, file_uri, mime_type)
+
+
 # -------------------------------------------------------------------
 # Sync init
 # -------------------------------------------------------------------
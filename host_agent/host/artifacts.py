@@ -0,0 +1,81 @@
+import base64
+from typing import Any, Iterable, List
+
+from a2a.types import DataPart, FilePart, FileWithBytes, Part, Task, TextPart
+
+
+class FilePartView(dict):
+    """File part as a plain dict of its metadata; inline content is only decoded by content().
+
+    Inline bytes are left out of the dict, so neither the host nor the model it reports to copies
+    or serializes the base64 payload; reference_files() gives the part a uri that decodes them
+    with content() only when it is fetched.
+    """
+
+    def __init__(self, part: FilePart):
+        file = part.file
+        info = {"name": file.name, "mimeType": file.mime_type}
+        if isinstance(file, FileWithBytes):
+            info["size"] = len(file.bytes) * 3 // 4 - file.bytes[-2:].count("=")  # decoded size
+        else:
+            info["uri"] = file.uri
+        super().__init__(kind="file", file={key: value for key, value in info.items() if value is not None})
+        self._file = file
+
+    def content(self) -> bytes | None:
+        """The file's bytes for inline files; None for files sent by uri."""
+        if isinstance(self._file, FileWithBytes):
+            return base64.b64decode(self._file.bytes)
+        return None
+
+
+def reference_files(parts: List[dict[str, Any]], store) -> List[dict[str, Any]]:
+    """Point inline file parts at store.defer() URLs; nothing is decoded or written until one is fetched."""
+    for part in parts:
+        if isinstance(part, FilePartView) and "uri" not in part["file"]:
+            part["file"]["uri"] = store.defer(part.content, part["file"].get("name") or "")
+    return parts
+
+
+def part_view(part: Part) -> dict[str, Any]:
+    """Response dict for one part, built from the typed model without serializing it."""
+    root = part.root
+    if isinstance(root, TextPart):
+        view = {"kind": "text", "text": root.text}
+    elif isinstance(root, DataPart):
+        view = {"kind": "data", "data": root.data}
+    elif isinstance(root, FilePart):
+        view = FilePartView(root)
+    else:
+        return root.model_dump(mode="json", exclude_none=True)
+    if root.metadata is not None:
+        view["metadata"] = root.metadata
+    return view
+
+
+def part_views(parts: Iterable[Part]) -> List[dict[str, Any]]:
+    return [part_view(part) for part in parts]
+
+
+def limit_text(parts: List[dict[str, Any]], max_chars: int | None) -> List[dict[str, Any]]:
+    """Cut text parts once max_chars characters have been returned; None or 0 means no limit."""
+    if not max_chars:
+        return parts
+    limited, remaining = [], max_chars
+    for part in parts:
+        text = part.get("text") if part.get("kind") == "text" else None
+        if text is None:
+            limited.append(part)
+        elif len(text) <= remaining:
+            limited.append(part)
+            remaining -= len(text)
+        else:
+            limited.append({**part, "text": f"{text[:remaining]}\n[... truncated {len(text) - remaining} characters]"})
+            remaining = 0
+    return limited
+
+
+def extract_task_parts(task: Task, max_chars: int | None = None) -> List[dict[str, Any]]:
+    """All artifact parts of a task, in order, optionally limited to max_chars of text."""
+    parts = [part_view(part) for artifact in task.artifacts or () for part in artifact.parts]
+    return limit_text(parts, max_chars)
@@ -0,0 +1,282 @@
+import os
+import re
+import json
+import hmac
+import shutil
+import hashlib
+import secrets
+import logging
+import tempfile
+import threading
+import ipaddress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class UploadTooLarge(ValueError):
+    """An upload body exceeds the store's max_upload_bytes."""
+
+
+class BlobStore:
+    """Content-addressed file store: blobs are named by their SHA-256 and written once.
+
+    Files are streamed through in CHUNK_SIZE blocks, so storing or serving a blob never holds it in
+    memory. Agents fetch blobs over HTTP from the server started by serve(), whose uploads are
+    limited to max_upload_bytes (None for no limit). Uploads must carry upload_token as a bearer
+    token; without one, only clients on the loopback interface may upload.
+
+    defer() hands out URLs for content that is produced and stored only when first fetched; the
+    max_deferred most recent ones are kept until then.
+    """
+
+    def __init__(self, root_dir: str = "./blobs", max_upload_bytes: int = None, upload_token: str = None,
+                 max_deferred: int = 64):
+        self.root_dir = os.path.abspath(root_dir)
+        self.max_upload_bytes = max_upload_bytes
+        self.upload_token = upload_token
+        self.max_deferred = max_deferred
+        self._deferred = OrderedDict()
+        self._resolved = {}
+        self._deferred_lock = threading.Lock()
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.base_url = None
+        self._server = None
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.root_dir, digest[:2], digest)
+
+    def exists(self, digest: str) -> bool:
+        return bool(DIGEST_RE.match(digest)) and os.path.exists(self.path(digest))
+
+    def put_stream(self, chunks: Iterator[bytes]) -> Tuple[str, int]:
+        """Store a stream of chunks; returns (digest, size)."""
+        digest, size = hashlib.sha256(), 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            final_path = self.path(digest.hexdigest())
+            if os.path.exists(final_path):
+                os.unlink(tmp_path)  # same content is already stored
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest.hexdigest(), size
+
+    def put_file(self, file_path: str) -> Tuple[str, int]:
+        with open(file_path, "rb") as f:
+            return self.put_stream(iter(lambda: f.read(CHUNK_SIZE), b""))
+
+    def put_bytes(self, data: bytes) -> Tuple[str, int]:
+        return self.put_stream(iter([data]))
+
+    def open(self, digest: str) -> BinaryIO:
+        return open(self.path(digest), "rb")
+
+    def url_for(self, digest: str, name: str) -> str:
+        """Download URL; the file name is kept as the last path segment so receivers know its type."""
+        if self.base_url is None:
+            raise RuntimeError("Blob server is not running")
+        return f"{self.base_url}/blobs/{digest}/{quote(os.path.basename(name) or digest)}"
+
+    def defer(self, loader: Callable[[], bytes], name: str) -> str:
+        """Download URL for the bytes loader() returns; they are stored on the URL's first fetch."""
+        if self.base_url is None:
+            raise RuntimeError("Blob server is not running")
+        token = secrets.token_urlsafe(16)
+        with self._deferred_lock:
+            self._deferred[token] = loader
+            while len(self._deferred) > self.max_deferred:
+                self._deferred.popitem(last=False)
+        return f"{self.base_url}/blobs/deferred/{token}/{quote(os.path.basename(name) or token)}"
+
+    def resolve_deferred(self, token: str) -> Optional[str]:
+        """Digest of a deferred blob, storing it on first use; None for unknown or expired tokens."""
+        with self._deferred_lock:
+            digest = self._resolved.get(token)
+            loader = self._deferred.get(token) if digest is None else None
+        if loader is None:
+            return digest
+        digest, _ = self.put_bytes(loader())
+        with self._deferred_lock:
+            self._resolved[token] = digest
+            self._deferred.pop(token, None)
+        return digest
+
+    # --- HTTP server ---
+    def serve(self, host: str = "localhost", port: int = 10010):
+        """Serve GET/HEAD /blobs/<digest>[/<name>] and /blobs/deferred/<token>[/<name>], and streaming
+        PUT /blobs uploads, in a background thread."""
+        if self._server is not None:
+            return
+        self._server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self._server.daemon_threads = True
+        self.base_url = f"http://{host}:{self._server.server_port}"
+        threading.Thread(target=self._server.serve_forever, name="blob-store", daemon=True).start()
+        logger.info(f"[BlobStore] Serving {self.root_dir} at {self.base_url}")
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _read_chunked(rfile: BinaryIO, limit: int = None) -> Iterator[bytes]:
+    """Decode a Transfer-Encoding: chunked request body, raising UploadTooLarge past limit bytes."""
+    total = 0
+    while True:
+        size = int(rfile.readline().split(b";", 1)[0].strip() or b"0", 16)
+        if size == 0:
+            while rfile.readline() not in (b"\r\n", b"\n", b""):
+                pass  # trailers
+            return
+        total += size
+        if limit is not None and total > limit:
+            raise UploadTooLarge(f"Upload exceeds {limit} bytes")
+        remaining = size
+        while remaining:
+            chunk = rfile.read(min(remaining, CHUNK_SIZE))
+            if not chunk:
+                raise ConnectionError("Upload ended early")
+            remaining -= len(chunk)
+            yield chunk
+        rfile.readline()
+
+
+def _read_sized(rfile: BinaryIO, length: int) -> Iterator[bytes]:
+    while length:
+        chunk = rfile.read(min(length, CHUNK_SIZE))
+        if not chunk:
+            raise ConnectionError("Upload ended early")
+        length -= len(chunk)
+        yield chunk
+
+
+def _handler_for(store: BlobStore):
+    class BlobRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _digest(self):
+            segments = self.path.split("?", 1)[0].strip("/").split("/")
+            if len(segments) >= 3 and segments[:2] == ["blobs", "deferred"]:
+                try:
+                    return store.resolve_deferred(segments[2])
+                except Exception as e:
+                    logger.error(f"[BlobStore] Could not store deferred blob {segments[2]}: {e}")
+                    return None
+            if len(segments) >= 2 and segments[0] == "blobs" and store.exists(segments[1]):
+                return segments[1]
+            return None
+
+        def _send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_HEAD(self, send_body: bool = False):
+            digest = self._digest()
+            if digest is None:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.path.getsize(store.path(digest))))
+            # Content never changes for a digest.
+            self.send_header("ETag", f'"{digest}"')
+            self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+            self.end_headers()
+            if send_body:
+                with store.open(digest) as f:
+                    shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+        def do_GET(self):
+            self.do_HEAD(send_body=True)
+
+        def _upload_allowed(self) -> bool:
+            if store.upload_token:
+                expected = f"Bearer {store.upload_token}"
+                return hmac.compare_digest(self.headers.get("Authorization", "").encode(), expected.encode())
+            return ipaddress.ip_address(self.client_address[0]).is_loopback
+
+        def do_PUT(self):
+            if self.path.split("?", 1)[0].rstrip("/") != "/blobs":
+                self._send_json(404, {"error": "not found"})
+                return
+            if not self._upload_allowed():
+                self.close_connection = True  # the body is left unread
+                self._send_json(401 if store.upload_token else 403, {"error": "upload not authorized"})
+                return
+            if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                chunks = _read_chunked(self.rfile, store.max_upload_bytes)
+            else:
+                try:
+                    length = int(self.headers.get("Content-Length", "0"))
+                except ValueError:
+                    self.close_connection = True
+                    self._send_json(400, {"error": "invalid Content-Length"})
+                    return
+                if store.max_upload_bytes is not None and length > store.max_upload_bytes:
+                    self.close_connection = True  # the body is left unread
+                    self._send_json(413, {"error": f"upload exceeds {store.max_upload_bytes} bytes"})
+                    return
+                chunks = _read_sized(self.rfile, length)
+            try:
+                digest, size = store.put_stream(chunks)
+            except UploadTooLarge as e:
+                self.close_connection = True
+                self._send_json(413, {"error": str(e)})
+                return
+            except (ConnectionError, ValueError) as e:
+                self.close_connection = True
+                self._send_json(400, {"error": str(e)})
+                return
+            name = self.headers.get("X-File-Name", digest)
+            self._send_json(201, {"digest": digest, "size": size, "uri": store.url_for(digest, name)})
+
+        do_POST = do_PUT
+
+        def log_message(self, format, *args):
+            logger.debug(f"[BlobStore] {self.address_string()} {format % args}")
+
+    return BlobRequestHandler
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """The host's blob store, served on HOST_BLOB_HOST:HOST_BLOB_PORT from HOST_BLOB_DIR.
+
+    HOST_BLOB_UPLOAD_TOKEN lets remote clients upload; otherwise only local ones can.
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = BlobStore(os.getenv("HOST_BLOB_DIR", "./blobs"),
+                              max_upload_bytes=int(os.getenv("HOST_BLOB_MAX_UPLOAD_BYTES", str(2 * 1024 ** 3))),
+                              upload_token=os.getenv("HOST_BLOB_UPLOAD_TOKEN") or None,
+                              max_deferred=int(os.getenv("HOST_BLOB_MAX_DEFERRED", "64")))
+            store.serve(os.getenv("HOST_BLOB_HOST", "localhost"), int(os.getenv("HOST_BLOB_PORT", "10010")))
+            _store = store  # only once serving, so a failed start is retried by the next call
+        return _store
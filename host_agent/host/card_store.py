@@ -0,0 +1,97 @@
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List
+
+import httpx
+from a2a.types import AgentCard
+from a2a.utils.constants import AGENT_CARD_WELL_KNOWN_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class CachedCard:
+    """Last card fetched from one address, with what is needed to revalidate it."""
+
+    def __init__(self, card: AgentCard, etag: str | None, digest: str):
+        self.card = card
+        self.etag = etag
+        self.digest = digest
+        self.fetched_at = time.monotonic()
+
+
+class AgentCardStore:
+    """Agent cards by address, fetched concurrently and revalidated once their TTL expires.
+
+    Revalidation sends If-None-Match when the agent returned an ETag; otherwise a changed card is
+    detected by its content digest. An address that fails max_failures revalidations in a row is
+    dropped until it answers again.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, ttl: float = 60.0, timeout: float = 5.0, max_failures: int = 2):
+        self.client = client
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_failures = max_failures
+        self.fetches = 0
+        self.not_modified = 0
+        self._cards: Dict[str, CachedCard] = {}
+        self._failures: Dict[str, int] = {}
+
+    async def _fetch(self, address: str) -> CachedCard:
+        cached = self._cards.get(address)
+        headers = {"If-None-Match": cached.etag} if cached and cached.etag else {}
+        self.fetches += 1
+        response = await self.client.get(f"{address.rstrip('/')}/{AGENT_CARD_WELL_KNOWN_PATH.lstrip('/')}",
+                                         headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            self.not_modified += 1
+            cached.fetched_at = time.monotonic()
+            return cached
+        response.raise_for_status()
+        digest = hashlib.sha256(response.content).hexdigest()
+        if cached and cached.digest == digest:
+            cached.fetched_at = time.monotonic()
+            return cached
+        return CachedCard(AgentCard.model_validate_json(response.content), response.headers.get("ETag"), digest)
+
+    async def resolve(self, address: str, force: bool = False) -> CachedCard | None:
+        """Card for one address; cached while fresh, revalidated within the per-address deadline."""
+        cached = self._cards.get(address)
+        if cached and not force and time.monotonic() - cached.fetched_at < self.ttl:
+            return cached
+        try:
+            entry = await asyncio.wait_for(self._fetch(address), self.timeout)
+        except Exception as e:
+            failures = self._failures[address] = self._failures.get(address, 0) + 1
+            if cached and failures >= self.max_failures:
+                logger.warning(f"[AgentCardStore] Dropping {address} after {failures} failed refreshes: {e!r}")
+                del self._cards[address]
+            elif not cached:
+                logger.error(f"[AgentCardStore] Could not get agent card from {address}: {e!r}")
+            return self._cards.get(address)
+        if address in self._failures:
+            logger.info(f"[AgentCardStore] {address} is reachable again")
+            del self._failures[address]
+        self._cards[address] = entry
+        return entry
+
+    async def resolve_all(self, addresses: List[str], force: bool = False) -> Dict[str, CachedCard]:
+        """Resolve every address concurrently; one slow or down agent only costs its own deadline."""
+        entries = await asyncio.gather(*(self.resolve(address, force) for address in addresses))
+        return {address: entry for address, entry in zip(addresses, entries) if entry is not None}
+
+    def stats(self) -> Dict[str, int]:
+        return {'cards': len(self._cards), 'fetches': self.fetches, 'not_modified': self.not_modified,
+                'failing': len(self._failures)}
+
+
+def create_card_store(client: httpx.AsyncClient) -> AgentCardStore:
+    return AgentCardStore(
+        client,
+        ttl=float(os.getenv("HOST_CARD_TTL", "60")),
+        timeout=float(os.getenv("HOST_CARD_TIMEOUT", "5")),
+        max_failures=int(os.getenv("HOST_CARD_MAX_FAILURES", "2")),
+    )
@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+SendFunc = Callable[[str, List[dict]], Awaitable[List[dict]]]
+
+# Run ids name checkpoint files, so they may not contain path separators or dots.
+RUN_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+class PipelineError(Exception):
+    """Raised for an invalid pipeline definition."""
+
+
+class Stage:
+    """One agent call in a pipeline; its input is the project input plus the outputs of its dependencies."""
+
+    def __init__(self, name: str, agent_name: str, instruction: str, depends_on: List[str] = ()):
+        self.name = name
+        self.agent_name = agent_name
+        self.instruction = instruction
+        self.depends_on = list(depends_on)
+
+    def build_parts(self, project_input: str, upstream: Dict[str, str]) -> List[dict]:
+        sections = [self.instruction, f"## Project input\n{project_input}"]
+        for name in self.depends_on:
+            sections.append(f"## {name.replace('_', ' ').title()} output\n{upstream[name]}")
+        return [{"type": "text", "text": "\n\n".join(sections)}]
+
+
+def parts_text(parts: List[dict]) -> str:
+    return "\n".join(part["text"] for part in parts if part.get("text"))
+
+
+class Pipeline:
+    """DAG of stages run with maximum parallelism and checkpointed after every stage.
+
+    A stage starts as soon as all of its dependencies have completed. Each completed stage is written
+    to the run's JSON checkpoint, so running the same run_id again resumes after the last completed
+    stages instead of repeating them. When a stage fails, the stages still running are cancelled and
+    no new ones start; resuming the run picks up everything that did not complete.
+    """
+
+    def __init__(self, stages: List[Stage], checkpoint_dir: str = "./pipeline_runs"):
+        self.stages = {stage.name: stage for stage in stages}
+        self.checkpoint_dir = checkpoint_dir
+        for stage in stages:
+            unknown = set(stage.depends_on) - self.stages.keys()
+            if unknown:
+                raise PipelineError(f"Stage '{stage.name}' depends on unknown stages {sorted(unknown)}")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        done, visiting = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise PipelineError(f"Pipeline has a cycle through '{name}'")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def checkpoint_path(self, run_id: str) -> str:
+        if not RUN_ID_RE.match(run_id):
+            raise PipelineError(f"Invalid run id {run_id!r}: use letters, digits, '_' and '-'")
+        return os.path.join(self.checkpoint_dir, f"{run_id}.json")
+
+    def load_checkpoint(self, run_id: str) -> Dict[str, Any] | None:
+        try:
+            with open(self.checkpoint_path(run_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_checkpoint(self, state: Dict[str, Any]):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = self.checkpoint_path(state["run_id"])
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)  # a crash mid-write keeps the previous checkpoint
+
+    async def run(self, send: SendFunc, project_input: str = "", run_id: str = None) -> Dict[str, Any]:
+        """Run (or resume) the pipeline; returns the run state with every stage's status and output."""
+        state = self.load_checkpoint(run_id) if run_id else None
+        if state is None:
+            state = {"run_id": run_id or uuid.uuid4().hex, "input": project_input, "stages": {}}
+        else:
+            if project_input and project_input != state["input"]:
+                logger.warning(f"[Pipeline] Run {run_id} resumes with its original input; the new input is ignored")
+            logger.info(f"[Pipeline] Resuming run {run_id}; completed stages: "
+                        f"{[n for n, s in state['stages'].items() if s['status'] == 'completed']}")
+
+        results = state["stages"]
+        for name in [name for name, result in results.items() if result["status"] != "completed"]:
+            del results[name]  # every stage that did not complete runs again
+        completed = set(results)
+        blocked = set()
+        failed = False
+        running: Dict[asyncio.Task, str] = {}
+        started = time.perf_counter()
+
+        def start_ready():
+            for name, stage in self.stages.items():
+                if name in completed or name in blocked or name in running.values():
+                    continue
+                if any(dependency in blocked for dependency in stage.depends_on):
+                    blocked.add(name)
+                    results[name] = {"status": "blocked", "output": None, "seconds": None}
+                    continue
+                if all(dependency in completed for dependency in stage.depends_on):
+                    upstream = {dependency: results[dependency]["output"] for dependency in stage.depends_on}
+                    logger.info(f"[Pipeline] Starting stage '{name}' ({stage.agent_name})")
+                    task = asyncio.ensure_future(self._run_stage(send, stage, state["input"], upstream))
+                    running[task] = name
+
+        start_ready()
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                try:
+                    output, seconds = task.result()
+                    results[name] = {"status": "completed", "output": output, "seconds": seconds}
+                    completed.add(name)
+                    logger.info(f"[Pipeline] Stage '{name}' completed in {seconds}s")
+                except Exception as e:
+                    results[name] = {"status": "failed", "output": None, "seconds": None, "error": str(e)}
+                    blocked.add(name)
+                    failed = True
+                    logger.error(f"[Pipeline] Stage '{name}' failed: {e}")
+            if failed and running:
+                await self._cancel_running(running, results, completed)
+            await asyncio.to_thread(self._save_checkpoint, state)
+            if not failed:
+                start_ready()
+
+        for name in self.stages:
+            results.setdefault(name, {"status": "blocked", "output": None, "seconds": None})
+        state["seconds"] = round(time.perf_counter() - started, 3)
+        state["status"] = "completed" if len(completed) == len(self.stages) else "failed"
+        await asyncio.to_thread(self._save_checkpoint, state)
+        return state
+
+    async def _cancel_running(self, running: Dict[asyncio.Task, str], results: Dict[str, Any], completed: set):
+        """Cancel the stages still running after a failure; one that finished meanwhile is kept."""
+        tasks = list(running)
+        for task in tasks:
+            task.cancel()
+        outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        for task, outcome in zip(tasks, outcomes):
+            name = running.pop(task)
+            if isinstance(outcome, tuple):
+                output, seconds = outcome
+                results[name] = {"status": "completed", "output": output, "seconds": seconds}
+                completed.add(name)
+            else:
+                results[name] = {"status": "cancelled", "output": None, "seconds": None}
+                logger.warning(f"[Pipeline] Cancelled stage '{name}' after a failure")
+
+    async def _run_stage(self, send: SendFunc, stage: Stage, project_input: str, upstream: Dict[str, str]):
+        started = time.perf_counter()
+        parts = await send(stage.agent_name, stage.build_parts(project_input, upstream))
+        output = parts_text(parts)
+        if not output:
+            raise RuntimeError(f"{stage.agent_name} returned no text output")
+        return output, round(time.perf_counter() - started, 3)
+
+
+# Agent names are the names on the agents' cards.
+BRD_TO_SPRINT_PLAN = [
+    Stage("stakeholder", "Stakeholder Requirements Agent",
+          "Analyze the project input and produce the project vision document."),
+    Stage("market_analysis", "Market Analyst Agent",
+          "Produce a market analysis report for the project described in the vision document.",
+          depends_on=["stakeholder"]),
+    Stage("domain_review", "Business Analyst Domain Expert Agent",
+          "Review the vision document against domain standards and regulations and list the resulting "
+          "requirements.",
+          depends_on=["stakeholder"]),
+    Stage("business_requirements", "Business Analyst Agent",
+          "Write the business requirements document and user stories from the vision document, the market "
+          "analysis and the domain review.",
+          depends_on=["stakeholder", "market_analysis", "domain_review"]),
+    Stage("product_roadmap", "Product Manager Agent",
+          "Create the product roadmap from the business requirements and the market analysis.",
+          depends_on=["business_requirements", "market_analysis"]),
+    Stage("sprint_plan", "Agile Project Manager Agent",
+          "Plan the first sprint from the product roadmap and the business requirements.",
+          depends_on=["product_roadmap", "business_requirements"]),
+]
+
+
+def create_pipeline() -> Pipeline:
+    return Pipeline(BRD_TO_SPRINT_PLAN, checkpoint_dir=os.getenv("HOST_PIPELINE_DIR", "./pipeline_runs"))
@@ -1,29 +1,291 @@
+import os
+import time
+import uuid
+import random
+import asyncio
+import atexit
+import logging
+import importlib.util
+from weakref import WeakKeyDictionary
+from collections import deque
+from typing import Any, AsyncIterable, Callable, Dict
+
 import httpx
 from a2a.client import A2AClient
 from a2a.types import (
     AgentCard,
+    CancelTaskRequest,
+    JSONRPCErrorResponse,
     SendMessageRequest,
     SendMessageResponse,
+    SendStreamingMessageRequest,
+    SendStreamingMessageResponse,
     Task,
     TaskArtifactUpdateEvent,
+    TaskIdParams,
     TaskStatusUpdateEvent,
 )
 from dotenv import load_dotenv
-from typing import Callable
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 TaskCallbackArg = Task | TaskStatusUpdateEvent | TaskArtifactUpdateEvent
 TaskUpdateCallback = Callable[[TaskCallbackArg, AgentCard], Task]
 
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUS_CODES = {502, 503, 504}
+# Errors raised before the request reached the server; any method can be retried after these.
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+TRANSIENT_ERRORS = NOT_SENT_ERRORS + (httpx.ReadError, httpx.RemoteProtocolError)
+
+
+class RemoteAgentError(Exception):
+    """A remote agent could not be reached or did not complete the task.
+
+    retry_after is set when the agent turned the task away because it was at capacity; the request
+    did not start and can be sent again after that many seconds.
+    """
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.retry_after is not None
+
+
+def error_response_error(agent_name: str, error) -> RemoteAgentError:
+    """RemoteAgentError for a JSON-RPC error response, retryable for a busy rejection.
+
+    Crew agents at capacity answer with an InternalError whose data is
+    {"reason": "busy", "retry_after": seconds}.
+    """
+    data = getattr(error, "data", None)
+    if isinstance(data, dict) and data.get("reason") == "busy":
+        retry_after = float(data.get("retry_after") or 1.0)
+        return RemoteAgentError(f"{agent_name} is busy, retry in {retry_after:.1f}s", retry_after=retry_after)
+    return RemoteAgentError(f"{agent_name} returned an error: {getattr(error, 'message', None) or error}")
+
+
+def _percentile(samples, fraction: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that frees the per-host slot once the body is closed, so streams hold their slot."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+class PooledTransport(httpx.AsyncBaseTransport):
+    """Keep-alive connection pool shared by all remote agents.
+
+    Adds a per-host connection limit, retries with jittered exponential backoff and pool metrics
+    on top of httpx's transport. Idempotent requests are retried on transient errors and 502/503/504;
+    other requests (A2A's JSON-RPC POSTs) only when they never reached the server.
+
+    Connections belong to the event loop that opened them, and the host resolves cards in a
+    short-lived loop before ADK runs the tools in its own, so each loop gets its own pool.
+    """
+
+    def __init__(self, limits: httpx.Limits, max_per_host: int = 10, http2: bool = False,
+                 retries: int = 3, backoff: float = 0.25, max_backoff: float = 5.0, sample_size: int = 1000):
+        self.limits = limits
+        self.max_per_host = max_per_host
+        self.http2 = http2
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.requests = 0
+        self.in_flight = 0
+        self.retried = 0
+        self.failed = 0
+        self.wait_ms = deque(maxlen=sample_size)
+        self._pools = WeakKeyDictionary()  # event loop -> (transport, per-host semaphores)
+
+    def _pool(self):
+        loop = asyncio.get_running_loop()
+        pool = self._pools.get(loop)
+        if pool is None:
+            pool = self._pools[loop] = (httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2), {})
+        return pool
+
+    def _delay(self, attempt: int) -> float:
+        # Full jitter: a random point in the exponential window, so retrying callers spread out.
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _retryable(self, request: httpx.Request, error: Exception = None, status: int = None) -> bool:
+        if request.method in IDEMPOTENT_METHODS:
+            return isinstance(error, TRANSIENT_ERRORS) or status in RETRY_STATUS_CODES
+        return isinstance(error, NOT_SENT_ERRORS)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        attempt = 0
+        while True:
+            try:
+                response = await self._send_once(request)
+            except Exception as e:
+                if attempt >= self.retries or not self._retryable(request, error=e):
+                    self.failed += 1
+                    raise
+                logger.warning(f"[PooledTransport] {request.method} {request.url} failed ({e!r}), retrying")
+            else:
+                if attempt >= self.retries or not self._retryable(request, status=response.status_code):
+                    return response
+                await response.aclose()
+                logger.warning(f"[PooledTransport] {request.method} {request.url} returned "
+                               f"{response.status_code}, retrying")
+            self.retried += 1
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def _send_once(self, request: httpx.Request) -> httpx.Response:
+        transport, host_slots = self._pool()
+        host = f"{request.url.host}:{request.url.port}"
+        slots = host_slots.get(host)
+        if slots is None:
+            slots = host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        queued = time.perf_counter()
+        waited = False
+
+        async def trace(event: str, info: Dict[str, Any]):
+            # The first connection-level event marks the end of the wait for a pooled connection.
+            nonlocal waited
+            if not waited and event.endswith(("connect_tcp.started", "send_request_headers.started")):
+                waited = True
+                self.wait_ms.append((time.perf_counter() - queued) * 1000)
+
+        # Waiting for a per-host slot counts against the client's pool timeout, like httpx's own pool.
+        pool_timeout = request.extensions.get("timeout", {}).get("pool")
+        try:
+            await asyncio.wait_for(slots.acquire(), pool_timeout)
+        except asyncio.TimeoutError:
+            raise httpx.PoolTimeout(f"No connection slot for {host} within {pool_timeout}s", request=request) from None
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight -= 1
+                slots.release()
+
+        self.in_flight += 1
+        request.extensions["trace"] = trace
+        try:
+            response = await transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        connections = [connection for transport, _ in list(self._pools.values())
+                       for connection in getattr(getattr(transport, "_pool", None), "connections", [])]
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {
+            'http2': self.http2,
+            'active': len(connections) - idle,
+            'idle': idle,
+            'in_flight': self.in_flight,
+            'requests': self.requests,
+            'retried': self.retried,
+            'failed': self.failed,
+            'wait_ms': {'p50': _percentile(list(self.wait_ms), 0.5), 'p95': _percentile(list(self.wait_ms), 0.95)},
+        }
+
+    async def aclose(self):
+        pool = self._pools.pop(asyncio.get_running_loop(), None)
+        if pool is not None:
+            await pool[0].aclose()
+        # Pools of loops that have already closed cannot be closed cleanly; drop their connections.
+        self._pools.clear()
+
+
+_shared_client: httpx.AsyncClient | None = None
+
+
+def _http2_available() -> bool:
+    # HTTP/2 is negotiated over TLS; plain http:// agents keep using HTTP/1.1 keep-alive connections.
+    return os.getenv("A2A_HTTP2", "1") == "1" and importlib.util.find_spec("h2") is not None
+
+
+def get_shared_client() -> httpx.AsyncClient:
+    """The process-wide A2A HTTP client; every RemoteAgentConnections uses its connection pool."""
+    global _shared_client
+    if _shared_client is None or _shared_client.is_closed:
+        transport = PooledTransport(
+            limits=httpx.Limits(
+                max_connections=int(os.getenv("A2A_MAX_CONNECTIONS", "100")),
+                max_keepalive_connections=int(os.getenv("A2A_MAX_KEEPALIVE", "20")),
+                keepalive_expiry=float(os.getenv("A2A_KEEPALIVE_EXPIRY", "60")),
+            ),
+            max_per_host=int(os.getenv("A2A_MAX_CONNECTIONS_PER_HOST", "10")),
+            http2=_http2_available(),
+            retries=int(os.getenv("A2A_RETRIES", "3")),
+        )
+        # Crew runs take minutes, so reads get a long timeout while connecting fails fast.
+        timeout = httpx.Timeout(
+            connect=float(os.getenv("A2A_CONNECT_TIMEOUT", "5")),
+            read=float(os.getenv("A2A_READ_TIMEOUT", "600")),
+            write=float(os.getenv("A2A_WRITE_TIMEOUT", "120")),
+            pool=float(os.getenv("A2A_POOL_TIMEOUT", "30")),
+        )
+        _shared_client = httpx.AsyncClient(transport=transport, timeout=timeout)
+    return _shared_client
+
+
+def connection_pool_stats() -> Dict[str, Any]:
+    if _shared_client is None:
+        return {}
+    return _shared_client._transport.stats()
+
+
+async def close_shared_client():
+    global _shared_client
+    client, _shared_client = _shared_client, None
+    if client is not None and not client.is_closed:
+        await client.aclose()
+
+
+def _close_at_exit():
+    if _shared_client is None or _shared_client.is_closed:
+        return
+    try:
+        asyncio.run(close_shared_client())
+    except Exception as e:
+        logger.warning(f"Error closing the A2A connection pool: {e}")
+
+
+atexit.register(_close_at_exit)
+
 
 class RemoteAgentConnections:
     """A class to hold the connections to the remote agents."""
 
     def __init__(self, agent_card: AgentCard, agent_url: str):
-        print(f"agent_card: {agent_card}")
-        print(f"agent_url: {agent_url}")
-        self._httpx_client = httpx.AsyncClient(timeout=120)
+        logger.info(f"Initializing connection - Agent: {agent_card.name}, URL: {agent_url}")
+        self._httpx_client = get_shared_client()
         self.agent_client = A2AClient(self._httpx_client, agent_card, url=agent_url)
         self.card = agent_card
         self.conversation_name = None
@@ -33,8 +295,37 @@ class RemoteAgentConnections:
     def get_agent(self) -> AgentCard:
         return self.card
 
+    @property
+    def supports_streaming(self) -> bool:
+        return bool(self.card.capabilities and self.card.capabilities.streaming)
+
     async def send_message(
         self, message_request: SendMessageRequest
     ) -> SendMessageResponse:
         """Send a message to the remote agent (task is created automatically)."""
-        return await self.agent_client.send_message(message_request)
+        try:
+            logger.info(f"Sending message to {self.card.name}")
+            response = await self.agent_client.send_message(message_request)
+            logger.info(f"Received response from {self.card.name}")
+            return response
+        except Exception as e:
+            logger.error(f"Error sending message to {self.card.name}: {e}")
+            raise
+
+    async def send_message_streaming(
+        self, message_request: SendStreamingMessageRequest
+    ) -> AsyncIterable[SendStreamingMessageResponse]:
+        """Send a message and yield task status and artifact events as the remote agent produces them."""
+        logger.info(f"Streaming message to {self.card.name}")
+        async for response in self.agent_client.send_message_streaming(message_request):
+            yield response
+
+    async def cancel_task(self, task_id: str) -> bool:
+        """Ask the remote agent to cancel a task; its crew stops at the next step. Returns whether it accepted."""
+        request = CancelTaskRequest(id=str(uuid.uuid4()), params=TaskIdParams(id=task_id))
+        response = await self.agent_client.cancel_task(request)
+        if isinstance(response.root, JSONRPCErrorResponse):
+            logger.warning(f"{self.card.name} did not cancel task {task_id}: {response.root.error.message}")
+            return False
+        logger.info(f"Cancelled task {task_id} on {self.card.name}")
+        return True